@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Benchmark MIDI-CC dispatching
+#
+# Times zynthian_gui_layer.midi_control_change, dispatching through the
+# (chan, cc) => layers map, against the previous implementations:
+#  - controllers scan: every layer scans all its controllers for each CC
+#  - layers fan-out: every layer looks up its own (chan, cc) => zctrls map
+# 16 layers, 12 of them with 300 controllers (12 mapped to CCs) and 4 with
+# MIDI-learned controllers, plus the mixer.
+#
+#   python3 tools/bench_cc_dispatch.py [number of CC events]
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import sys
+import random
+from time import perf_counter
+
+from bench_utils import load_gui_layer
+
+zynthian_gui_layer, zynthian_layer, zynthian_gui_config = load_gui_layer()
+
+#------------------------------------------------------------------------------
+# Mock engine & controllers
+#------------------------------------------------------------------------------
+
+class mock_zctrl:
+	def __init__(self, midi_cc):
+		self.midi_cc = midi_cc
+
+
+class mock_engine:
+	def __init__(self):
+		self.learned = {}
+		self.hits = 0
+
+	def midi_zctrl_change(self, zctrl, val):
+		self.hits += 1
+
+	def midi_control_change(self, chan, ccnum, val):
+		if (chan, ccnum) in self.learned:
+			self.hits += 1
+
+	def get_midi_control_keys(self):
+		return list(self.learned.keys())
+
+
+def create_layer(chan, listen_midi_cc, n_ctrls=300):
+	layer = zynthian_layer.__new__(zynthian_layer)
+	layer.zyngui = None
+	layer.engine = mock_engine()
+	layer.midi_chan = chan
+	layer.listen_midi_cc = listen_midi_cc
+	if listen_midi_cc:
+		layer.controllers_dict = { i: mock_zctrl(i if i<12 else None) for i in range(n_ctrls) }
+	else:
+		layer.controllers_dict = {}
+		layer.engine.learned = { (chan, 20+i): mock_zctrl(None) for i in range(4) }
+	layer.refresh_ctrl_cc_map()
+	return layer
+
+#------------------------------------------------------------------------------
+# Previous implementations
+#------------------------------------------------------------------------------
+
+def controllers_scan(gui_layer, chan, ccnum, val):
+	for layer in gui_layer.layers + [gui_layer.amixer_layer]:
+		if layer.listen_midi_cc:
+			if chan==layer.midi_chan:
+				for zctrl in layer.controllers_dict.values():
+					if zctrl.midi_cc==ccnum:
+						layer.engine.midi_zctrl_change(zctrl, val)
+		else:
+			layer.engine.midi_control_change(chan, ccnum, val)
+
+
+def layers_fanout(gui_layer, chan, ccnum, val):
+	for layer in gui_layer.layers + [gui_layer.amixer_layer]:
+		layer.midi_control_change(chan, ccnum, val)
+
+#------------------------------------------------------------------------------
+
+n = int(sys.argv[1]) if len(sys.argv)>1 else 100000
+
+gui_layer = zynthian_gui_layer.__new__(zynthian_gui_layer)
+gui_layer.ctrl_cc_serial = 0
+gui_layer.layers = [create_layer(chan, chan<12) for chan in range(16)]
+gui_layer.amixer_layer = create_layer(None, False)
+gui_layer.amixer_layer.engine.learned = { (0, 7): mock_zctrl(None) }
+gui_layer.invalidate_ctrl_cc_map()
+
+random.seed(1)
+events = [(random.randrange(16), random.choice((1, 1, 1, 7, 11, 20, 64, 74)), random.randrange(128)) for i in range(n)]
+
+tests = [
+	("controllers scan", lambda chan, ccnum, val: controllers_scan(gui_layer, chan, ccnum, val)),
+	("layers fan-out", lambda chan, ccnum, val: layers_fanout(gui_layer, chan, ccnum, val)),
+	("(chan, cc) map", gui_layer.midi_control_change)
+]
+
+for name, dispatch in tests:
+	for layer in gui_layer.layers + [gui_layer.amixer_layer]:
+		layer.engine.hits = 0
+	ts = perf_counter()
+	for event in events:
+		dispatch(*event)
+	dt = perf_counter() - ts
+	hits = sum(layer.engine.hits for layer in gui_layer.layers + [gui_layer.amixer_layer])
+	print("{}: {} CC => {:.1f} ms, {:.2f} us/CC, {} controller changes".format(name, n, 1000*dt, 1e6*dt/n, hits))
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Benchmark proc_cmd vs proc_cmd_batch
+#
+# Times the FluidSynth router setup (12 commands) sent to a mock engine shell,
+# one round trip per command vs pipelined, and checks the replies line up with
+# their commands. Both a plain stdin shell (terminal echo) and a readline
+# shell (engine echo) are tested.
+#
+#   python3 tools/bench_proc_cmd.py [iterations]
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import os
+import sys
+from time import monotonic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from zyngine.zynthian_engine import zynthian_basic_engine
+
+#------------------------------------------------------------------------------
+
+shells = {
+	'plain': "import sys\n"
+		"sys.stdout.write('Main> \\n> '); sys.stdout.flush()\n"
+		"for line in sys.stdin:\n"
+		"	sys.stdout.write('ok ' + line.strip() + '\\n> '); sys.stdout.flush()\n",
+	'readline': "import readline\n"
+		"print('Main> ')\n"
+		"while True:\n"
+		"	try: line = input('> ')\n"
+		"	except EOFError: break\n"
+		"	print('ok ' + line.strip())\n"
+}
+
+cmds = []
+for rtype in ("note", "cc", "pbend", "prog"):
+	cmds += ["router_begin {}".format(rtype), "router_chan 0 0 0 0", "router_end"]
+
+n = int(sys.argv[1]) if len(sys.argv)>1 else 50
+
+for name, code in shells.items():
+	engine = zynthian_basic_engine(name, "{} -c \"{}\"".format(sys.executable, code), "\n> ")
+	engine.start()
+
+	res = engine.proc_cmd_batch(cmds)
+	aligned = all(r.strip().splitlines()[-1]=="ok " + c for r, c in zip(res, cmds))
+	aligned = aligned and all(len(r.strip().splitlines())<=2 for r in res)
+
+	ts = monotonic()
+	for i in range(n):
+		for cmd in cmds:
+			engine.proc_cmd(cmd)
+	t_cmd = 1000*(monotonic()-ts)/n
+
+	ts = monotonic()
+	for i in range(n):
+		engine.proc_cmd_batch(cmds)
+	t_batch = 1000*(monotonic()-ts)/n
+
+	print("{}: {} commands => proc_cmd {:.2f} ms, proc_cmd_batch {:.2f} ms, replies aligned: {}".format(name, len(cmds), t_cmd, t_batch, aligned))
+	engine.proc.terminate(True)
+	engine.proc = None
+
+#------------------------------------------------------------------------------
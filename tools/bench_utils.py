@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Benchmark helpers
+#
+# Load the GUI layer dispatch code without hardware, Tk or engine binaries,
+# so it can be timed on any machine.
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import os
+import sys
+import types
+import importlib
+
+#------------------------------------------------------------------------------
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Replace the hardware & Tk modules with empty ones and import
+# zyngui.zynthian_gui_layer and zyngine.zynthian_layer. Return them, with the
+# GUI config module, whose options can be changed.
+def load_gui_layer():
+	sys.path.insert(0, root_dir)
+
+	zyncoder = types.ModuleType('zyncoder')
+	zyncoder.zyncoder = types.SimpleNamespace(lib_zyncoder=None)
+	zyncoder.__all__ = ['zyncoder']
+	sys.modules['zyncoder'] = zyncoder
+	sys.modules['liblo'] = types.SimpleNamespace(UDP=1, TCP=2)
+
+	# Packages without __init__, so only the needed modules are imported
+	for name in ('zyngine', 'zyngui'):
+		pkg = types.ModuleType(name)
+		pkg.__path__ = [os.path.join(root_dir, name)]
+		sys.modules[name] = pkg
+
+	config = types.ModuleType('zyngui.zynthian_gui_config')
+	config.midi_single_active_channel = 0
+	sys.modules['zyngui.zynthian_gui_config'] = config
+	sys.modules['zyngui'].zynthian_gui_config = config
+
+	class zynthian_gui_selector:
+		pass
+	selector = types.ModuleType('zyngui.zynthian_gui_selector')
+	selector.zynthian_gui_selector = zynthian_gui_selector
+	sys.modules['zyngui.zynthian_gui_selector'] = selector
+	sys.modules['zyngui'].zynthian_gui_selector = zynthian_gui_selector
+
+	# zynthian_gui_layer imports the classes from the package, as zyngine/__init__ exports them
+	zynthian_controller = importlib.import_module('zyngine.zynthian_controller').zynthian_controller
+	zynthian_layer = importlib.import_module('zyngine.zynthian_layer').zynthian_layer
+	sys.modules['zyngine'].zynthian_controller = zynthian_controller
+	sys.modules['zyngine'].zynthian_layer = zynthian_layer
+	zynthian_gui_layer = importlib.import_module('zyngui.zynthian_gui_layer').zynthian_gui_layer
+
+	return zynthian_gui_layer, zynthian_layer, config
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Benchmark ZS3 program change dispatching
+#
+# Times the ZS3 recall & status calls of zynthian_gui_layer, using the compiled
+# per-channel recall plans, against the previous layer scans. 16 layers, one
+# by MIDI channel, with a ZS3 stored in every third program.
+#
+#   python3 tools/bench_zs3_plans.py [iterations]
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import sys
+from time import perf_counter
+
+from bench_utils import load_gui_layer
+
+zynthian_gui_layer, zynthian_layer, zynthian_gui_config = load_gui_layer()
+
+#------------------------------------------------------------------------------
+# Mock layer: recalling a ZS3 does nothing
+#------------------------------------------------------------------------------
+
+class mock_layer(zynthian_layer):
+
+	def __init__(self, chan):
+		self.midi_chan = chan
+		self.reset_zs3()
+		for i in range(0, 128, 3):
+			self.zs3_list[i] = {}
+
+	def restore_zs3(self, i):
+		return False
+
+#------------------------------------------------------------------------------
+# Previous implementation
+#------------------------------------------------------------------------------
+
+def old_set_midi_chan_zs3(gui_layer, midich, zs3_index):
+	for layer in gui_layer.layers:
+		if zynthian_gui_config.midi_single_active_channel or midich==layer.get_midi_chan():
+			layer.restore_zs3(zs3_index)
+
+
+def old_get_midi_chan_zs3_status(gui_layer, midich, zs3_index):
+	for layer in gui_layer.layers:
+		if zynthian_gui_config.midi_single_active_channel or midich==layer.get_midi_chan():
+			if layer.get_zs3(zs3_index):
+				return True
+	return False
+
+
+def old_get_midi_chan_zs3_used_indexes(gui_layer, midich):
+	res=[]
+	for i in range(128):
+		if old_get_midi_chan_zs3_status(gui_layer, midich, i):
+			res.append(i)
+	return res
+
+#------------------------------------------------------------------------------
+
+n = int(sys.argv[1]) if len(sys.argv)>1 else 100
+
+gui_layer = zynthian_gui_layer.__new__(zynthian_gui_layer)
+gui_layer.layers = [mock_layer(chan) for chan in range(16)]
+gui_layer.root_layers = list(gui_layer.layers)
+gui_layer.invalidate_zs3_plans()
+
+
+def sweep_old():
+	for chan in range(16):
+		for i in range(128):
+			old_set_midi_chan_zs3(gui_layer, chan, i)
+
+
+def sweep_new():
+	for chan in range(16):
+		for i in range(128):
+			gui_layer.set_midi_chan_zs3(chan, i)
+
+
+def used_old():
+	return [old_get_midi_chan_zs3_used_indexes(gui_layer, chan) for chan in range(16)]
+
+
+def used_new():
+	# Including the plans compilation
+	gui_layer.invalidate_zs3_plans()
+	return [gui_layer.get_midi_chan_zs3_used_indexes(chan) for chan in range(16)]
+
+
+assert used_old()==used_new()
+
+for name, old, new in (("128-program sweep on 16 channels", sweep_old, sweep_new), ("used indexes of 16 channels", used_old, used_new)):
+	res = []
+	for func in (old, new):
+		ts = perf_counter()
+		for i in range(n):
+			func()
+		res.append(1000*(perf_counter()-ts)/n)
+	print("{}: {:.2f} ms before, {:.2f} ms after".format(name, res[0], res[1]))
+
+#------------------------------------------------------------------------------
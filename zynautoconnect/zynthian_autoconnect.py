@@ -27,8 +27,7 @@ import os
 import jack
 import copy
 import logging
-from time import sleep
-from threading  import Thread, Lock
+from threading  import Thread, Lock, Event
 from collections import OrderedDict
 
 # Zynthian specific modules
@@ -51,11 +50,21 @@ logger.setLevel(log_level)
 #-------------------------------------------------------------------------------
 
 refresh_time = 2
+debounce_time = 0.1
+debounce_max_count = 20
 jclient = None
 thread = None
 exit_flag = False
 
 last_hw_str = None
+last_audio_ops = [0, 0]
+
+# Port/Client registration events, set from jack notification thread.
+# The flags are read & cleared together, under ports_changed_lock.
+jack_event = Event()
+ports_changed_lock = Lock()
+midi_ports_changed = False
+audio_ports_changed = False
 
 #------------------------------------------------------------------------------
 
@@ -343,6 +352,7 @@ def midi_autoconnect(force=False):
 
 
 def audio_autoconnect(force=False):
+	global last_audio_ops
 
 	if not force:
 		logger.info("ZynAutoConnect: Escaped for Audio ...")
@@ -353,91 +363,86 @@ def audio_autoconnect(force=False):
 
 	logger.info("ZynAutoConnect: Audio ...")
 
+	#Operations applied in this pass => [connections, disconnections]
+	ops = [0, 0]
+
 	#Get Audio Input Ports (ports receiving audio => inputs => you write on it!!)
 	input_ports=get_audio_input_ports()
 
 	#Disconnect Monitor from System Output
+	to_disconnect = set()
 	mon_in=jclient.get_ports("mod-monitor", is_output=True, is_audio=True)
 	try:
-		jclient.disconnect(mon_in[0],input_ports['system'][0])
-		jclient.disconnect(mon_in[1],input_ports['system'][1])
+		for j in range(2):
+			sop = input_ports['system'][j].name
+			if sop in get_connection_names(mon_in[j]):
+				to_disconnect.add((mon_in[j].name, sop))
 	except:
 		pass
+	apply_connections(set(), to_disconnect, ops)
 
 	#Get layers list from UI
 	layers_list=zynthian_gui_config.zyngui.screens["layer"].layers
 
-	#Connect Synth Engines to assigned outputs
-	for i, layer in enumerate(layers_list):
-		if not layer.get_jackname():
+	#Build the desired routing for each engine output. If several layers share
+	#the same jack client, the last one wins, as it always did.
+	engine_routes = OrderedDict()
+	for layer in layers_list:
+		jackname = layer.get_jackname()
+		if not jackname:
 			continue
 
-		ports=jclient.get_ports(layer.get_jackname(), is_output=True, is_audio=True, is_physical=False)
+		ports=jclient.get_ports(jackname, is_output=True, is_audio=True, is_physical=False)
 		if ports:
-			#logger.debug("Num of {} Audio Ports: {}".format(layer.get_jackname(), len(ports)))
+			#Convert to Stereo Output
 			if len(ports)==1:
 				ports.append(ports[0])
-				#logger.debug("Converting to Stereo Output {} ...".format(layer.get_jackname()))
-
-			#logger.debug("Autoconnecting Engine {} ...".format(layer.get_jackname()))
-			
-			#Connect to assigned ports and disconnect from the rest ...
-			for ao in input_ports:
-				if ao in layer.get_audio_out():
-					if len(input_ports[ao])==1:
-						input_ports[ao].append(input_ports[ao][0])
-					#logger.debug(" => Connecting to {}".format(ao))
-					for j in range(len(ports)):
-						try:
-							jclient.connect(ports[j],input_ports[ao][j%2])
-						except:
-							pass
 
-				else:
-					for j in range(len(ports)):
-						try:
-							jclient.disconnect(ports[j],input_ports[ao][j%2])
-						except:
-							pass
+			desired = set()
+			for ao in layer.get_audio_out():
+				if ao in input_ports:
+					aip = input_ports[ao]
+					for j, p in enumerate(ports):
+						desired.add((p.name, aip[j%2 if len(aip)>1 else 0].name))
+			engine_routes[jackname] = (ports, desired)
+
+	#Diff against current jack graph, only for the managed input ports
+	managed_ports = set(p.name for aip in input_ports.values() for p in aip)
+	to_connect = set()
+	to_disconnect = set()
+	for jackname, (ports, desired) in engine_routes.items():
+		current = set()
+		for pname in set(p.name for p in ports):
+			for cpname in get_connection_names(pname):
+				if cpname in managed_ports:
+					current.add((pname, cpname))
+		to_connect |= desired - current
+		to_disconnect |= current - desired
+
+	apply_connections(to_connect, to_disconnect, ops)
 
 	#Setup dpmeter connections if enabled ...
 	if not zynthian_gui_config.show_cpu_status:
-		#Prepare for setup dpmeter connections
+		#Mirror System Out connections into dpmeter
 		dpmeter_out = jclient.get_ports("jackpeak", is_input=True, is_audio=True)
-		dpmeter_conports_1=jclient.get_all_connections("jackpeak:input_a")
-		dpmeter_conports_2=jclient.get_all_connections("jackpeak:input_b")
-		sysout_conports_1 = jclient.get_all_connections("system:playback_1")
-		sysout_conports_2 = jclient.get_all_connections("system:playback_2")
-
-		#Disconnect ports from dpmeter (those that are not connected to System Out, if any ...)
-		for cp in dpmeter_conports_1:
-			if cp not in sysout_conports_1:
-				try:
-					jclient.disconnect(cp,dpmeter_out[0])
-				except:
-					pass
-		for cp in dpmeter_conports_2:
-			if cp not in sysout_conports_2:
-				try:
-					jclient.disconnect(cp,dpmeter_out[1])
-				except:
-					pass
+		to_connect = set()
+		to_disconnect = set()
+		for j in range(min(2, len(dpmeter_out))):
+			dpmeter_conports = get_connection_names(dpmeter_out[j])
+			sysout_conports = get_connection_names("system:playback_{}".format(j+1))
+			to_connect |= set((cp, dpmeter_out[j].name) for cp in sysout_conports - dpmeter_conports)
+			to_disconnect |= set((cp, dpmeter_out[j].name) for cp in dpmeter_conports - sysout_conports)
 
-		#Connect ports to dpmeter (those currently connected to System Out)
-		for cp in sysout_conports_1:
-			try:
-				jclient.connect(cp,dpmeter_out[0])
-			except:
-				pass
-		for cp in sysout_conports_2:
-			try:
-				jclient.connect(cp,dpmeter_out[1])
-			except:
-				pass
+		apply_connections(to_connect, to_disconnect, ops)
 
 	#Get System Capture ports => jack output ports!!
 	system_capture=jclient.get_ports(is_output=True, is_audio=True, is_physical=True)
 	if len(system_capture)>0:
+		if len(system_capture)==1:
+			system_capture.append(system_capture[0])
+
+		capture_conports = [get_connection_names(system_capture[0]), get_connection_names(system_capture[1])]
+		to_connect = set()
 
 		#Connect system capture to effect root layers ...
 		root_layers=zynthian_gui_config.zyngui.screens["layer"].get_fxchain_roots()
@@ -452,13 +457,9 @@ def audio_autoconnect(force=False):
 			if len(rl_in)>0:
 				if len(rl_in)==1:
 					rl_in.append(rl_in[0])
-
-				try:
-					jclient.connect(system_capture[0],rl_in[0])
-					jclient.connect(system_capture[1],rl_in[1])
-				except:
-					pass
-
+				for j in range(2):
+					if rl_in[j].name not in capture_conports[j]:
+						to_connect.add((system_capture[j].name, rl_in[j].name))
 
 		if zynthian_gui_config.midi_aubionotes_enabled:
 			#Get Aubio Input ports ...
@@ -467,17 +468,45 @@ def audio_autoconnect(force=False):
 			if len(aubio_in)>0:
 				if len(aubio_in)==1:
 					aubio_in.append(aubio_in[0])
+				for j in range(2):
+					if aubio_in[j].name not in capture_conports[j]:
+						to_connect.add((system_capture[j].name, aubio_in[j].name))
 
-				try:
-					jclient.connect(system_capture[0],aubio_in[0])
-					jclient.connect(system_capture[1],aubio_in[1])
-				except:
-					pass
+		apply_connections(to_connect, set(), ops)
+
+	last_audio_ops = ops
+	logger.info("ZynAutoConnect: Audio => {} connected, {} disconnected".format(ops[0], ops[1]))
 
 	#Release Mutex Lock
 	release_lock()
 
 
+def get_connection_names(port):
+	try:
+		return set(p.name for p in jclient.get_all_connections(port))
+	except:
+		return set()
+
+
+def apply_connections(to_connect, to_disconnect, ops):
+	for src, dst in to_disconnect:
+		try:
+			jclient.disconnect(src, dst)
+			ops[1] += 1
+		except:
+			pass
+	for src, dst in to_connect:
+		try:
+			jclient.connect(src, dst)
+			ops[0] += 1
+		except:
+			pass
+
+
+def get_last_audio_ops():
+	return last_audio_ops
+
+
 def audio_disconnect_sysout():
 	sysout_ports=jclient.get_ports("system", is_input=True, is_audio=True)
 	for sop in sysout_ports:
@@ -513,12 +542,40 @@ def autoconnect(force=False):
 
 
 def autoconnect_thread():
+	global midi_ports_changed, audio_ports_changed
+
 	while not exit_flag:
-		try:
-			autoconnect()
-		except Exception as err:
-			logger.error("ZynAutoConnect ERROR: {}".format(err))
-		sleep(refresh_time)
+		# Wait for jack registration events. On timeout, do a fallback sweep.
+		if jack_event.wait(refresh_time):
+			# Debounce bursts of events (engine starting, USB device plugged, ...)
+			jack_event.clear()
+			for i in range(debounce_max_count):
+				if not jack_event.wait(debounce_time):
+					break
+				jack_event.clear()
+
+			if exit_flag:
+				break
+
+			with ports_changed_lock:
+				midi_flag = midi_ports_changed
+				audio_flag = audio_ports_changed
+				midi_ports_changed = False
+				audio_ports_changed = False
+
+			try:
+				if midi_flag:
+					midi_autoconnect(True)
+				if audio_flag:
+					audio_autoconnect(True)
+			except Exception as err:
+				logger.error("ZynAutoConnect ERROR: {}".format(err))
+
+		else:
+			try:
+				autoconnect()
+			except Exception as err:
+				logger.error("ZynAutoConnect ERROR: {}".format(err))
 
 
 def acquire_lock():
@@ -545,6 +602,8 @@ def start(rt=2):
 	try:
 		jclient=jack.Client("Zynthian_autoconnect")
 		jclient.set_xrun_callback(cb_jack_xrun)
+		jclient.set_port_registration_callback(cb_jack_port_registration, False)
+		jclient.set_client_registration_callback(cb_jack_client_registration)
 		jclient.activate()
 	except Exception as e:
 		logger.error("ZynAutoConnect ERROR: Can't connect with Jack Audio Server ({})".format(e))
@@ -561,6 +620,7 @@ def start(rt=2):
 def stop():
 	global exit_flag
 	exit_flag=True
+	jack_event.set()
 	acquire_lock()
 	audio_disconnect_sysout()
 	release_lock()
@@ -576,6 +636,30 @@ def cb_jack_xrun(delayed_usecs: float):
 	zynthian_gui_config.zyngui.status_info['xrun'] = True
 
 
+# Called from jack notification thread => don't call jack API here!
+def cb_jack_port_registration(port, register):
+	global midi_ports_changed, audio_ports_changed
+	with ports_changed_lock:
+		if port is None:
+			midi_ports_changed = True
+			audio_ports_changed = True
+		elif port.is_midi:
+			midi_ports_changed = True
+		else:
+			audio_ports_changed = True
+	jack_event.set()
+
+
+def cb_jack_client_registration(name, register):
+	global midi_ports_changed, audio_ports_changed
+	# Port callbacks are not reliable when a client is closed => refresh all
+	if not register:
+		with ports_changed_lock:
+			midi_ports_changed = True
+			audio_ports_changed = True
+		jack_event.set()
+
+
 def get_jack_cpu_load():
 	return jclient.cpu_load()
 
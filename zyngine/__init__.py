@@ -2,9 +2,13 @@
 __all__ = [
 	"zynthian_zcmidi",
 	"zynthian_midi_filter",
+	"zynthian_ctrlfb",
 	"zynthian_controller",
 	"zynthian_layer",
 	"zynthian_lv2",
+	"zynthian_dircache",
+	"zynthian_preset_search",
+	"zynthian_osc_sender",
 	"zynthian_engine",
 	"zynthian_engine_zynaddsubfx",
 	"zynthian_engine_linuxsampler",
@@ -22,9 +26,13 @@ __all__ = [
 #from zyngine.zynthian_midi import *
 from zyngine.zynthian_zcmidi import *
 from zyngine.zynthian_midi_filter import *
+from zyngine.zynthian_ctrlfb import *
 from zyngine.zynthian_controller import *
 from zyngine.zynthian_layer import *
 from zyngine.zynthian_lv2 import *
+from zyngine.zynthian_dircache import *
+from zyngine.zynthian_preset_search import *
+from zyngine.zynthian_osc_sender import *
 from zyngine.zynthian_engine import *
 from zyngine.zynthian_engine_zynaddsubfx import *
 from zyngine.zynthian_engine_linuxsampler import *
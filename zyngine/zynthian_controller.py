@@ -25,13 +25,20 @@
 import logging
 import liblo
 import ctypes
+import threading
+from collections import OrderedDict
 
 # Zynthian specific modules
 from zyncoder import *
+from .zynthian_ctrlfb import zynthian_ctrlfb
 
 
 class zynthian_controller:
 
+	# Shared MIDI feedback dispatcher
+	ctrlfb = None
+	ctrlfb_lock = threading.Lock()
+
 	def __init__(self, engine, symbol, name=None, options=None):
 		self.engine=engine
 		self.symbol=symbol
@@ -247,35 +254,82 @@ class zynthian_controller:
 		self._set_value(val)
 
 		if self.engine:
+			self.send_value(force_sending)
+			self.send_feedback()
+
+
+	def send_value(self, force_sending=False):
+		try:
+			# Send value using engine method...
+			self.engine.send_controller_value(self)
+		except:
+			if force_sending:
+				try:
+					# Send value using OSC/MIDI ...
+					mval=self.get_ctrl_midi_val()
+					if self.osc_path:
+						liblo.send(self.engine.osc_target,self.osc_path,self.get_ctrl_osc_val())
+					elif self.midi_cc:
+						zyncoder.lib_zyncoder.zynmidi_send_ccontrol_change(self.midi_chan,self.midi_cc,mval)
+
+					logging.debug("Sending controller '{}' value => {} ({})".format(self.symbol,self.value,mval))
+
+				except Exception as e:
+					logging.warning("Can't send controller '{}' value => {}".format(self.symbol,e))
+
+
+	# Send feedback to MIDI controllers
+	def send_feedback(self):
+		try:
 			mval=self.get_ctrl_midi_val()
-			try:
-				# Send value using engine method...
-				self.engine.send_controller_value(self)
-			except:
-				if force_sending:
-					try:
-						# Send value using OSC/MIDI ...
-						if self.osc_path:
-							liblo.send(self.engine.osc_target,self.osc_path,self.get_ctrl_osc_val())
-						elif self.midi_cc:
-							zyncoder.lib_zyncoder.zynmidi_send_ccontrol_change(self.midi_chan,self.midi_cc,mval)
+			if self.midi_learn_cc:
+				self.get_ctrlfb().send(self.midi_learn_chan,self.midi_learn_cc,mval)
+				#logging.debug("Controller feedback '{}' (learn) => CH{}, CC{}, Val={}".format(self.symbol,self.midi_learn_chan,self.midi_learn_cc,mval))
+			elif self.midi_cc:
+				self.get_ctrlfb().send(self.midi_chan,self.midi_cc,mval)
+				#logging.debug("Controller feedback '{}' => CH{}, CC{}, Val={}".format(self.symbol,self.midi_chan,self.midi_cc,mval))
 
-						logging.debug("Sending controller '{}' value => {} ({})".format(self.symbol,val,mval))
+		except Exception as e:
+			logging.warning("Can't send controller feedback '{}' => Val={}".format(self.symbol,e))
 
-					except Exception as e:
-						logging.warning("Can't send controller '{}' value => {}".format(self.symbol,e))
 
-			# Send feedback to MIDI controllers
-			try:
-				if self.midi_learn_cc:
-					zyncoder.lib_zyncoder.ctrlfb_send_ccontrol_change(self.midi_learn_chan,self.midi_learn_cc,mval)
-					#logging.debug("Controller feedback '{}' (learn) => CH{}, CC{}, Val={}".format(self.symbol,self.midi_learn_chan,self.midi_learn_cc,mval))
-				elif self.midi_cc:
-					zyncoder.lib_zyncoder.ctrlfb_send_ccontrol_change(self.midi_chan,self.midi_cc,mval)
-					#logging.debug("Controller feedback '{}' => CH{}, CC{}, Val={}".format(self.symbol,self.midi_chan,self.midi_cc,mval))
+	@staticmethod
+	def get_ctrlfb():
+		if zynthian_controller.ctrlfb is None:
+			with zynthian_controller.ctrlfb_lock:
+				if zynthian_controller.ctrlfb is None:
+					zynthian_controller.ctrlfb = zynthian_ctrlfb()
+		return zynthian_controller.ctrlfb
+
+
+	# The external controllers' state is unknown (snapshot loaded, layer
+	# changed, ...) => send the next feedback values even if unchanged
+	@staticmethod
+	def reset_ctrlfb():
+		if zynthian_controller.ctrlfb:
+			zynthian_controller.ctrlfb.reset()
+
 
+	# Send the values of a list of controllers, using the engines' bulk
+	# method, and then the feedback to MIDI controllers, in a single pass.
+	@staticmethod
+	def send_values(zctrls, force_sending=True):
+		engines = OrderedDict()
+		for zctrl in zctrls:
+			if zctrl.engine:
+				engines.setdefault(zctrl.engine, []).append(zctrl)
+
+		for engine, engine_zctrls in engines.items():
+			try:
+				engine.send_controller_values(engine_zctrls, force_sending)
 			except Exception as e:
-				logging.warning("Can't send controller feedback '{}' => Val={}".format(self.symbol,e))
+				logging.warning("Can't send controller values to {} => {}".format(engine.name, e))
+				for zctrl in engine_zctrls:
+					zctrl.send_value(force_sending)
+
+		for engine_zctrls in engines.values():
+			for zctrl in engine_zctrls:
+				zctrl.send_feedback()
 
 
 	def get_value2label(self, val=None):
@@ -362,17 +416,23 @@ class zynthian_controller:
 		return snapshot
 
 
-	def restore_snapshot(self, snapshot):
+	# With send=False, the value is set but not sent. Use send_values later.
+	def restore_snapshot(self, snapshot, send=True):
 		if isinstance(snapshot, dict):
-			self.set_value(snapshot['value'], True)
+			if send:
+				self.set_value(snapshot['value'], True)
+			else:
+				self._set_value(snapshot['value'])
 			if 'midi_learn_chan' in snapshot and 'midi_learn_cc' in snapshot:
 				# Specific ZynAddSubFX slot info
 				if 'slot_i' in snapshot:
 					self.slot_i = snapshot['slot_i']
 				# Restore MIDI-learn
 				self.set_midi_learn(int(snapshot['midi_learn_chan']), int(snapshot['midi_learn_cc']))
-		else:
+		elif send:
 			self.set_value(snapshot,True)
+		else:
+			self._set_value(snapshot)
 
 
 	#--------------------------------------------------------------------------
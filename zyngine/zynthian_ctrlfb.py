@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Zynthian Controller Feedback (zynthian_ctrlfb)
+#
+# Rate-limited MIDI feedback dispatcher for external controllers
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import os
+import logging
+import threading
+from time import monotonic
+
+# Zynthian specific modules
+from zyncoder import *
+
+#------------------------------------------------------------------------------
+# Controller Feedback Dispatcher Class
+#------------------------------------------------------------------------------
+
+class zynthian_ctrlfb:
+
+	def __init__(self, rate=None):
+		if rate is None:
+			rate = float(os.environ.get('ZYNTHIAN_MIDI_CTRLFB_RATE', 50))
+		self.set_rate(rate)
+
+		# (chan, cc) => value, waiting to be sent
+		self.pending = {}
+		# (chan, cc) => last value sent & time
+		self.last_val = {}
+		self.last_ts = {}
+		self.cond = threading.Condition()
+
+		self.n_sent = 0
+		self.n_suppressed = 0
+
+		self.thread = threading.Thread(target=self.task_dispatcher, args=())
+		self.thread.daemon = True
+		self.thread.start()
+
+
+	# Max number of messages per second for each (chan, cc). 0 => no limit.
+	def set_rate(self, rate):
+		self.rate = rate
+		if rate>0:
+			self.period = 1.0/rate
+		else:
+			self.period = 0
+		logging.info("MIDI controller feedback rate => {} Hz".format(rate))
+
+
+	# Queue a feedback CC. Values equal to the last one sent are dropped,
+	# and a value still waiting to be sent is replaced by the new one.
+	def send(self, chan, cc, val):
+		key = (chan, cc)
+		with self.cond:
+			if key in self.pending:
+				self.n_suppressed += 1
+			elif self.last_val.get(key)==val:
+				self.n_suppressed += 1
+				return
+			self.pending[key] = val
+			self.cond.notify()
+
+
+	# Forget the values sent, so the next ones are sent for sure. Needed
+	# when the controller's state is unknown (reconnected, etc.)
+	def reset(self, chan=None, cc=None):
+		with self.cond:
+			if chan is None:
+				self.last_val = {}
+			else:
+				self.last_val.pop((chan, cc), None)
+
+
+	def task_dispatcher(self):
+		while True:
+			ready = []
+			with self.cond:
+				while not ready:
+					now = monotonic()
+					next_ts = None
+					for key, val in list(self.pending.items()):
+						ts = self.last_ts.get(key, 0) + self.period
+						if ts<=now:
+							del self.pending[key]
+							if self.last_val.get(key)!=val:
+								self.last_val[key] = val
+								self.last_ts[key] = now
+								ready.append((key, val))
+							else:
+								self.n_suppressed += 1
+						elif next_ts is None or ts<next_ts:
+							next_ts = ts
+					if not ready:
+						if next_ts is None:
+							self.cond.wait()
+						else:
+							self.cond.wait(next_ts-now)
+
+			# All feedback is sent from here
+			for (chan, cc), val in ready:
+				try:
+					zyncoder.lib_zyncoder.ctrlfb_send_ccontrol_change(chan, cc, val)
+					self.n_sent += 1
+				except Exception as e:
+					logging.warning("Can't send controller feedback CH{}, CC{} => {}".format(chan, cc, e))
+
+
+	def get_stats(self):
+		with self.cond:
+			return {
+				'rate': self.rate,
+				'sent': self.n_sent,
+				'suppressed': self.n_suppressed,
+				'pending': len(self.pending)
+			}
+
+#------------------------------------------------------------------------------
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Zynthian Directory Cache (zynthian_dircache)
+#
+# Cached directory scanner used for bank/preset file lists
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import os
+import logging
+import threading
+from time import time
+from collections import OrderedDict, namedtuple
+
+try:
+	from inotify_simple import INotify, flags as inotify_flags
+except:
+	INotify = None
+
+#------------------------------------------------------------------------------
+# Directory Cache Class
+#------------------------------------------------------------------------------
+
+# Cached directory entry. Symlinks are followed, like os.path.isfile/isdir.
+zynthian_dircache_entry = namedtuple('zynthian_dircache_entry', ['name', 'path', 'is_file', 'is_dir'])
+
+
+class zynthian_dircache:
+
+	# Directories modified less than this (in seconds) are not cached,
+	# because of the coarse mtime resolution of some filesystems (FAT)
+	mtime_guard = 2
+
+	def __init__(self, max_size=256, use_inotify=True):
+		self.max_size = max_size
+		self.cache = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+		self.inotify = None
+		self.inotify_wds = {}
+		self.inotify_paths = {}
+		if use_inotify and INotify:
+			try:
+				self.inotify = INotify()
+				self.inotify_mask = inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM | \
+					inotify_flags.MOVED_TO | inotify_flags.ATTRIB | inotify_flags.DELETE_SELF | inotify_flags.MOVE_SELF
+				self.inotify_thread = threading.Thread(target=self.inotify_task, args=())
+				self.inotify_thread.daemon = True
+				self.inotify_thread.start()
+			except Exception as e:
+				logging.warning("Can't use inotify for directory cache: {}".format(e))
+				self.inotify = None
+
+
+	def listdir(self, dpath):
+		""" Return the sorted list of entries in dpath, without dot-files """
+		try:
+			return self.get(('L', dpath), self.scan_dir, dpath)
+		except FileNotFoundError:
+			self.invalidate(dpath)
+			raise
+
+
+	def is_empty(self, dpath):
+		try:
+			return self.get(('E', dpath), self.scan_empty, dpath)
+		except FileNotFoundError:
+			self.invalidate(dpath)
+			raise
+
+
+	def get(self, key, scan_func, dpath):
+		with self.lock:
+			item = self.cache.get(key)
+			if item and item[0] is None:
+				# Watched by inotify => valid until invalidated
+				self.cache.move_to_end(key)
+				self.hits += 1
+				return item[1]
+
+		mtime = os.stat(dpath).st_mtime
+		if item and item[0]==mtime:
+			with self.lock:
+				self.cache.move_to_end(key)
+				self.hits += 1
+			return item[1]
+
+		cacheable = time()-mtime>self.mtime_guard
+		watched = cacheable and self.inotify is not None and self.add_watch(dpath)
+
+		res = scan_func(dpath)
+		self.misses += 1
+
+		# Don't cache if the directory changed while scanning
+		if cacheable and os.stat(dpath).st_mtime==mtime:
+			if watched:
+				mtime = None
+			with self.lock:
+				self.cache[key] = (mtime, res)
+				self.cache.move_to_end(key)
+				while len(self.cache)>self.max_size:
+					self.evict(next(iter(self.cache)))
+		elif watched:
+			with self.lock:
+				self.rm_watch(dpath)
+
+		return res
+
+
+	@staticmethod
+	def scan_dir(dpath):
+		res = []
+		with os.scandir(dpath) as it:
+			for entry in it:
+				if entry.name.startswith('.'):
+					continue
+				try:
+					res.append(zynthian_dircache_entry(entry.name, entry.path, entry.is_file(), entry.is_dir()))
+				except OSError:
+					pass
+		res.sort(key=lambda e: e.name)
+		return res
+
+
+	@staticmethod
+	def scan_empty(dpath):
+		with os.scandir(dpath) as it:
+			return next(it, None) is None
+
+
+	def invalidate(self, dpath=None):
+		with self.lock:
+			if dpath is None:
+				for key in list(self.cache.keys()):
+					self.evict(key)
+			else:
+				for key in (('L', dpath), ('E', dpath)):
+					if key in self.cache:
+						self.evict(key)
+
+
+	# Call with lock acquired
+	def evict(self, key):
+		del self.cache[key]
+		self.rm_watch(key[1])
+
+
+	def get_stats(self):
+		return {
+			'size': len(self.cache),
+			'hits': self.hits,
+			'misses': self.misses,
+			'inotify': self.inotify is not None
+		}
+
+	#----------------------------------------------------------------------------
+	# Inotify
+	#----------------------------------------------------------------------------
+
+	def add_watch(self, dpath):
+		with self.lock:
+			if dpath in self.inotify_wds:
+				return True
+			try:
+				wd = self.inotify.add_watch(dpath, self.inotify_mask)
+				self.inotify_wds[dpath] = wd
+				self.inotify_paths[wd] = dpath
+				return True
+			except Exception as e:
+				logging.debug("Can't watch '{}': {}".format(dpath, e))
+				return False
+
+
+	# Call with lock acquired
+	def rm_watch(self, dpath):
+		if dpath in self.inotify_wds and ('L', dpath) not in self.cache and ('E', dpath) not in self.cache:
+			wd = self.inotify_wds.pop(dpath)
+			del self.inotify_paths[wd]
+			try:
+				self.inotify.rm_watch(wd)
+			except:
+				pass
+
+
+	def inotify_task(self):
+		while True:
+			try:
+				for event in self.inotify.read():
+					with self.lock:
+						dpath = self.inotify_paths.get(event.wd)
+					if dpath:
+						self.invalidate(dpath)
+			except Exception as e:
+				logging.error("Directory cache inotify error: {}".format(e))
+
+#------------------------------------------------------------------------------
@@ -29,12 +29,14 @@ import json
 import liblo
 import logging
 import pexpect
-from time import sleep
-from os.path import isfile, isdir, join
+import threading
+from time import sleep, monotonic
 from string import Template
 from collections import OrderedDict
 
 from . import zynthian_controller
+from .zynthian_dircache import zynthian_dircache
+from .zynthian_preset_search import zynthian_preset_search
 
 #--------------------------------------------------------------------------------
 # Basic Engine Class: Spawn a proccess & manage IPC communication using pexpect
@@ -59,7 +61,9 @@ class zynthian_basic_engine:
 		self.name = name
 
 		self.proc = None
+		self.proc_lock = threading.RLock()
 		self.proc_timeout = 20
+		self.proc_batch_size = 32
 		self.proc_start_sleep = None
 		self.command = command
 		self.command_env = None
@@ -121,17 +125,55 @@ class zynthian_basic_engine:
 
 	def proc_cmd(self, cmd):
 		if self.proc:
-			try:
-				#logging.debug("proc command: "+cmd)
-				self.proc.sendline(cmd)
-				out=self.proc_get_output()
-				#logging.debug("proc output:\n{}".format(out))
-			except Exception as err:
-				out=""
-				logging.error("Can't exec engine command: {} => {}".format(cmd, err))
+			with self.proc_lock:
+				try:
+					#logging.debug("proc command: "+cmd)
+					self.proc.sendline(cmd)
+					out=self.proc_get_output()
+					#logging.debug("proc output:\n{}".format(out))
+				except Exception as err:
+					out=""
+					logging.error("Can't exec engine command: {} => {}".format(cmd, err))
 			return out
 
 
+	# Pipelined version of proc_cmd: send a window of commands at once and then
+	# parse the prompt-delimited replies. Return a list of outputs, one by command.
+	# Terminal echo is disabled meanwhile, so the echoed command lines don't end
+	# up in the first reply. Engines using readline echo each line before its
+	# reply, as proc_cmd gets it.
+	def proc_cmd_batch(self, cmds):
+		res=[]
+		if self.proc:
+			with self.proc_lock:
+				ts=monotonic()
+				try:
+					echo=self.proc.getecho()
+					if echo:
+						self.proc.setecho(False)
+				except:
+					echo=False
+				for i in range(0, len(cmds), self.proc_batch_size):
+					chunk=cmds[i:i+self.proc_batch_size]
+					n=0
+					try:
+						# Write the whole chunk at once
+						self.proc.send("".join(cmd + "\n" for cmd in chunk))
+						for cmd in chunk:
+							res.append(self.proc_get_output())
+							n+=1
+					except Exception as err:
+						logging.error("Can't exec engine command batch: {} => {}".format(chunk[n:], err))
+						res+=[""]*(len(chunk)-n)
+				if echo:
+					try:
+						self.proc.setecho(True)
+					except:
+						pass
+				logging.debug("Engine {} batch of {} commands => {:.1f} ms".format(self.name, len(cmds), 1000*(monotonic()-ts)))
+		return res
+
+
 #------------------------------------------------------------------------------
 # Synth Engine Base Class
 #------------------------------------------------------------------------------
@@ -155,6 +197,12 @@ class zynthian_engine(zynthian_basic_engine):
 		['main',['volume','modulation','pan','sustain']]
 	]
 
+	# Shared directory cache for bank/preset lists
+	dircache = None
+
+	# Global preset search index, shared by all engines
+	preset_search = None
+
 	# ---------------------------------------------------------------------------
 	# Config variables
 	# ---------------------------------------------------------------------------
@@ -173,6 +221,7 @@ class zynthian_engine(zynthian_basic_engine):
 		self.jackname = ""
 
 		self.loading = 0
+		self.loading_cond = threading.Condition()
 		self.layers = []
 
 		self.options = {
@@ -187,6 +236,7 @@ class zynthian_engine(zynthian_basic_engine):
 		self.osc_server = None
 		self.osc_server_port = None
 		self.osc_server_url = None
+		self.osc_bundle_size = 64
 
 		self.preset_favs = None
 		self.preset_favs_fpath = None
@@ -197,7 +247,9 @@ class zynthian_engine(zynthian_basic_engine):
 
 	def reset(self):
 		#Reset Vars
-		self.loading=0
+		with self.loading_cond:
+			self.loading=0
+			self.loading_cond.notify_all()
 		self.loading_snapshot=False
 		#TODO: OSC, IPC, ...
 
@@ -229,22 +281,32 @@ class zynthian_engine(zynthian_basic_engine):
 	# ---------------------------------------------------------------------------
 
 	def start_loading(self):
-		self.loading=self.loading+1
-		if self.loading<1: self.loading=1
+		with self.loading_cond:
+			self.loading=self.loading+1
+			if self.loading<1: self.loading=1
 		if self.zyngui:
 			self.zyngui.start_loading()
 
 	def stop_loading(self):
-		self.loading=self.loading-1
-		if self.loading<0: self.loading=0
+		with self.loading_cond:
+			self.loading=self.loading-1
+			if self.loading<0: self.loading=0
+			self.loading_cond.notify_all()
 		if self.zyngui:
 			self.zyngui.stop_loading()
 
 	def reset_loading(self):
-		self.loading=0
+		with self.loading_cond:
+			self.loading=0
+			self.loading_cond.notify_all()
 		if self.zyngui:
 			self.zyngui.stop_loading()
 
+	# Block until the engine is ready (not loading). Return False on timeout.
+	def wait_stop_loading(self, timeout=None):
+		with self.loading_cond:
+			return self.loading_cond.wait_for(lambda: self.loading<=0, timeout)
+
 	# ---------------------------------------------------------------------------
 	# Refresh Management
 	# ---------------------------------------------------------------------------
@@ -296,23 +358,39 @@ class zynthian_engine(zynthian_basic_engine):
 	# Generating list from different sources
 	# ---------------------------------------------------------------------------
 
+	@staticmethod
+	def get_dircache():
+		if zynthian_engine.dircache is None:
+			zynthian_engine.dircache = zynthian_dircache()
+		return zynthian_engine.dircache
+
+
+	@staticmethod
+	def get_preset_search():
+		if zynthian_engine.preset_search is None:
+			zynthian_engine.preset_search = zynthian_preset_search()
+		return zynthian_engine.preset_search
+
+
 	@staticmethod
 	def get_filelist(dpath, fext):
 		res=[]
 		if isinstance(dpath, str): dpath=[('_', dpath)]
 		fext='.'+fext
 		xlen=len(fext)
+		dircache=zynthian_engine.get_dircache()
 		i=0
 		for dpd in dpath:
 			dp=dpd[1]
 			dn=dpd[0]
 			try:
-				for f in sorted(os.listdir(dp)):
-					if not f.startswith('.') and isfile(join(dp,f)) and f[-xlen:].lower()==fext:
+				for e in dircache.listdir(dp):
+					f=e.name
+					if e.is_file and f[-xlen:].lower()==fext:
 						title=str.replace(f[:-xlen], '_', ' ')
 						if dn!='_': title=dn+'/'+title
 						#print("filelist => "+title)
-						res.append([join(dp,f),i,title,dn,f])
+						res.append([e.path,i,title,dn,f])
 						i=i+1
 			except:
 				pass
@@ -324,21 +402,24 @@ class zynthian_engine(zynthian_basic_engine):
 	def get_dirlist(dpath, exclude_empty=True):
 		res=[]
 		if isinstance(dpath, str): dpath=[('_', dpath)]
+		dircache=zynthian_engine.get_dircache()
 		i=0
 		for dpd in dpath:
 			dp=dpd[1]
 			dn=dpd[0]
 			try:
-				for f in sorted(os.listdir(dp)):
-					if exclude_empty and next(os.scandir(join(dp,f)), None) is None:
+				for e in dircache.listdir(dp):
+					f=e.name
+					if not e.is_dir:
 						continue
-					if not f.startswith('.') and isdir(join(dp,f)):
-						title,ext=os.path.splitext(f)
-						title=str.replace(title, '_', ' ')
-						if dn!='_': title=dn+'/'+title
-						#print("dirlist => "+title)
-						res.append([join(dp,f),i,title,dn,f])
-						i=i+1
+					if exclude_empty and dircache.is_empty(e.path):
+						continue
+					title,ext=os.path.splitext(f)
+					title=str.replace(title, '_', ' ')
+					if dn!='_': title=dn+'/'+title
+					#print("dirlist => "+title)
+					res.append([e.path,i,title,dn,f])
+					i=i+1
 			except:
 				pass
 
@@ -576,6 +657,31 @@ class zynthian_engine(zynthian_basic_engine):
 		raise Exception("NOT IMPLEMENTED!")
 
 
+	# Send a list of controller values. Engines implementing send_controller_value
+	# get one call per controller, unless they override this method. Otherwise,
+	# OSC controllers are sent in bundles and the rest by MIDI.
+	def send_controller_values(self, zctrls, force_sending=False):
+		if type(self).send_controller_value is not zynthian_engine.send_controller_value or not force_sending:
+			for zctrl in zctrls:
+				zctrl.send_value(force_sending)
+			return
+
+		bundle = liblo.Bundle()
+		n = 0
+		for zctrl in zctrls:
+			if zctrl.osc_path:
+				bundle.add(liblo.Message(zctrl.osc_path, zctrl.get_ctrl_osc_val()))
+				n += 1
+				if n>=self.osc_bundle_size:
+					liblo.send(self.osc_target, bundle)
+					bundle = liblo.Bundle()
+					n = 0
+			else:
+				zctrl.send_value(force_sending)
+		if n>0:
+			liblo.send(self.osc_target, bundle)
+
+
 	# ---------------------------------------------------------------------------
 	# MIDI Learn
 	# ---------------------------------------------------------------------------
@@ -596,6 +702,14 @@ class zynthian_engine(zynthian_basic_engine):
 		raise Exception("NOT IMPLEMENTED!")
 
 
+	# Engines that learn CCs by themselves must call this when the learned CCs change
+	def refresh_midi_learn(self):
+		try:
+			self.zyngui.screens['layer'].invalidate_ctrl_cc_map()
+		except:
+			pass
+
+
 	#----------------------------------------------------------------------------
 	# MIDI CC processing
 	#----------------------------------------------------------------------------
@@ -604,6 +718,11 @@ class zynthian_engine(zynthian_basic_engine):
 		raise Exception("NOT IMPLEMENTED!")
 
 
+	# (chan, cc) pairs handled by midi_control_change, for layers that don't listen MIDI-CC
+	def get_midi_control_keys(self):
+		return []
+
+
 	def midi_zctrl_change(self, zctrl, val):
 		try:
 			if val!=zctrl.get_value():
@@ -25,9 +25,12 @@
 import os
 import re
 import copy
+import json
 import shutil
 import logging
+import threading
 from subprocess import check_output
+from collections import OrderedDict
 from . import zynthian_engine
 from . import zynthian_controller
 
@@ -77,6 +80,18 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 		('_', zynthian_engine.data_dir + "/soundfonts/sf2")
 	]
 
+	# Size of the SoundFont pool, in MB. Unused soundfonts are kept loaded (LRU) while they fit.
+	# Disabled by default => unused soundfonts are unloaded.
+	sf_pool_size = int(os.environ.get('ZYNTHIAN_FLUIDSYNTH_SF_POOL_MB', 0))
+
+	# Preset list cache => sf path => {'mtime': mtime, 'presets': preset_list}
+	preset_list_cache = None
+	preset_list_cache_fpath = zynthian_engine.config_dir + "/fluidsynth_presets.json"
+	# Delay (in seconds) for saving the cache after changes
+	preset_list_cache_save_delay = 5
+	preset_list_cache_save_timer = None
+	preset_list_cache_lock = threading.Lock()
+
 	# ---------------------------------------------------------------------------
 	# Initialization
 	# ---------------------------------------------------------------------------
@@ -103,7 +118,8 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 
 	def reset(self):
 		super().reset()
-		self.soundfont_index={}
+		self.soundfont_index=OrderedDict()
+		self.soundfont_size={}
 		self.clear_midi_routes()
 		self.unload_unused_soundfonts()
 
@@ -112,6 +128,9 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 	# ---------------------------------------------------------------------------
 
 	def stop(self):
+		# Don't lose pending preset list cache changes
+		if self.preset_list_cache_save_timer:
+			self.save_preset_list_cache()
 		try:
 			self.proc.sendline("quit")
 			self.proc.expect("\ncheers!")
@@ -157,7 +176,7 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 	def load_bank(self, bank_fpath, unload_unused_sf=True):
 		if self.load_soundfont(bank_fpath):
 			if unload_unused_sf:
-				self.unload_unused_soundfonts()
+				self.unload_unused_soundfonts(bank_fpath)
 			self.set_all_presets()
 			return True
 		else:
@@ -168,15 +187,20 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 	# ---------------------------------------------------------------------------
 
 	def get_preset_list(self, bank):
+		try:
+			mtime = os.stat(bank[0]).st_mtime
+			cached = self.get_preset_list_cache()[bank[0]]
+			if cached['mtime']==mtime:
+				return copy.copy(cached['presets'])
+		except:
+			pass
+
 		logging.info("Getting Preset List for {}".format(bank[2]))
 		preset_list=[]
 
-		try:
+		# FluidSynth's load resets channel programs => load_bank restores them
+		if bank[0] in self.soundfont_index or self.load_bank(bank[0]):
 			sfi = self.soundfont_index[bank[0]]
-		except:
-			sfi = self.load_bank(bank[0], False)
-
-		if sfi:
 			output=self.proc_cmd("inst {}".format(sfi))
 			for f in output.split("\n"):
 				try:
@@ -189,24 +213,80 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 				except:
 					pass
 
+			if preset_list:
+				self.update_preset_list_cache(bank[0], preset_list)
+
 		return preset_list
 
 
+	@classmethod
+	def get_preset_list_cache(cls):
+		if cls.preset_list_cache is None:
+			try:
+				with open(cls.preset_list_cache_fpath) as f:
+					cls.preset_list_cache = json.load(f)
+			except Exception as e:
+				logging.info("Can't load preset list cache: {}".format(e))
+				cls.preset_list_cache = {}
+		return cls.preset_list_cache
+
+
+	@classmethod
+	def update_preset_list_cache(cls, sf, preset_list):
+		try:
+			mtime = os.stat(sf).st_mtime
+		except:
+			return
+		with cls.preset_list_cache_lock:
+			cls.get_preset_list_cache()[sf] = {
+				'mtime': mtime,
+				'presets': copy.copy(preset_list)
+			}
+			# Batch the changes in a single write
+			if cls.preset_list_cache_save_timer is None:
+				cls.preset_list_cache_save_timer = threading.Timer(cls.preset_list_cache_save_delay, cls.save_preset_list_cache)
+				cls.preset_list_cache_save_timer.daemon = True
+				cls.preset_list_cache_save_timer.start()
+
+
+	@classmethod
+	def save_preset_list_cache(cls):
+		with cls.preset_list_cache_lock:
+			if cls.preset_list_cache_save_timer:
+				cls.preset_list_cache_save_timer.cancel()
+				cls.preset_list_cache_save_timer = None
+			if cls.preset_list_cache is None:
+				return
+			try:
+				with open(cls.preset_list_cache_fpath + ".tmp", "w") as f:
+					json.dump(cls.preset_list_cache, f)
+				os.replace(cls.preset_list_cache_fpath + ".tmp", cls.preset_list_cache_fpath)
+			except Exception as e:
+				logging.error("Can't save preset list cache: {}".format(e))
+
+
 	def set_preset(self, layer, preset, preload=False):
 		try:
 			sfi = self.soundfont_index[preset[3]]
+			self.soundfont_index.move_to_end(preset[3])
 		except:
 			if layer.set_bank_by_id(preset[3]):
 				sfi = self.soundfont_index[preset[3]]
 			else:
 				return False
 
+		self.proc_cmd(self.get_preset_cmd(layer, preset, sfi))
+		layer.send_ctrl_midi_cc()
+		return True
+
+
+	def get_preset_cmd(self, layer, preset, sfi=None):
+		if sfi is None:
+			sfi = self.soundfont_index[preset[3]]
 		midi_bank=preset[1][0]+preset[1][1]*128
 		midi_prg=preset[1][2]
 		logging.debug("Set Preset => Layer: {}, SoundFont: {}, Bank: {}, Program: {}".format(layer.part_i, sfi, midi_bank, midi_prg))
-		self.proc_cmd("select {} {} {} {}".format(layer.part_i, sfi, midi_bank, midi_prg))
-		layer.send_ctrl_midi_cc()
-		return True
+		return "select {} {} {} {}".format(layer.part_i, sfi, midi_bank, midi_prg)
 
 
 	def cmp_presets(self, preset1, preset2):
@@ -233,7 +313,11 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 
 
 	def load_soundfont(self, sf):
-		if sf not in self.soundfont_index:
+		if sf in self.soundfont_index:
+			# Already loaded (used or pooled) => Most recently used
+			self.soundfont_index.move_to_end(sf)
+			return self.soundfont_index[sf]
+		else:
 			logging.info("Loading SoundFont '{}' ...".format(sf))
 			# Send command to FluidSynth
 			output=self.proc_cmd("load \"{}\"".format(sf))
@@ -250,6 +334,10 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 				logging.info("Loaded SoundFont '{}' => {}".format(sf,sfi))
 				# Insert ID in soundfont_index dictionary
 				self.soundfont_index[sf]=sfi
+				try:
+					self.soundfont_size[sf]=os.path.getsize(sf)
+				except:
+					self.soundfont_size[sf]=0
 				# Return soundfont ID
 				return sfi
 			else:
@@ -257,27 +345,49 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 				return False
 
 
-	def unload_unused_soundfonts(self):
-		#Make a copy of soundfont index and remove used soundfonts
-		sf_unload=copy.copy(self.soundfont_index)
+	# The keep soundfont, usually the one just loaded, is not unloaded
+	def unload_unused_soundfonts(self, keep=None):
+		#Get used soundfonts
+		sf_used=set([keep])
 		for layer in self.layers:
 			bi=layer.bank_info
-			if bi is not None:
-				if bi[2] and bi[0] in sf_unload:
-					#print("Skip "+bi[0]+"("+str(sf_unload[bi[0]])+")")
-					del sf_unload[bi[0]]
-		#Then, remove the remaining ;-)
-		for sf,sfi in sf_unload.items():
+			if bi is not None and bi[2]:
+				sf_used.add(bi[0])
+
+		#Then, remove the least recently used ones until the pool fits in its size ;-)
+		pool_size=self.sf_pool_size*1024*1024
+		total_size=sum(self.soundfont_size.get(sf,0) for sf in self.soundfont_index)
+		cmds=[]
+		for sf,sfi in list(self.soundfont_index.items()):
+			if total_size<=pool_size:
+				break
+			if sf in sf_used:
+				continue
 			logging.info("Unload SoundFont => {}".format(sfi))
-			self.proc_cmd("unload {}".format(sfi))
+			cmds.append("unload {}".format(sfi))
+			total_size-=self.soundfont_size.pop(sf,0)
 			del self.soundfont_index[sf]
+		if cmds:
+			self.proc_cmd_batch(cmds)
 
 
 	# Set presets for all layers to restore soundfont assign (select) after load/unload soundfonts 
 	def set_all_presets(self):
+		cmds=[]
+		layers=[]
 		for layer in self.layers:
 			if layer.preset_info:
-				self.set_preset(layer, layer.preset_info)
+				try:
+					cmds.append(self.get_preset_cmd(layer, layer.preset_info))
+					layers.append(layer)
+				except:
+					# Soundfont not loaded => use the slow path
+					self.set_preset(layer, layer.preset_info)
+
+		if cmds:
+			self.proc_cmd_batch(cmds)
+			for layer in layers:
+				layer.send_ctrl_midi_cc()
 
 
 	def setup_router(self, layer):
@@ -299,27 +409,28 @@ class zynthian_engine_fluidsynth(zynthian_engine):
 
 
 	def set_layer_midi_routes(self, layer):
+		cmds=self.get_layer_midi_routes_cmds(layer)
+		if cmds:
+			self.proc_cmd_batch(cmds)
+
+
+	def get_layer_midi_routes_cmds(self, layer):
+		cmds=[]
 		if layer.part_i is not None:
 			midich = layer.get_midi_chan()
 			router_chan_cmd = "router_chan {0} {0} 0 {1}".format(midich, layer.part_i)
-			self.proc_cmd("router_begin note")
-			self.proc_cmd(router_chan_cmd)
-			self.proc_cmd("router_end")
-			self.proc_cmd("router_begin cc")
-			self.proc_cmd(router_chan_cmd)
-			self.proc_cmd("router_end")
-			self.proc_cmd("router_begin pbend")
-			self.proc_cmd(router_chan_cmd)
-			self.proc_cmd("router_end")
-			self.proc_cmd("router_begin prog")
-			self.proc_cmd(router_chan_cmd)
-			self.proc_cmd("router_end")
+			for rtype in ("note", "cc", "pbend", "prog"):
+				cmds.append("router_begin {}".format(rtype))
+				cmds.append(router_chan_cmd)
+				cmds.append("router_end")
+		return cmds
 
 
 	def set_all_midi_routes(self):
-		self.clear_midi_routes()
+		cmds=["router_clear"]
 		for layer in self.layers:
-			self.set_layer_midi_routes(layer)
+			cmds+=self.get_layer_midi_routes_cmds(layer)
+		self.proc_cmd_batch(cmds)
 
 
 	def clear_midi_routes(self):
@@ -27,6 +27,7 @@ import re
 import json
 import shutil
 import logging
+import threading
 from os.path import isfile
 from collections import OrderedDict
 from subprocess import check_output, STDOUT
@@ -150,11 +151,22 @@ class zynthian_engine_jalv(zynthian_engine):
 
 	zynapi_instance = None
 
+	# Serialize access to lilv world when several instances start concurrently
+	lv2_lock = threading.Lock()
+
+	# plugin_url => (port descriptors, controller options)
+	lv2_zctrl_options_cache = {}
+
+	# Jack names reserved by the running instances, so each one gets a unique name
+	# even when they are started concurrently or before having a layer.
+	jacknames = set()
+	jacknames_lock = threading.Lock()
+
 	#----------------------------------------------------------------------------
 	# Initialization
 	#----------------------------------------------------------------------------
 
-	def __init__(self, plugin_name, plugin_type, zyngui=None, dryrun=False):
+	def __init__(self, plugin_name, plugin_type, zyngui=None, dryrun=False, jackname=None):
 		super().__init__(zyngui)
 
 		self.type = plugin_type
@@ -165,12 +177,17 @@ class zynthian_engine_jalv(zynthian_engine):
 
 		self.learned_cc = [[None for c in range(128)] for chan in range(16)]
 		self.learned_zctrls = {}
+		self.jalv_jackname = None
 
 		if not dryrun:
+			if jackname is None:
+				jackname = self.reserve_jackname(plugin_name)
+			self.jalv_jackname = jackname
+
 			if self.config_remote_display():
-				self.command = ("/usr/local/bin/jalv -n {} {}".format(self.get_jalv_jackname(), self.plugin_url))		#TODO => Is possible to run plugin's UI?
+				self.command = ("/usr/local/bin/jalv -n {} {}".format(self.jalv_jackname, self.plugin_url))		#TODO => Is possible to run plugin's UI?
 			else:
-				self.command = ("/usr/local/bin/jalv -n {} {}".format(self.get_jalv_jackname(), self.plugin_url))
+				self.command = ("/usr/local/bin/jalv -n {} {}".format(self.jalv_jackname, self.plugin_url))
 
 			self.command_prompt = "\n> "
 
@@ -194,11 +211,13 @@ class zynthian_engine_jalv(zynthian_engine):
 
 			# Generate LV2-Plugin Controllers
 			self.lv2_monitors_dict = OrderedDict()
-			self.lv2_zctrl_dict = self.get_lv2_controllers_dict()
+			with self.lv2_lock:
+				self.lv2_zctrl_dict = self.get_lv2_controllers_dict()
 			self.generate_ctrl_screens(self.lv2_zctrl_dict)
 
 		# Get bank & presets info
-		self.preset_info = zynthian_lv2.get_plugin_presets(plugin_name)
+		with self.lv2_lock:
+			self.preset_info = zynthian_lv2.get_plugin_presets(plugin_name)
 
 		self.bank_list = []
 		for bank_label, info in self.preset_info.items():
@@ -212,13 +231,31 @@ class zynthian_engine_jalv(zynthian_engine):
 
 	# Jack, when listing ports, accepts regular expressions as the jack name.
 	# So, for avoiding problems, jack names shouldn't contain regex characters.
-	def get_jalv_jackname(self):
-		try:
-			jname_count = self.zyngui.screens['layer'].get_jackname_count(plugin_name)
-		except:
-			jname_count = 0
+	# The name is reserved until the instance is stopped. If it was taken, JACK
+	# would rename the client and its ports would match the first one's name.
+	@classmethod
+	def reserve_jackname(cls, plugin_name):
+		basename = re.sub("[\_]{2,}","_",re.sub("[\*\(\)\[\]\s]","_",plugin_name))
+		with cls.jacknames_lock:
+			i = 0
+			while "{}-{:02d}".format(basename, i) in cls.jacknames:
+				i += 1
+			jackname = "{}-{:02d}".format(basename, i)
+			cls.jacknames.add(jackname)
+		return jackname
 
-		return "{}-{:02d}".format(re.sub("[\_]{2,}","_",re.sub("[\*\(\)\[\]\s]","_",self.plugin_name)), jname_count)
+
+	@classmethod
+	def release_jackname(cls, jackname):
+		with cls.jacknames_lock:
+			cls.jacknames.discard(jackname)
+
+
+	def stop(self):
+		super().stop()
+		if self.jalv_jackname:
+			self.release_jackname(self.jalv_jackname)
+			self.jalv_jackname = None
 
 	# ---------------------------------------------------------------------------
 	# Layer Management
@@ -296,77 +333,85 @@ class zynthian_engine_jalv(zynthian_engine):
 	def get_lv2_controllers_dict(self):
 		logging.info("Getting Controller List from LV2 Plugin ...")
 
+		# Controller options are shared by all instances of the same plugin
+		descriptors = zynthian_lv2.get_plugin_port_descriptors(self.plugin_url)
+		cached = self.lv2_zctrl_options_cache.get(self.plugin_url)
+		if cached is None or cached[0] is not descriptors:
+			ctrl_options = []
+			for desc in descriptors:
+				try:
+					ctrl_options.append((desc.symbol, desc.label, self.get_lv2_zctrl_options(desc)))
+				#If control info is not OK
+				except Exception as e:
+					logging.error(e)
+			cached = (descriptors, ctrl_options)
+			self.lv2_zctrl_options_cache[self.plugin_url] = cached
+
 		zctrls = OrderedDict()
-		for i, info in zynthian_lv2.get_plugin_ports(self.plugin_url).items():
-			symbol = info['symbol']
-			try:
-				#If there is points info ...
-				if len(info['scale_points'])>1:
-					labels = []
-					values = []
-					for p in info['scale_points']:
-						labels.append(p['label'])
-						values.append(p['value'])
-
-					zctrls[symbol] = zynthian_controller(self, symbol, info['label'], {
-						'graph_path': info['index'],
-						'value': info['value'],
-						'labels': labels,
-						'ticks': values,
-						'value_min': values[0],
-						'value_max': values[-1],
-						'is_toggle': info['is_toggled'],
-						'is_integer': info['is_integer']
-					})
-
-				#If it's a normal controller ...
-				else:
-					r = info['range']['max'] - info['range']['min']
-					if info['is_integer']:
-						if r==1 and info['is_toggled']:
-							if info['value']==0:
-								val = 'off'
-							else:
-								val = 'on'
-
-							zctrls[symbol] = zynthian_controller(self, symbol, info['label'], {
-								'graph_path': info['index'],
-								'value': val,
-								'labels': ['off','on'],
-								'ticks': [0, 1],
-								'value_min': 0,
-								'value_max': 1,
-								'is_toggle': True,
-								'is_integer': True
-							})
-						else:
-							zctrls[symbol] = zynthian_controller(self, symbol, info['label'], {
-								'graph_path': info['index'],
-								'value': int(info['value']),
-								'value_default': int(info['range']['default']),
-								'value_min': int(info['range']['min']),
-								'value_max': int(info['range']['max']),
-								'is_toggle': False,
-								'is_integer': True
-							})
-					else:
-							zctrls[symbol] = zynthian_controller(self, symbol, info['label'], {
-								'graph_path': info['index'],
-								'value': info['value'],
-								'value_default': info['range']['default'],
-								'value_min': info['range']['min'],
-								'value_max': info['range']['max'],
-								'is_toggle': False,
-								'is_integer': False
-							})
-
-			#If control info is not OK
-			except Exception as e:
-				logging.error(e)
+		for symbol, label, options in cached[1]:
+			zctrls[symbol] = zynthian_controller(self, symbol, label, dict(options))
 
 		return zctrls
 
 
+	@staticmethod
+	def get_lv2_zctrl_options(desc):
+		#If there is points info ...
+		if len(desc.scale_points)>1:
+			labels = [p[0] for p in desc.scale_points]
+			values = [p[1] for p in desc.scale_points]
+			return {
+				'graph_path': desc.index,
+				'value': desc.value,
+				'labels': labels,
+				'ticks': values,
+				'value_min': values[0],
+				'value_max': values[-1],
+				'is_toggle': desc.is_toggled,
+				'is_integer': desc.is_integer
+			}
+
+		#If it's a normal controller ...
+		r = desc.value_max - desc.value_min
+		if desc.is_integer:
+			if r==1 and desc.is_toggled:
+				if desc.value==0:
+					val = 'off'
+				else:
+					val = 'on'
+
+				return {
+					'graph_path': desc.index,
+					'value': val,
+					'labels': ['off','on'],
+					'ticks': [0, 1],
+					'value_min': 0,
+					'value_max': 1,
+					'is_toggle': True,
+					'is_integer': True
+				}
+			else:
+				return {
+					'graph_path': desc.index,
+					'value': int(desc.value),
+					'value_default': int(desc.value_default),
+					'value_min': int(desc.value_min),
+					'value_max': int(desc.value_max),
+					'is_toggle': False,
+					'is_integer': True
+				}
+		else:
+			return {
+				'graph_path': desc.index,
+				'value': desc.value,
+				'value_default': desc.value_default,
+				'value_min': desc.value_min,
+				'value_max': desc.value_max,
+				'is_toggle': False,
+				'is_integer': False
+			}
+
+
 	def get_lv2_monitors_dict(self):
 		self.lv2_monitors_dict = OrderedDict()
 		for line in self.proc_cmd("monitors").split("\n"):
@@ -417,6 +462,10 @@ class zynthian_engine_jalv(zynthian_engine):
 	def send_controller_value(self, zctrl):
 		self.proc_cmd("set %d %.6f" % (zctrl.graph_path, zctrl.value))
 
+
+	def send_controller_values(self, zctrls, force_sending=False):
+		self.proc_cmd_batch(["set %d %.6f" % (zctrl.graph_path, zctrl.value) for zctrl in zctrls])
+
 	#----------------------------------------------------------------------------
 	# MIDI learning
 	#----------------------------------------------------------------------------
@@ -432,6 +481,7 @@ class zynthian_engine_jalv(zynthian_engine):
 			try:
 				self.learned_cc[zctrl.midi_learn_chan][zctrl.midi_learn_cc] = None
 				del self.learned_zctrls[zctrl.graph_path]
+				self.refresh_midi_learn()
 				return zctrl._unset_midi_learn()
 			except Exception as e:
 				logging.warning("Can't unlearn => {}".format(e))
@@ -447,6 +497,7 @@ class zynthian_engine_jalv(zynthian_engine):
 			# Add midi learning info
 			self.learned_zctrls[zctrl.graph_path] = zctrl
 			self.learned_cc[chan][cc] = zctrl
+			self.refresh_midi_learn()
 			return zctrl._set_midi_learn(chan, cc)
 		except Exception as e:
 			logging.error("Can't learn {} => {}".format(zctrl.symbol, e))
@@ -456,6 +507,7 @@ class zynthian_engine_jalv(zynthian_engine):
 		logging.info("Reset MIDI-learn ...")
 		self.learned_zctrls = {}
 		self.learned_cc = [[None for chan in range(16)] for cc in range(128)]
+		self.refresh_midi_learn()
 
 
 	def cb_midi_learn(self, zctrl, chan, cc):
@@ -471,6 +523,10 @@ class zynthian_engine_jalv(zynthian_engine):
 		except:
 			pass
 
+
+	def get_midi_control_keys(self):
+		return [(zctrl.midi_learn_chan, zctrl.midi_learn_cc) for zctrl in self.learned_zctrls.values()]
+
 	# ---------------------------------------------------------------------------
 	# API methods
 	# ---------------------------------------------------------------------------
@@ -25,10 +25,12 @@
 import os
 import re
 import glob
+import json
 import logging
 import socket
 import shutil
 from time import sleep
+from threading import Thread, Lock
 from os.path import isfile, isdir
 from subprocess import check_output
 from collections import OrderedDict
@@ -87,6 +89,14 @@ class zynthian_engine_linuxsampler(zynthian_engine):
 		('GIG', zynthian_engine.data_dir + "/soundfonts/gig")
 	]
 
+	# Preset index => bank_dpath => {'dirs': {dpath: mtime}, 'presets': [...]}
+	preset_index = None
+	preset_index_fpath = zynthian_engine.config_dir + "/linuxsampler_presets.json"
+	# Entries from other versions are scanned again
+	preset_index_version = 2
+	preset_index_lock = Lock()
+	preset_index_refreshing = set()
+
 	# ---------------------------------------------------------------------------
 	# Initialization
 	# ---------------------------------------------------------------------------
@@ -108,6 +118,9 @@ class zynthian_engine_linuxsampler(zynthian_engine):
 		self.lscp_get_version()
 		self.reset()
 
+		# Validate preset index while the user is choosing ...
+		self.refresh_preset_index_bg([b[0] for b in self.get_bank_list()])
+
 
 	def reset(self):
 		super().reset()
@@ -261,34 +274,156 @@ class zynthian_engine_linuxsampler(zynthian_engine):
 	# Preset Management
 	# ---------------------------------------------------------------------------
 
-	@staticmethod
-	def _get_preset_list(bank):
+	@classmethod
+	def _get_preset_list(cls, bank, background=False):
+		preset_dpath=bank[0]
+		entry=cls.get_preset_index().get(preset_dpath)
+		if entry and entry.get('version')==cls.preset_index_version:
+			if background:
+				# Quick check of bank's root directory. Full validation in background.
+				try:
+					if os.stat(preset_dpath).st_mtime==entry['dirs'][preset_dpath]:
+						cls.refresh_preset_index_bg([preset_dpath])
+						return entry['presets']
+				except:
+					pass
+			elif cls.is_preset_index_entry_valid(entry):
+				return entry['presets']
+
 		logging.info("Getting Preset List for %s" % bank[2])
+		entry=cls.scan_preset_dir(preset_dpath)
+		if entry['dirs']:
+			cls.update_preset_index(preset_dpath, entry)
+		return entry['presets']
+
+
+	def get_preset_list(self, bank):
+		return self._get_preset_list(bank, True)
+
+
+	@staticmethod
+	def scan_preset_dir(preset_dpath):
+		dirs={}
+		sfz_files=[]
+		gig_files=[]
+
+		# SFZ files up to 3 levels deep, GIG files up to 2 levels
+		def scan(dpath, depth):
+			try:
+				dirs[dpath]=os.stat(dpath).st_mtime
+				with os.scandir(dpath) as it:
+					for entry in it:
+						if entry.is_dir(follow_symlinks=False):
+							if depth<2:
+								scan(entry.path, depth+1)
+						elif entry.is_file(follow_symlinks=False):
+							if entry.name[-4:]==".sfz":
+								sfz_files.append(entry.path)
+							elif entry.name[-4:]==".gig" and depth<2:
+								gig_files.append(entry.path)
+			except Exception as e:
+				logging.warning("Can't scan directory '{}': {}".format(dpath, e))
+
+		if os.path.isdir(preset_dpath):
+			scan(preset_dpath, 0)
+
 		i=0
 		preset_list=[]
-		preset_dpath=bank[0]
-		if os.path.isdir(preset_dpath):
-			exclude_sfz = re.compile(r"[MOPRSTV][1-9]?l?\.sfz")
-			cmd="find '"+preset_dpath+"' -maxdepth 3 -type f -name '*.sfz'"
-			output=check_output(cmd, shell=True).decode('utf8')
-			cmd="find '"+preset_dpath+"' -maxdepth 2 -type f -name '*.gig'"
-			output=output+"\n"+check_output(cmd, shell=True).decode('utf8')
-			lines=output.split('\n')
-			for f in lines:
-				if f:
-					filehead,filetail=os.path.split(f)
-					if not exclude_sfz.fullmatch(filetail):
-						filename,filext=os.path.splitext(f)
-						filename = filename[len(preset_dpath)+1:]
-						title=filename.replace('_', ' ')
-						engine=filext[1:].lower()
-						preset_list.append([f,i,title,engine,"{}.{}".format(filename,filext)])
-						i=i+1
-		return preset_list
+		exclude_sfz = re.compile(r"[MOPRSTV][1-9]?l?\.sfz")
+		for f in sorted(sfz_files) + sorted(gig_files):
+			filehead,filetail=os.path.split(f)
+			if not exclude_sfz.fullmatch(filetail):
+				filename,filext=os.path.splitext(f)
+				filename = filename[len(preset_dpath)+1:]
+				title=filename.replace('_', ' ')
+				engine=filext[1:].lower()
+				preset_list.append([f,i,title,engine,"{}.{}".format(filename,filext)])
+				i=i+1
+
+		return {
+			'version': zynthian_engine_linuxsampler.preset_index_version,
+			'dirs': dirs,
+			'presets': preset_list
+		}
 
 
-	def get_preset_list(self, bank):
-		return self._get_preset_list(bank)
+	@classmethod
+	def get_preset_index(cls):
+		if cls.preset_index is None:
+			with cls.preset_index_lock:
+				try:
+					with open(cls.preset_index_fpath) as f:
+						cls.preset_index=json.load(f)
+				except Exception as e:
+					logging.info("Can't load preset index: {}".format(e))
+					cls.preset_index={}
+		return cls.preset_index
+
+
+	@classmethod
+	def save_preset_index(cls):
+		with cls.preset_index_lock:
+			try:
+				with open(cls.preset_index_fpath,"w") as f:
+					json.dump(cls.preset_index, f, separators=(',',':'))
+			except Exception as e:
+				logging.error("Can't save preset index: {}".format(e))
+
+
+	@classmethod
+	def update_preset_index(cls, preset_dpath, entry, save=True):
+		index=cls.get_preset_index()
+		with cls.preset_index_lock:
+			index[preset_dpath]=entry
+		if save:
+			cls.save_preset_index()
+
+
+	@staticmethod
+	def is_preset_index_entry_valid(entry):
+		try:
+			if entry.get('version')!=zynthian_engine_linuxsampler.preset_index_version:
+				return False
+			for dpath, mtime in entry['dirs'].items():
+				if os.stat(dpath).st_mtime!=mtime:
+					return False
+			return True
+		except:
+			return False
+
+
+	@classmethod
+	def refresh_preset_index_bg(cls, preset_dpaths):
+		with cls.preset_index_lock:
+			preset_dpaths=[d for d in preset_dpaths if d not in cls.preset_index_refreshing]
+			if not preset_dpaths:
+				return
+			cls.preset_index_refreshing.update(preset_dpaths)
+
+		thread=Thread(target=cls.refresh_preset_index, args=(preset_dpaths,), daemon=True)
+		thread.start()
+
+
+	@classmethod
+	def refresh_preset_index(cls, preset_dpaths):
+		try:
+			n=0
+			index=cls.get_preset_index()
+			for preset_dpath in preset_dpaths:
+				entry=index.get(preset_dpath)
+				if not entry or not cls.is_preset_index_entry_valid(entry):
+					entry=cls.scan_preset_dir(preset_dpath)
+					if entry['dirs']:
+						cls.update_preset_index(preset_dpath, entry, False)
+						n+=1
+			if n>0:
+				logging.info("Refreshed {} banks in preset index".format(n))
+				cls.save_preset_index()
+		except Exception as e:
+			logging.error("Can't refresh preset index: {}".format(e))
+		finally:
+			with cls.preset_index_lock:
+				cls.preset_index_refreshing.difference_update(preset_dpaths)
 
 
 	def set_preset(self, layer, preset, preload=False):
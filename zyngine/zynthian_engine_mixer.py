@@ -25,12 +25,18 @@
 import os
 import re
 import shlex
+import select
 import logging
 import threading
 from time import sleep
 from subprocess import check_output
 from collections import OrderedDict
 
+try:
+	import alsaaudio
+except ImportError:
+	alsaaudio = None
+
 from . import zynthian_engine
 from . import zynthian_controller
 
@@ -77,16 +83,27 @@ class zynthian_engine_mixer(zynthian_engine):
 		}
 
 		self.zctrls = None
-		self.sender_poll_enabled = False
+		self.alsa_mixers = None
+		self.sender_thread = None
+		self.sender_event = threading.Event()
+		self.sender_lock = threading.Lock()
+		self.sender_queue = OrderedDict()
+		self.sender_writing = None
+		# symbol => value in ALSA, as read after our last write or external change
+		self.alsa_values = {}
+		# symbol => value changed by others, for the sender to update last_value_sent
+		self.external_values = {}
+		self.monitor_thread = None
 		self.learned_cc = [[None for c in range(128)] for chan in range(16)]
 		self.learned_zctrls = {}
 
 		self.get_soundcard_config()
 
 
-		def stop(self):
-			self.stop_sender_poll()
-			super().stop()
+	def stop(self):
+		self.stop_sender()
+		self.stop_monitor()
+		super().stop()
 
 
 	# ---------------------------------------------------------------------------
@@ -132,8 +149,6 @@ class zynthian_engine_mixer(zynthian_engine):
 	#----------------------------------------------------------------------------
 
 	def get_controllers_dict(self, layer, ctrl_list=None):
-		zctrls = OrderedDict()
-
 		if ctrl_list=="*":
 			ctrl_list = None
 		elif ctrl_list is None:
@@ -141,7 +156,44 @@ class zynthian_engine_mixer(zynthian_engine):
 
 		logging.debug("MIXER CTRL LIST: {}".format(ctrl_list))
 
-		self.stop_sender_poll()
+		self.stop_sender()
+		self.stop_monitor()
+
+		# Try native ALSA mixer API. If not available, fallback to amixer
+		zctrls = None
+		if alsaaudio:
+			try:
+				zctrls = self.get_alsa_controllers(ctrl_list)
+			except Exception as err:
+				logging.warning("Can't use native ALSA mixer, using amixer => {}".format(err))
+		if zctrls is None:
+			self.alsa_mixers = None
+			zctrls = self.get_amixer_controllers(ctrl_list)
+
+		# Sort zctrls to match the configured mixer control list
+		if ctrl_list and len(ctrl_list)>0:
+			sorted_zctrls = OrderedDict()
+			for ctrl_name in ctrl_list:
+				ctrl_symbol = ctrl_name.replace(' ', '_')
+				try:
+					sorted_zctrls[ctrl_symbol] = zctrls[ctrl_symbol]
+				except:
+					pass
+		else:
+			sorted_zctrls = zctrls
+
+		# Generate control screens
+		self.generate_ctrl_screens(sorted_zctrls)
+
+		self.zctrls = sorted_zctrls
+		self.start_sender()
+		self.start_monitor()
+
+		return sorted_zctrls
+
+
+	def get_amixer_controllers(self, ctrl_list):
+		zctrls = OrderedDict()
 
 		try:
 			ctrls = check_output("amixer -M -c {}".format(self.device_name), shell=True).decode("utf-8").split("Simple mixer control ")
@@ -260,32 +312,147 @@ class zynthian_engine_mixer(zynthian_engine):
 		except Exception as err:
 			logging.error(err)
 
-		# Sort zctrls to match the configured mixer control list
-		if ctrl_list and len(ctrl_list)>0:
-			sorted_zctrls = OrderedDict()
-			for ctrl_name in ctrl_list:
-				ctrl_symbol = ctrl_name.replace(' ', '_')
-				try:
-					sorted_zctrls[ctrl_symbol] = zctrls[ctrl_symbol]
-				except:
-					pass
-		else:
-			sorted_zctrls = zctrls
+		return zctrls
 
-		# Generate control screens
-		self.generate_ctrl_screens(sorted_zctrls)
 
-		self.zctrls = sorted_zctrls
-		self.start_sender_poll()
+	def get_alsa_controllers(self, ctrl_list):
+		zctrls = OrderedDict()
+		self.alsa_mixers = {}
+		device = "hw:{}".format(self.device_name)
+
+		for ctrl_name in alsaaudio.mixers(device=device):
+			ctrl_symbol = ctrl_name.replace(' ', '_')
+			# Only first index, like amixer does when setting by name
+			if ctrl_symbol in self.alsa_mixers or (ctrl_list and ctrl_name not in ctrl_list):
+				continue
+
+			mixer = alsaaudio.Mixer(ctrl_name, device=device)
+			vcaps = mixer.volumecap()
+			scaps = mixer.switchcap()
+			enum = mixer.getenum()
+
+			if enum:
+				ctrl_type = "Selector"
+				pcm = None
+			elif 'Volume' in vcaps or 'Playback Volume' in vcaps:
+				ctrl_type = "Playback"
+				pcm = alsaaudio.PCM_PLAYBACK
+			elif 'Capture Volume' in vcaps:
+				ctrl_type = "Capture"
+				pcm = alsaaudio.PCM_CAPTURE
+			elif 'Mute' in scaps or 'Playback Mute' in scaps:
+				ctrl_type = "Toggle"
+				pcm = alsaaudio.PCM_PLAYBACK
+			elif 'Capture Mute' in scaps:
+				ctrl_type = "Toggle"
+				pcm = alsaaudio.PCM_CAPTURE
+			else:
+				continue
+
+			if ctrl_type in ("Playback", "Capture") and tuple(mixer.getrange(pcm))==(0, 1):
+				ctrl_type = "VToggle"
+
+			self.alsa_mixers[ctrl_symbol] = (mixer, pcm)
+
+			if ctrl_type=="Selector":
+				ctrl_items = list(enum[1])
+				ctrl_ticks = list(range(len(ctrl_items)))
+			elif ctrl_type=="Toggle":
+				ctrl_items = ["off", "on"]
+				ctrl_ticks = [0, 1]
+			elif ctrl_type=="VToggle":
+				ctrl_items = ["off", "on"]
+				ctrl_ticks = [0, 100]
+			else:
+				ctrl_items = None
 
-		return sorted_zctrls
+			if ctrl_items:
+				if len(ctrl_items)<2:
+					continue
+				zctrl = zynthian_controller(self, ctrl_symbol, ctrl_name, {
+					'graph_path': [ctrl_name, ctrl_type],
+					'labels': ctrl_items,
+					'ticks': ctrl_ticks,
+					'value_min': ctrl_ticks[0],
+					'value_max': ctrl_ticks[-1],
+					'is_toggle': (ctrl_type=='Toggle'),
+					'is_integer': True
+				})
+			else:
+				zctrl = zynthian_controller(self, ctrl_symbol, ctrl_name, {
+					'graph_path': [ctrl_name, ctrl_type],
+					'value_min': 0,
+					'value_max': 100,
+					'is_toggle': False,
+					'is_integer': True
+				})
+
+			zctrl._set_value(self.get_alsa_value(zctrl))
+			zctrl.last_value_sent = zctrl.value
+			self.alsa_values[ctrl_symbol] = zctrl.value
+			zctrls[ctrl_symbol] = zctrl
+
+		return zctrls
+
+
+	def get_alsa_value(self, zctrl):
+		mixer, pcm = self.alsa_mixers[zctrl.symbol]
+		ctrl_type = zctrl.graph_path[1]
+		if ctrl_type=="Selector":
+			return mixer.getenum()[0]
+		elif ctrl_type=="Toggle":
+			if pcm==alsaaudio.PCM_PLAYBACK:
+				return "off" if mixer.getmute()[0] else "on"
+			else:
+				return "on" if mixer.getrec()[0] else "off"
+		elif ctrl_type=="VToggle":
+			return 100 if mixer.getvolume(pcm)[0]>0 else 0
+		else:
+			return mixer.getvolume(pcm)[0]
+
+
+	def set_alsa_value(self, zctrl):
+		mixer, pcm = self.alsa_mixers[zctrl.symbol]
+		ctrl_type = zctrl.graph_path[1]
+		if ctrl_type=="Selector":
+			mixer.setenum(zctrl.labels.index(zctrl.get_value2label()))
+		elif ctrl_type=="Toggle":
+			on = (zctrl.get_value2label()=="on")
+			if pcm==alsaaudio.PCM_PLAYBACK:
+				mixer.setmute(0 if on else 1)
+			else:
+				mixer.setrec(1 if on else 0)
+		else:
+			mixer.setvolume(int(zctrl.value), pcmtype=pcm)
+			if ctrl_type!="VToggle":
+				# Unmute, if the control has a switch
+				try:
+					if pcm==alsaaudio.PCM_PLAYBACK:
+						mixer.setmute(0)
+					else:
+						mixer.setrec(1)
+				except alsaaudio.ALSAAudioError:
+					pass
 
 
 	def send_controller_value(self, zctrl):
-		pass
+		# Queue value, so fast changes on the same control are coalesced
+		with self.sender_lock:
+			self.sender_queue[zctrl.symbol] = zctrl
+		self.sender_event.set()
 
 
 	def _send_controller_value(self, zctrl):
+		if self.alsa_mixers is not None:
+			try:
+				self.set_alsa_value(zctrl)
+			except Exception as err:
+				logging.error(err)
+		else:
+			self._send_controller_value_amixer(zctrl)
+
+
+	def _send_controller_value_amixer(self, zctrl):
 		try:
 			if zctrl.labels:
 				if zctrl.graph_path[1]=="VToggle":
@@ -303,27 +470,103 @@ class zynthian_engine_mixer(zynthian_engine):
 			logging.error(err)
 
 
-	def start_sender_poll(self):
+	def start_sender(self):
+		if not self.sender_thread:
+			self.sender_thread = threading.Thread(target=self.sender_task, daemon=True)
+			self.sender_thread.start()
 
-		def runInThread():
-			while self.sender_poll_enabled:
-				counter = 0
-				if self.zctrls:
-					for sym, zctrl in self.zctrls.items():
-						if zctrl.last_value_sent != zctrl.value:
-							zctrl.last_value_sent = zctrl.value
-							self._send_controller_value(zctrl)
-							counter += 1
 
-				if counter==0:
-					sleep(0.05)
+	def stop_sender(self):
+		self.sender_thread = None
+		self.sender_event.set()
 
-		thread = threading.Thread(target=runInThread, daemon=True)
-		thread.start()
 
+	def sender_task(self):
+		thread = threading.current_thread()
+		while self.sender_thread==thread:
+			self.sender_event.wait()
+			self.sender_event.clear()
 
-	def stop_sender_poll(self):
-		self.sender_poll_enabled = True
+			with self.sender_lock:
+				queue = self.sender_queue
+				self.sender_queue = OrderedDict()
+				external = self.external_values
+				self.external_values = {}
+
+			# last_value_sent is only touched from this thread
+			for symbol, value in external.items():
+				self.zctrls[symbol].last_value_sent = value
+
+			for symbol, zctrl in queue.items():
+				value = zctrl.value
+				if zctrl.last_value_sent != value:
+					zctrl.last_value_sent = value
+					with self.sender_lock:
+						self.sender_writing = symbol
+					self._send_controller_value(zctrl)
+					# Read it back, so the monitor can tell our own changes,
+					# rounding included, from external ones.
+					try:
+						readback = self.get_alsa_value(zctrl) if self.alsa_mixers else value
+					except:
+						readback = value
+					with self.sender_lock:
+						self.alsa_values[symbol] = readback
+						self.sender_writing = None
+
+
+	# Get external changes from ALSA mixer events (native backend only)
+	def start_monitor(self):
+		if self.alsa_mixers and not self.monitor_thread:
+			self.monitor_thread = threading.Thread(target=self.monitor_task, daemon=True)
+			self.monitor_thread.start()
+
+
+	def stop_monitor(self):
+		self.monitor_thread = None
+
+
+	def monitor_task(self):
+		thread = threading.current_thread()
+		poller = select.poll()
+		fd_symbols = {}
+		for symbol, mixer_info in self.alsa_mixers.items():
+			for fd, mask in mixer_info[0].polldescriptors():
+				poller.register(fd, mask)
+				fd_symbols[fd] = symbol
+
+		while self.monitor_thread==thread:
+			for fd, event in poller.poll(500):
+				try:
+					symbol = fd_symbols[fd]
+					self.alsa_mixers[symbol][0].handleevents()
+					self.refresh_controller_value(self.zctrls[symbol])
+				except Exception as err:
+					logging.debug("Mixer event => {}".format(err))
+
+
+	def refresh_controller_value(self, zctrl):
+		symbol = zctrl.symbol
+		value = self.get_alsa_value(zctrl)
+		with self.sender_lock:
+			# Ignore the echo of our own writes and controls with a value
+			# waiting to be written, that would be overwritten anyway.
+			if symbol in self.sender_queue or symbol==self.sender_writing or value==self.alsa_values.get(symbol):
+				return
+			self.alsa_values[symbol] = value
+			self.external_values[symbol] = value
+		self.sender_event.set()
+
+		if value!=zctrl.value:
+			zctrl._set_value(value)
+			logging.debug("Mixer control '{}' changed => {}".format(symbol, value))
+
+			#Refresh GUI controller in screen when needed ...
+			try:
+				if self.zyngui.screens['control'].mode=='control':
+					self.zyngui.screens['control'].set_controller_value(zctrl)
+			except:
+				pass
 
 
 	#----------------------------------------------------------------------------
@@ -341,6 +584,7 @@ class zynthian_engine_mixer(zynthian_engine):
 			try:
 				self.learned_cc[zctrl.midi_learn_chan][zctrl.midi_learn_cc] = None
 				del self.learned_zctrls[str(zctrl.graph_path)]
+				self.refresh_midi_learn()
 				return zctrl._unset_midi_learn()
 			except Exception as e:
 				logging.warning("Can't unlearn => {}".format(e))
@@ -356,6 +600,7 @@ class zynthian_engine_mixer(zynthian_engine):
 			# Add midi learning info
 			self.learned_zctrls[str(zctrl.graph_path)] = zctrl
 			self.learned_cc[chan][cc] = zctrl
+			self.refresh_midi_learn()
 			return zctrl._set_midi_learn(chan, cc)
 		except Exception as e:
 			logging.error("Can't learn {} => {}".format(zctrl.symbol, e))
@@ -365,6 +610,7 @@ class zynthian_engine_mixer(zynthian_engine):
 		logging.info("Reset MIDI-learn ...")
 		self.learned_zctrls = {}
 		self.learned_cc = [[None for chan in range(16)] for cc in range(128)]
+		self.refresh_midi_learn()
 
 
 	def cb_midi_learn(self, zctrl, chan, cc):
@@ -388,6 +634,13 @@ class zynthian_engine_mixer(zynthian_engine):
 				pass
 
 
+	def get_midi_control_keys(self):
+		if self.zyngui.is_single_active_channel():
+			return [(ch, zctrl.midi_learn_cc) for zctrl in self.learned_zctrls.values() for ch in range(16)]
+		else:
+			return [(zctrl.midi_learn_chan, zctrl.midi_learn_cc) for zctrl in self.learned_zctrls.values()]
+
+
 	# ---------------------------------------------------------------------------
 	# Layer "Path" String
 	# ---------------------------------------------------------------------------
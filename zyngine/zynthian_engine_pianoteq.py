@@ -31,6 +31,7 @@ import shutil
 import struct
 import logging
 import subprocess
+import urllib.request
 from collections import defaultdict
 from os.path import isfile,isdir,join
 from xml.etree import ElementTree
@@ -181,6 +182,7 @@ PIANOTEQ_DATA_DIR = os.path.expanduser("~")  + '/.local/share/Modartt/Pianoteq'
 PIANOTEQ_ADDON_DIR = PIANOTEQ_DATA_DIR + '/Addons'
 PIANOTEQ_MY_PRESETS_DIR = PIANOTEQ_DATA_DIR + '/Presets'
 PIANOTEQ_MIDIMAPPINGS_DIR = PIANOTEQ_DATA_DIR + '/MidiMappings'
+PIANOTEQ_RPC_ADDR = os.environ.get('PIANOTEQ_RPC_ADDR',"127.0.0.1:8081")
 
 try:
 	PIANOTEQ_VERSION=list(map(int, os.environ.get('PIANOTEQ_VERSION').split(".")))
@@ -342,6 +344,11 @@ class zynthian_engine_pianoteq(zynthian_engine):
 	user_presets_dpath = PIANOTEQ_MY_PRESETS_DIR
 	user_presets_flist = None
 
+	# Time (seconds) for loading a preset by program change, before sending controllers.
+	# Pianoteq gives no signal when it's done, so the old delay is kept. With JSON-RPC,
+	# loadPreset returns when the preset is loaded and no delay is needed.
+	preset_settle_time = 1
+
 	#----------------------------------------------------------------------------
 	# Initialization
 	#----------------------------------------------------------------------------
@@ -371,6 +378,17 @@ class zynthian_engine_pianoteq(zynthian_engine):
 			else:
 				self.base_command = PIANOTEQ_BINARY + " --headless --multicore max"
 
+		# Pianoteq>=7 can load presets using its JSON-RPC server => No restart when changing MIDI-mapping
+		if PIANOTEQ_VERSION[0]>=7:
+			self.rpc_url = "http://{}/jsonrpc".format(PIANOTEQ_RPC_ADDR)
+			self.rpc_id = 0
+			self.base_command += " --serve {}".format(PIANOTEQ_RPC_ADDR)
+		else:
+			self.rpc_url = None
+
+		# Preset switching time stats => mode: [count, total, max]
+		self.preset_switch_stats = {}
+
 		# Create & fix Pianoteq config
 		if not os.path.isfile(PIANOTEQ_CONFIG_FILE):
 			logging.debug("Pianoteq configuration does not exist. Creating one...")
@@ -605,11 +623,19 @@ class zynthian_engine_pianoteq(zynthian_engine):
 
 
 	def set_preset(self, layer, preset, preload=False):
+		ts = time.monotonic()
 		mm = "Zynthian-{}".format(preset[3])
-		if mm == self.midimapping:
+		if self.proc and self.rpc_url and self.rpc_load_preset(preset):
+			self.preset = preset[0]
+			# Keep the MIDI-mapping in sync with the preset, as the other paths do
+			if preset[3] is not None and mm!=self.midimapping and self.rpc_load_midimapping(mm):
+				self.midimapping = mm
+			mode = "rpc"
+		elif mm == self.midimapping:
 			super().set_preset(layer,preset,preload)
 			self.preset = preset[0]
-			time.sleep(1)
+			time.sleep(self.preset_settle_time)
+			mode = "program change"
 		else:
 			self.midimapping=mm
 			self.preset=preset[0]
@@ -619,11 +645,84 @@ class zynthian_engine_pianoteq(zynthian_engine):
 			self.stop()
 			self.start()
 			self.zyngui.zynautoconnect()
+			mode = "restart"
 
 		layer.send_ctrl_midi_cc()
+		self.add_preset_switch_time(mode, time.monotonic() - ts)
 		return True
 
 
+	def add_preset_switch_time(self, mode, dt):
+		logging.info("Pianoteq preset switch by {} took {:.1f} ms".format(mode, dt*1000))
+		try:
+			stats = self.preset_switch_stats[mode]
+			stats[0] += 1
+			stats[1] += dt
+			stats[2] = max(stats[2], dt)
+		except KeyError:
+			self.preset_switch_stats[mode] = [1, dt, dt]
+
+
+	def get_preset_switch_report(self):
+		res = {}
+		for mode, stats in self.preset_switch_stats.items():
+			res[mode] = {
+				'count': stats[0],
+				'avg_ms': 1000*stats[1]/stats[0],
+				'max_ms': 1000*stats[2]
+			}
+		return res
+
+
+	#----------------------------------------------------------------------------
+	# JSON-RPC (Pianoteq>=7)
+	#----------------------------------------------------------------------------
+
+	def rpc_call(self, method, params=None):
+		self.rpc_id += 1
+		req = {
+			'jsonrpc': "2.0",
+			'method': method,
+			'id': self.rpc_id
+		}
+		if params is not None:
+			req['params'] = params
+
+		data = bytes(JSONEncoder().encode(req), "utf8")
+		request = urllib.request.Request(self.rpc_url, data=data, headers={'Content-Type': "application/json"})
+		with urllib.request.urlopen(request, timeout=2) as response:
+			res = JSONDecoder().decode(response.read().decode("utf-8"))
+
+		if res.get('error'):
+			raise Exception(res['error'])
+		return res.get('result')
+
+
+	def rpc_load_preset(self, preset):
+		# User presets store their bank (directory) in the 5th field. Internal presets have no bank.
+		try:
+			dbank = preset[4]
+			params = { 'name': preset[0][len(dbank)+1:], 'bank': dbank }
+		except IndexError:
+			params = { 'name': preset[0], 'bank': "" }
+
+		try:
+			self.rpc_call("loadPreset", params)
+			return True
+		except Exception as e:
+			logging.warning("Can't load Pianoteq preset '{}' using JSON-RPC: {}".format(preset[0], e))
+			return False
+
+
+	def rpc_load_midimapping(self, mm):
+		try:
+			self.rpc_call("loadMidiMapping", { 'name': mm })
+			return True
+		except Exception as e:
+			logging.warning("Can't load Pianoteq MIDI-mapping '{}' using JSON-RPC: {}".format(mm, e))
+			return False
+
+
 	def cmp_presets(self, preset1, preset2):
 		try:
 			if preset1[0]==preset2[0] and preset1[2]==preset2[2]:
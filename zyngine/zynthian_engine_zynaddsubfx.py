@@ -25,12 +25,12 @@
 import os
 import re
 import logging
-import liblo
 import shutil
 from time import sleep
 from os.path import isfile, join
 from subprocess import check_output
 from . import zynthian_engine
+from .zynthian_osc_sender import zynthian_osc_sender
 
 #------------------------------------------------------------------------------
 # ZynAddSubFX Engine Class
@@ -132,8 +132,11 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 		self.current_slot_zctrl = None
 		self.slot_zctrls = {}
 
+		self.osc_sender = None
+
 		self.start()
 		self.osc_init()
+		self.osc_sender = zynthian_osc_sender(self.osc_target)
 		self.reset()
 		
 		
@@ -141,6 +144,20 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 		super().reset()
 		self.disable_all_parts()
 
+
+	def start(self):
+		output = super().start()
+		# Restart the OSC sender if the engine was stopped
+		if self.osc_sender:
+			self.osc_sender.start(self.osc_target)
+		return output
+
+
+	def stop(self):
+		if self.osc_sender:
+			self.osc_sender.stop()
+		super().stop()
+
 	# ---------------------------------------------------------------------------
 	# Layer Management
 	# ---------------------------------------------------------------------------
@@ -164,7 +181,7 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 
 	def set_midi_chan(self, layer):
 		if layer.part_i is not None:
-			liblo.send(self.osc_target, "/part%d/Prcvchn" % layer.part_i, layer.get_midi_chan())
+			self.osc_sender.set("/part%d/Prcvchn" % layer.part_i, layer.get_midi_chan())
 
 	#----------------------------------------------------------------------------
 	# Bank Managament
@@ -208,19 +225,19 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 		self.start_loading()
 		if preset[3]=='xiz':
 			self.enable_part(layer)
-			liblo.send(self.osc_target, "/load-part",layer.part_i,preset[0])
+			self.osc_sender.send("/load-part",layer.part_i,preset[0])
 			#logging.debug("OSC => /load-part %s, %s" % (layer.part_i,preset[0]))
 		elif preset[3]=='xmz':
 			self.enable_part(layer)
-			liblo.send(self.osc_target, "/load_xmz",preset[0])
+			self.osc_sender.send("/load_xmz",preset[0])
 			logging.debug("OSC => /load_xmz %s" % preset[0])
 		elif preset[3]=='xsz':
-			liblo.send(self.osc_target, "/load_xsz",preset[0])
+			self.osc_sender.send("/load_xsz",preset[0])
 			logging.debug("OSC => /load_xsz %s" % preset[0])
 		elif preset[3]=='xlz':
-			liblo.send(self.osc_target, "/load_xlz",preset[0])
+			self.osc_sender.send("/load_xlz",preset[0])
 			logging.debug("OSC => /load_xlz %s" % preset[0])
-		liblo.send(self.osc_target, "/volume")
+		self.osc_sender.send("/volume")
 		i=0
 		while self.loading and i<100: 
 			sleep(0.1)
@@ -255,12 +272,12 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 
 	def enable_part(self, layer):
 		if layer.part_i is not None:
-			liblo.send(self.osc_target, "/part%d/Penabled" % layer.part_i, True)
-			liblo.send(self.osc_target, "/part%d/Prcvchn" % layer.part_i, layer.get_midi_chan())
+			self.osc_sender.set("/part%d/Penabled" % layer.part_i, True)
+			self.osc_sender.set("/part%d/Prcvchn" % layer.part_i, layer.get_midi_chan())
 
 
 	def disable_part(self, i):
-		liblo.send(self.osc_target, "/part%d/Penabled" % i, False)
+		self.osc_sender.set("/part%d/Penabled" % i, False)
 
 
 	def enable_layer_parts(self):
@@ -291,6 +308,20 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 	def cb_osc_load_preset(self, path, args):
 		self.stop_loading()
 
+	#----------------------------------------------------------------------------
+	# Controllers Managament
+	#----------------------------------------------------------------------------
+
+	def send_controller_values(self, zctrls, force_sending=False):
+		if not force_sending:
+			return
+		for zctrl in zctrls:
+			if zctrl.osc_path:
+				self.osc_sender.set(zctrl.osc_path, zctrl.get_ctrl_osc_val())
+			else:
+				zctrl.send_value(force_sending)
+		self.osc_sender.flush()
+
 	#----------------------------------------------------------------------------
 	# MIDI learning
 	#----------------------------------------------------------------------------
@@ -301,9 +332,9 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 			logging.info("Learning '%s' ..." % zctrl.osc_path)
 			self.current_slot_zctrl = zctrl
 			# Start MIDI learning for osc_path in a new slot
-			liblo.send(self.osc_target, "/automate/learn-binding-new-slot", zctrl.osc_path)
+			self.osc_sender.send("/automate/learn-binding-new-slot", zctrl.osc_path)
 			# Get slot number
-			liblo.send(self.osc_target, "/automate/active-slot")
+			self.osc_sender.send("/automate/active-slot")
 			# Setup CB method for param change
 			self.osc_server.add_method(zctrl.osc_path, 'i', self.cb_osc_param_change)
 
@@ -313,7 +344,7 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 			logging.info("Unlearning '%s' ..." % zctrl.osc_path)
 			try:
 				del self.slot_zctrls[zctrl.osc_path]
-				liblo.send(self.osc_target, "/automate/slot%d/clear" % zctrl.slot_i)
+				self.osc_sender.send("/automate/slot%d/clear" % zctrl.slot_i)
 				self.osc_server.del_method(zctrl.osc_path, 'i')
 				logging.info("Automate Slot %d Cleared => %s" % (zctrl.slot_i, zctrl.osc_path))
 				zctrl.slot_i = None
@@ -341,7 +372,7 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 
 	def reset_midi_learn(self):
 		logging.info("Reset MIDI-learn ...")
-		liblo.send(self.osc_target, "/automate/clear", "*")
+		self.osc_sender.send("/automate/clear", "*")
 		self.current_slot_zctrl=None
 		self.slot_zctrls={}
 
@@ -357,23 +388,23 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 			# set_midi_learn
 			if self.current_slot_zctrl.midi_learn_cc is not None:
 				zcc = (self.current_slot_zctrl.midi_learn_chan * 128) + self.current_slot_zctrl.midi_learn_cc
-				liblo.send(self.osc_target, "/automate/slot%d/learning" % slot_i, 0)
-				liblo.send(self.osc_target, "/automate/slot%d/active" % slot_i, True)
+				self.osc_sender.set("/automate/slot%d/learning" % slot_i, 0)
+				self.osc_sender.set("/automate/slot%d/active" % slot_i, True)
 				#sleep(0.05)
-				liblo.send(self.osc_target, "/automate/slot%d/name" % slot_i, self.current_slot_zctrl.symbol)
+				self.osc_sender.set("/automate/slot%d/name" % slot_i, self.current_slot_zctrl.symbol)
 				#logging.debug("OSC send => /automate/slot%d/name '%s'" % (slot_i, self.current_slot_zctrl.symbol))
-				liblo.send(self.osc_target, "/automate/slot%d/midi-cc" % slot_i, zcc)
+				self.osc_sender.set("/automate/slot%d/midi-cc" % slot_i, zcc)
 				#logging.debug("OSC send => /automate/slot%d/midi-cc %d" % (slot_i, zcc))
-				liblo.send(self.osc_target, "/automate/slot%d/param0/active" % slot_i, True)
-				liblo.send(self.osc_target, "/automate/slot%d/param0/used" % slot_i, True)
-				liblo.send(self.osc_target, "/automate/slot%d/param0/path" % slot_i, self.current_slot_zctrl.osc_path)
+				self.osc_sender.set("/automate/slot%d/param0/active" % slot_i, True)
+				self.osc_sender.set("/automate/slot%d/param0/used" % slot_i, True)
+				self.osc_sender.set("/automate/slot%d/param0/path" % slot_i, self.current_slot_zctrl.osc_path)
 				logging.debug("Automate Slot %d SET: %s => %d" % (slot_i, self.current_slot_zctrl.osc_path, zcc))
 				self.current_slot_zctrl=None
 			# midi_learn
 			else:
 				# Send twice for get it working when re-learning ...
-				liblo.send(self.osc_target, "/automate/slot%d/clear" % slot_i)
-				liblo.send(self.osc_target, "/automate/learn-binding-new-slot", self.current_slot_zctrl.osc_path)
+				self.osc_sender.send("/automate/slot%d/clear" % slot_i)
+				self.osc_sender.send("/automate/learn-binding-new-slot", self.current_slot_zctrl.osc_path)
 
 
 	def cb_osc_param_change(self, path, args):
@@ -390,7 +421,7 @@ class zynthian_engine_zynaddsubfx(zynthian_engine):
 				pass
 
 			if zctrl.midi_learn_cc is None:
-				liblo.send(self.osc_target, "/automate/slot%d/midi-cc" % zctrl.slot_i)
+				self.osc_sender.send("/automate/slot%d/midi-cc" % zctrl.slot_i)
 
 
 	def cb_osc_automate_slot_midi_cc(self, path, args, types, src):
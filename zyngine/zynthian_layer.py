@@ -24,9 +24,11 @@
 
 import logging
 import copy
-from time import sleep
+from time import monotonic
 from collections import OrderedDict
 
+from .zynthian_controller import zynthian_controller
+
 class zynthian_layer:
 
 	# ---------------------------------------------------------------------------
@@ -59,12 +61,19 @@ class zynthian_layer:
 		self.preload_info = None
 
 		self.controllers_dict = None
+		self.ctrl_cc_map = {}
 		self.ctrl_screens_dict = None
 		self.active_screen_index = -1
 
 		self.listen_midi_cc = True
 		self.refresh_flag = False
 
+		# Name => index lookup tables for bank & preset lists
+		self.bank_name_index = (None, 0, {})
+		self.preset_name_index = (None, 0, {})
+
+		self.zs3_recall_stats = [0, 0, 0]
+		self.zs3_last_recall = None
 		self.reset_zs3()
 
 		self.engine.add_layer(self)
@@ -108,6 +117,11 @@ class zynthian_layer:
 		self.engine.set_midi_chan(self)
 		for zctrl in self.controllers_dict.values():
 			zctrl.set_midi_chan(midi_chan)
+		self.refresh_ctrl_cc_map()
+		try:
+			self.zyngui.screens['layer'].invalidate_zs3_plans()
+		except:
+			pass
 
 
 	def get_midi_chan(self):
@@ -122,6 +136,7 @@ class zynthian_layer:
 	def load_bank_list(self):
 		self.bank_list=self.engine.get_bank_list(self)
 		logging.debug("BANK LIST => \n%s" % str(self.bank_list))
+		self.engine.get_preset_search().index_engine_bg(self.engine, self)
 
 
 	def reset_bank(self):
@@ -147,12 +162,42 @@ class zynthian_layer:
 		return False
 
 
-	#TODO Optimize search!!
 	def set_bank_by_name(self, bank_name, set_engine=True):
+		i = self.get_bank_index_by_name(bank_name)
+		if i is not None:
+			return self.set_bank(i,set_engine)
+		return False
+
+
+	def get_bank_index_by_name(self, bank_name):
+		self.bank_name_index = self.get_name_index(self.bank_list, self.bank_name_index)
+		i = self.bank_name_index[2].get(bank_name)
+		if i is not None and i<len(self.bank_list) and self.bank_list[i][2]==bank_name:
+			return i
+		# Stale index => linear search
 		for i in range(len(self.bank_list)):
 			if bank_name==self.bank_list[i][2]:
-				return self.set_bank(i,set_engine)
-		return False
+				return i
+		return None
+
+
+	# Name => index table for a bank or preset list, rebuilt when the list
+	# object or its length changes. Favourite marks are stripped from names
+	# and the first item wins, like in a linear search.
+	@staticmethod
+	def get_name_index(item_list, name_index):
+		if name_index[0] is item_list and name_index[1]==len(item_list):
+			return name_index
+		names = {}
+		for i, item in enumerate(item_list):
+			try:
+				name = item[2]
+				if name[0]=='*':
+					name = name[1:]
+				names.setdefault(name, i)
+			except:
+				pass
+		return (item_list, len(item_list), names)
 
 
 	#TODO Optimize search!!
@@ -195,6 +240,9 @@ class zynthian_layer:
 		self.preset_list = preset_list
 		logging.debug("PRESET LIST => \n%s" % str(self.preset_list))
 
+		if not only_favs:
+			self.engine.get_preset_search().add_presets(self.engine.nickname, self.bank_name, preset_list)
+
 
 	def reset_preset(self):
 		logging.debug("PRESET RESET!")
@@ -250,19 +298,31 @@ class zynthian_layer:
 		return False
 
 
-	#TODO Optimize search!!
 	def set_preset_by_name(self, preset_name, set_engine=True):
+		i = self.get_preset_index_by_name(preset_name)
+		if i is not None:
+			return self.set_preset(i,set_engine)
+		return False
+
+
+	def get_preset_index_by_name(self, preset_name):
+		self.preset_name_index = self.get_name_index(self.preset_list, self.preset_name_index)
+		i = self.preset_name_index[2].get(preset_name)
+		if i is not None and i<len(self.preset_list):
+			name_i = self.preset_list[i][2]
+			if name_i==preset_name or name_i=='*'+preset_name:
+				return i
+		# Stale index => linear search
 		for i in range(len(self.preset_list)):
 			name_i=self.preset_list[i][2]
 			try:
 				if name_i[0]=='*':
 					name_i=name_i[1:]
 				if preset_name==name_i:
-					return self.set_preset(i,set_engine)
+					return i
 			except:
 				pass
-
-		return False
+		return None
 
 
 	#TODO Optimize search!!
@@ -325,6 +385,25 @@ class zynthian_layer:
 
 	def init_controllers(self):
 		self.controllers_dict=self.engine.get_controllers_dict(self)
+		self.refresh_ctrl_cc_map()
+
+
+	# Build (chan, cc) => [zctrl] index, used for fast MIDI-CC dispatching
+	def refresh_ctrl_cc_map(self):
+		self.ctrl_cc_map = {}
+		if self.midi_chan is not None:
+			for zctrl in self.controllers_dict.values():
+				if zctrl.midi_cc is not None and not isinstance(zctrl.midi_cc, str):
+					key = (self.midi_chan, zctrl.midi_cc)
+					try:
+						self.ctrl_cc_map[key].append(zctrl)
+					except:
+						self.ctrl_cc_map[key] = [zctrl]
+		# The GUI dispatch map depends on this one
+		try:
+			self.zyngui.screens['layer'].invalidate_ctrl_cc_map()
+		except:
+			pass
 
 
 	# Create controller screens from zynthian controller keys
@@ -385,10 +464,9 @@ class zynthian_layer:
 
 	def midi_control_change(self, chan, ccnum, ccval):
 		if self.engine:
-			if self.listen_midi_cc and chan==self.midi_chan:
-				#TODO => Optimize!!
-				for k, zctrl in self.controllers_dict.items():
-					if zctrl.midi_cc==ccnum:
+			if self.listen_midi_cc:
+				if chan==self.midi_chan:
+					for zctrl in self.ctrl_cc_map.get((chan, ccnum), ()):
 						try:
 							# Aeolus, FluidSynth, LinuxSampler, puredata, Pianoteq, setBfree, ZynAddSubFX
 							self.engine.midi_zctrl_change(zctrl, ccval)
@@ -471,24 +549,24 @@ class zynthian_layer:
 
 	def restore_snapshot_2(self, snapshot):
 
-		# Wait a little bit if a preset has been loaded 
-		if self.preset_loaded:
-			sleep(0.2)
-
+		# Wait until the engine is ready
 		self.wait_stop_loading()
 
 		#Set controller values
+		zctrls = []
 		for k in snapshot['controllers_dict']:
 			try:
-				self.controllers_dict[k].restore_snapshot(snapshot['controllers_dict'][k])
+				self.controllers_dict[k].restore_snapshot(snapshot['controllers_dict'][k], False)
+				zctrls.append(self.controllers_dict[k])
 			except Exception as e:
 				logging.warning("Invalid Controller on layer {}: {}".format(self.get_basepath(), e))
+		zynthian_controller.send_values(zctrls)
 
 
 	def wait_stop_loading(self):
-		while self.engine.loading>0:
+		if self.engine.loading>0:
 			logging.debug("WAITING FOR STOP LOADING ...")
-			sleep(0.1)
+			self.engine.wait_stop_loading()
 
 
 	# ---------------------------------------------------------------------------
@@ -534,15 +612,23 @@ class zynthian_layer:
 		zs3 = self.zs3_list[i]
 
 		if zs3:
-			#Load bank list and set bank
-			self.load_bank_list()
-			self.set_bank_by_name(zs3['bank_name'])
-			self.wait_stop_loading()
-
-			#Load preset list and set preset
-			self.load_preset_list()
-			self.set_preset_by_name(zs3['preset_name'])
-			self.wait_stop_loading()
+			ts = monotonic()
+
+			#Set bank, if it changed
+			bank_changed = zs3['bank_name']!=self.bank_name
+			if bank_changed:
+				if self.get_bank_index_by_name(zs3['bank_name']) is None:
+					self.load_bank_list()
+				self.set_bank_by_name(zs3['bank_name'])
+				self.wait_stop_loading()
+
+			#Set preset, if it changed or another one is preloaded
+			preset_changed = bank_changed or zs3['preset_name']!=self.preset_name or self.preload_info is not None
+			if preset_changed:
+				if bank_changed or self.get_preset_index_by_name(zs3['preset_name']) is None:
+					self.load_preset_list()
+				self.set_preset_by_name(zs3['preset_name'])
+				self.wait_stop_loading()
 
 			#Refresh controller config
 			if self.refresh_flag:
@@ -553,17 +639,67 @@ class zynthian_layer:
 			if 'active_screen_index' in zs3:
 				self.active_screen_index=zs3['active_screen_index']
 
-			#Set controller values
-			sleep(0.3)
+			#Set controller values. After loading a preset, the engine's values
+			#are unknown, so all of them are sent. Otherwise, only the changed ones.
+			zctrls = []
 			for k in zs3['controllers_dict']:
-				self.controllers_dict[k].restore_snapshot(zs3['controllers_dict'][k])
-
+				try:
+					zctrl = self.controllers_dict[k]
+					if preset_changed or not self.cmp_ctrl_snapshot(zctrl, zs3['controllers_dict'][k]):
+						zctrl.restore_snapshot(zs3['controllers_dict'][k], False)
+						zctrls.append(zctrl)
+				except Exception as e:
+					logging.warning("Invalid Controller on layer {}: {}".format(self.get_basepath(), e))
+			zynthian_controller.send_values(zctrls)
+
+			self.add_zs3_recall_time(monotonic()-ts, bank_changed, preset_changed, len(zctrls))
 			return True
 
 		else:
 			return False
 
 
+	# Returns True if the controller matches the snapshot
+	@staticmethod
+	def cmp_ctrl_snapshot(zctrl, snapshot):
+		if isinstance(snapshot, dict):
+			if zctrl.value!=snapshot['value']:
+				return False
+			if 'midi_learn_chan' in snapshot and 'midi_learn_cc' in snapshot:
+				if zctrl.midi_learn_chan!=int(snapshot['midi_learn_chan']) or zctrl.midi_learn_cc!=int(snapshot['midi_learn_cc']):
+					return False
+				if 'slot_i' in snapshot and getattr(zctrl, 'slot_i', None)!=snapshot['slot_i']:
+					return False
+			return True
+		else:
+			return zctrl.value==snapshot
+
+
+	def add_zs3_recall_time(self, dt, bank_changed, preset_changed, n_ctrls):
+		self.zs3_last_recall = {
+			'ms': 1000*dt,
+			'bank_changed': bank_changed,
+			'preset_changed': preset_changed,
+			'controllers': n_ctrls
+		}
+		self.zs3_recall_stats[0] += 1
+		self.zs3_recall_stats[1] += dt
+		self.zs3_recall_stats[2] = max(self.zs3_recall_stats[2], dt)
+		logging.info("ZS3 recall on layer {} took {:.1f} ms (bank: {}, preset: {}, controllers: {})".format(self.get_basepath(), 1000*dt, bank_changed, preset_changed, n_ctrls))
+
+
+	def get_zs3_recall_report(self):
+		stats = self.zs3_recall_stats
+		if stats[0]==0:
+			return None
+		return {
+			'count': stats[0],
+			'avg_ms': 1000*stats[1]/stats[0],
+			'max_ms': 1000*stats[2],
+			'last': self.zs3_last_recall
+		}
+
+
 	# ---------------------------------------------------------------------------
 	# Audio Routing:
 	# ---------------------------------------------------------------------------
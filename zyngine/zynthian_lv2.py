@@ -23,16 +23,21 @@
 #******************************************************************************
 
 import os
+import re
 import sys
 import json
 import lilv
 import time
 import string
 import logging
+import threading
 import contextlib
+import multiprocessing
+import urllib.parse
 
 from enum import Enum
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 #------------------------------------------------------------------------------
@@ -46,8 +51,11 @@ if __name__ == '__main__':
 
 #------------------------------------------------------------------------------
 
+world = None
+
 def init_lilv():
 	global world
+	logging.info("Loading LV2 world ...")
 	world = lilv.World()
 	world.load_all()
 
@@ -55,6 +63,13 @@ def init_lilv():
 	world.ns.presets = lilv.Namespace(world, "http://lv2plug.in/ns/ext/presets#")
 
 
+def get_world():
+	global world
+	if world is None:
+		init_lilv()
+	return world
+
+
 #------------------------------------------------------------------------------
 # LV2 Plugin management
 #------------------------------------------------------------------------------
@@ -68,6 +83,8 @@ class PluginType(Enum):
 
 JALV_LV2_CONFIG_FILE = "{}/jalv/plugins.json".format(os.environ.get('ZYNTHIAN_CONFIG_DIR'))
 JALV_LV2_CONFIG_FILE_ALL = "{}/jalv/all_plugins.json".format(os.environ.get('ZYNTHIAN_CONFIG_DIR'))
+JALV_LV2_INDEX_FILE = "{}/jalv/plugins_index.json".format(os.environ.get('ZYNTHIAN_CONFIG_DIR'))
+JALV_LV2_INDEX_VERSION = 2
 
 plugins = None
 plugin_by_type = None
@@ -125,20 +142,20 @@ def is_plugin_enabled(plugin_name):
 
 
 def generate_plugins_config_file(refresh=True):
-	global world, plugins, plugins_mtime
+	global plugins, plugins_mtime
 	genplugins = OrderedDict()
 
 	start = int(round(time.time() * 1000))
 	try:
 		if refresh:
-			init_lilv()
+			update_plugins_index()
 
-		for plugin in world.get_all_plugins():
-			name = str(plugin.get_name())
+		for url, info in get_plugins_index()['plugins'].items():
+			name = info['name']
 			logging.info("Plugin '{}'".format(name))
 			genplugins[name] = {
-				'URL': str(plugin.get_uri()),
-				'TYPE': get_plugin_type(plugin).value,
+				'URL': url,
+				'TYPE': info['type'],
 				'ENABLED': is_plugin_enabled(name)
 			}
 
@@ -203,7 +220,7 @@ def convert_from_all_plugins():
 
 
 def get_plugin_type(plugin):
-	global world
+	world = get_world()
 	lv2_plugin_classes = {
 		"MIDI_SYNTH" : ("Instrument"),
 
@@ -261,33 +278,303 @@ def get_plugin_type(plugin):
 	return PluginType.AUDIO_EFFECT
 
 
+#------------------------------------------------------------------------------
+# LV2 Plugin index: type, ports & presets, validated by bundle mtime
+#------------------------------------------------------------------------------
+
+plugins_index = None
+plugins_index_mtime = None
+plugins_index_checked = False
+plugins_index_lock = threading.RLock()
+
+
+def get_lv2_path():
+	lv2_path = os.environ.get('LV2_PATH')
+	if not lv2_path:
+		lv2_path = "{}/.lv2:/usr/local/lib/lv2:/usr/lib/lv2".format(os.path.expanduser("~"))
+	return [os.path.normpath(d) for d in lv2_path.split(':') if d]
+
+
+def get_bundle_path(plugin):
+	return os.path.normpath(urllib.parse.unquote(urllib.parse.urlparse(str(plugin.get_bundle_uri())).path))
+
+
+def get_bundles_mtime():
+	bundles = {}
+	for lv2_dir in get_lv2_path():
+		try:
+			with os.scandir(lv2_dir) as it:
+				for entry in it:
+					if not entry.is_dir():
+						continue
+					mtime = entry.stat().st_mtime
+					# TTL files can be edited without touching the bundle directory
+					try:
+						with os.scandir(entry.path) as bit:
+							for bentry in bit:
+								if bentry.name[-4:]==".ttl":
+									mtime = max(mtime, bentry.stat().st_mtime)
+					except:
+						pass
+					bundles[os.path.normpath(entry.path)] = mtime
+		except FileNotFoundError:
+			pass
+		except Exception as e:
+			logging.warning("Can't scan LV2 directory '{}': {}".format(lv2_dir, e))
+	return bundles
+
+
+# Return the URLs of the plugins referenced from a bundle's manifest, so the
+# bundles with presets for a plugin (user presets, preset packs) are known.
+ttl_prefix_re = re.compile(r"@prefix\s+([\w\-]*):\s*<([^>]*)>")
+ttl_uri_re = re.compile(r"<([^>]*)>")
+
+def get_bundle_plugin_refs(bundle, plugin_urls):
+	try:
+		with open(bundle + "/manifest.ttl") as f:
+			ttl = f.read()
+	except:
+		return []
+
+	refs = set(ttl_uri_re.findall(ttl)) & plugin_urls
+	for prefix, uri in ttl_prefix_re.findall(ttl):
+		for url in plugin_urls:
+			if url.startswith(uri) and url not in refs and "{}:{}".format(prefix, url[len(uri):]) in ttl:
+				refs.add(url)
+	return sorted(refs)
+
+
+def get_plugin_bundles(plugin_url):
+	return [bundle for bundle, urls in get_plugins_index()['bundle_plugins'].items() if plugin_url in urls]
+
+
+def get_plugins_index_mtime():
+	try:
+		return os.stat(JALV_LV2_INDEX_FILE).st_mtime
+	except:
+		return None
+
+
+def load_plugins_index():
+	global plugins_index, plugins_index_mtime, plugins_index_checked
+	with plugins_index_lock:
+		plugins_index_mtime = get_plugins_index_mtime()
+		plugins_index_checked = False
+		try:
+			with open(JALV_LV2_INDEX_FILE) as f:
+				plugins_index = json.load(f, object_pairs_hook=OrderedDict)
+			if plugins_index.get('version')!=JALV_LV2_INDEX_VERSION:
+				raise Exception("version mismatch")
+		except Exception as e:
+			logging.info("Can't load LV2 plugins index: {}".format(e))
+			plugins_index = {
+				'version': JALV_LV2_INDEX_VERSION,
+				'bundles': {},
+				'bundle_plugins': {},
+				'plugins': OrderedDict()
+			}
+		return plugins_index
+
+
+# The index is shared with other processes (webconf). If the file changed
+# since it was loaded, reload it. Return True if reloaded.
+def check_plugins_index_file():
+	if plugins_index is None or get_plugins_index_mtime()!=plugins_index_mtime:
+		load_plugins_index()
+		return True
+	return False
+
+
+def save_plugins_index():
+	global plugins_index_mtime
+	with plugins_index_lock:
+		# Don't overwrite a newer index saved by other process. Its data wins,
+		# and what was cached here will be regenerated if needed.
+		if get_plugins_index_mtime()!=plugins_index_mtime:
+			logging.info("LV2 plugins index changed on disk => reloading")
+			load_plugins_index()
+			return
+		try:
+			fpath_tmp = JALV_LV2_INDEX_FILE + ".tmp"
+			with open(fpath_tmp, 'w') as f:
+				json.dump(plugins_index, f, separators=(',',':'))
+			os.replace(fpath_tmp, JALV_LV2_INDEX_FILE)
+			plugins_index_mtime = get_plugins_index_mtime()
+		except Exception as e:
+			logging.error("Can't save LV2 plugins index: {}".format(e))
+
+
+def update_plugins_index(force=False):
+	global plugins_index_checked
+	with plugins_index_lock:
+		check_plugins_index_file()
+
+		bundles = get_bundles_mtime()
+		plugins_index_checked = True
+		if not force and bundles==plugins_index['bundles']:
+			return plugins_index
+
+		start = int(round(time.time() * 1000))
+		old_bundles = plugins_index['bundles']
+		old_bundle_plugins = plugins_index['bundle_plugins']
+		old_plugins = plugins_index['plugins']
+
+		init_lilv()
+		genplugins = OrderedDict()
+		n_changed = 0
+		for plugin in world.get_all_plugins():
+			url = str(plugin.get_uri())
+			bundle = get_bundle_path(plugin)
+			info = old_plugins.get(url)
+			if force or info is None or info['bundle']!=bundle or old_bundles.get(bundle)!=bundles.get(bundle):
+				info = {
+					'name': str(plugin.get_name()),
+					'type': get_plugin_type(plugin).value,
+					'bundle': bundle,
+					'ports': _get_plugin_ports(plugin),
+					'presets': None
+				}
+				n_changed += 1
+			genplugins[url] = info
+
+		# Presets can live in other bundles than the plugin's one. Reset the
+		# presets of every plugin referenced by a new, changed or removed bundle.
+		plugin_urls = set(genplugins.keys())
+		changed_bundles = [b for b in set(bundles) | set(old_bundles) if bundles.get(b)!=old_bundles.get(b)]
+		bundle_plugins = {}
+		for bundle in bundles:
+			if force or bundle in changed_bundles or bundle not in old_bundle_plugins:
+				bundle_plugins[bundle] = get_bundle_plugin_refs(bundle, plugin_urls)
+			else:
+				bundle_plugins[bundle] = old_bundle_plugins[bundle]
+
+		n_presets = 0
+		for bundle in changed_bundles:
+			for url in set(old_bundle_plugins.get(bundle, [])) | set(bundle_plugins.get(bundle, [])):
+				info = genplugins.get(url)
+				if info and info['presets'] is not None:
+					info['presets'] = None
+					n_presets += 1
+
+		plugins_index['bundles'] = bundles
+		plugins_index['bundle_plugins'] = bundle_plugins
+		plugins_index['plugins'] = OrderedDict(sorted(genplugins.items(), key=lambda item: item[1]['name']))
+		save_plugins_index()
+
+		end = int(round(time.time() * 1000))
+		logging.info("LV2 plugins index updated ({} changed, {} presets reset) in {} ms".format(n_changed, n_presets, end-start))
+
+	return plugins_index
+
+
+def get_plugins_index():
+	with plugins_index_lock:
+		check_plugins_index_file()
+		# Bundles are validated when the index is (re)loaded. Later changes in
+		# LV2 directories need an explicit refresh.
+		if not plugins_index_checked:
+			update_plugins_index()
+		return plugins_index
+
+
+def get_plugin_index_info(plugin_url):
+	try:
+		return get_plugins_index()['plugins'][plugin_url]
+	except KeyError:
+		return None
+
+
+def get_plugin_url(plugin_name):
+	global plugins
+	try:
+		return plugins[plugin_name]['URL']
+	except:
+		for url, info in get_plugins_index()['plugins'].items():
+			if info['name']==plugin_name:
+				return url
+
 #------------------------------------------------------------------------------
 # LV2 Bank/Preset management
 #------------------------------------------------------------------------------
 
-def generate_all_presets_cache(refresh=True):
-	global world
+presets_cache_progress = {
+	'running': False,
+	'total': 0,
+	'done': 0,
+	'errors': 0
+}
+
+
+def get_presets_cache_progress():
+	return dict(presets_cache_progress)
 
+
+def _presets_cache_worker(plugin_url):
+	# Runs in a pool process, with its own lilv world. Workers are spawned,
+	# not forked, so they don't inherit locks held by other threads.
+	plugins = get_world().get_all_plugins()
+	return _generate_plugin_presets_cache(plugins[plugin_url])
+
+
+def generate_all_presets_cache(refresh=True, force=False, max_workers=None, progress_cb=None):
 	if refresh:
-		init_lilv()
+		update_plugins_index()
 
-	plugins = world.get_all_plugins()
-	for plugin in plugins:
-		_generate_plugin_presets_cache(plugin)
+	# Only plugins whose bundle changed have their presets reset in the index
+	index_plugins = get_plugins_index()['plugins']
+	if force:
+		plugin_urls = list(index_plugins.keys())
+	else:
+		plugin_urls = [url for url, info in index_plugins.items() if info['presets'] is None]
 
+	presets_cache_progress.update({
+		'running': True,
+		'total': len(plugin_urls),
+		'done': 0,
+		'errors': 0
+	})
+
+	start = int(round(time.time() * 1000))
+	try:
+		if plugin_urls:
+			mp_context = multiprocessing.get_context("spawn")
+			with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context, initializer=init_lilv) as executor:
+				futures = { executor.submit(_presets_cache_worker, url): url for url in plugin_urls }
+				for future in as_completed(futures):
+					url = futures[future]
+					try:
+						presets_info = future.result()
+						with plugins_index_lock:
+							index_plugins[url]['presets'] = presets_info
+					except Exception as e:
+						logging.error("Error generating presets cache for <{}>: {}".format(url, e))
+						presets_cache_progress['errors'] += 1
+
+					presets_cache_progress['done'] += 1
+					if progress_cb:
+						progress_cb(get_presets_cache_progress())
+
+			save_plugins_index()
+
+	finally:
+		presets_cache_progress['running'] = False
+
+	end = int(round(time.time() * 1000))
+	logging.info("LV2 presets cache generation for {} plugins took {} ms".format(len(plugin_urls), end-start))
 
-def generate_plugin_presets_cache(plugin_url, refresh=True):
-	global world
 
+def generate_plugin_presets_cache(plugin_url, refresh=True):
 	if refresh:
 		init_lilv()
 
-	plugins = world.get_all_plugins()
-	return _generate_plugin_presets_cache(plugins[plugin_url])
+	plugins = get_world().get_all_plugins()
+	presets_info = _generate_plugin_presets_cache(plugins[plugin_url])
+	save_plugins_index()
+	return presets_info
 
 
 def _generate_plugin_presets_cache(plugin):
-	global world
+	world = get_world()
 
 	plugin_name = str(plugin.get_name())
 	plugin_url = str(plugin.get_uri())
@@ -359,19 +646,42 @@ def _generate_plugin_presets_cache(plugin):
 	except Exception as e:
 		logging.error("Can't save presets cache file '{}': {}".format(fpath_cache, e))
 
+	# Update plugins index
+	with plugins_index_lock:
+		info = get_plugin_index_info(plugin_url)
+		if info:
+			info['presets'] = presets_info
+
 	return presets_info
 
 
 def get_plugin_presets(plugin_name):
+	plugin_url = get_plugin_url(plugin_name)
+	info = get_plugin_index_info(plugin_url)
+	if info and info['presets'] is not None:
+		return info['presets']
+
 	fpath_cache = "{}/jalv/presets_{}.json".format(os.environ.get('ZYNTHIAN_CONFIG_DIR'), sanitize_fname(plugin_name))
 	try:
+		# Cache file is only valid if newer than every bundle with presets for the plugin
+		if info:
+			bundles = get_plugins_index()['bundles']
+			bundles_mtime = max([bundles.get(b, 0) for b in get_plugin_bundles(plugin_url) + [info['bundle']]])
+			if os.stat(fpath_cache).st_mtime<bundles_mtime:
+				raise Exception("outdated")
+
 		with open(fpath_cache) as f:
 			presets_info = json.load(f, object_pairs_hook=OrderedDict)
+
+		if info:
+			with plugins_index_lock:
+				info['presets'] = presets_info
+				save_plugins_index()
+
 	except Exception as e:
 		logging.error("Can't load presets cache file '{}': {}".format(fpath_cache, e))
 		try:
-			global plugins
-			return generate_plugin_presets_cache(plugins[plugin_name]['URL'])
+			return generate_plugin_presets_cache(plugin_url, False)
 		except Exception as e:
 			logging.error("Error generating presets cache for '{}': {}".format(plugin_name, e))
 			presets_info = OrderedDict()
@@ -401,12 +711,71 @@ def sanitize_fname(s):
 #------------------------------------------------------------------------------
 
 def get_plugin_ports(plugin_url):
-	global world
+	info = get_plugin_index_info(plugin_url)
+	if info and info['ports'] is not None:
+		# JSON keys are strings
+		return OrderedDict((int(i), port) for i, port in info['ports'].items())
+
+	plugins = get_world().get_all_plugins()
+	ports_info = _get_plugin_ports(plugins[plugin_url])
+
+	if info:
+		with plugins_index_lock:
+			info['ports'] = ports_info
+			save_plugins_index()
+
+	return ports_info
+
 
-	plugins = world.get_all_plugins()
-	plugin = plugins[plugin_url]
+# Compact, immutable port descriptor. Scale points are (label, value) tuples.
+PortDescriptor = namedtuple('PortDescriptor', ['index', 'symbol', 'label', 'value', 'value_default', 'value_min', 'value_max',
+	'is_toggled', 'is_integer', 'is_enumeration', 'is_logarithmic', 'scale_points'])
 
-	ports_info = {}
+# Process-wide cache => (plugin_url, bundle_mtime) => tuple of PortDescriptor
+plugin_ports_cache = {}
+
+
+def get_plugin_port_descriptors(plugin_url):
+	info = get_plugin_index_info(plugin_url)
+	if info:
+		key = (plugin_url, get_plugins_index()['bundles'].get(info['bundle']))
+	else:
+		key = (plugin_url, None)
+
+	try:
+		return plugin_ports_cache[key]
+	except KeyError:
+		pass
+
+	descriptors = []
+	for i, port in get_plugin_ports(plugin_url).items():
+		descriptors.append(PortDescriptor(
+			port['index'],
+			port['symbol'],
+			port['label'],
+			port['value'],
+			port['range']['default'],
+			port['range']['min'],
+			port['range']['max'],
+			port['is_toggled'],
+			port['is_integer'],
+			port['is_enumeration'],
+			port['is_logarithmic'],
+			tuple((sp['label'], sp['value']) for sp in port['scale_points'])
+		))
+
+	# Drop descriptors from previous bundle versions
+	for k in [k for k in plugin_ports_cache if k[0]==plugin_url]:
+		del plugin_ports_cache[k]
+
+	plugin_ports_cache[key] = descriptors = tuple(descriptors)
+	return descriptors
+
+
+def _get_plugin_ports(plugin):
+	world = get_world()
+
+	ports_info = OrderedDict()
 	for i in range(plugin.get_num_ports()):
 		port = plugin.get_port_by_index(i)
 		if port.is_a(lilv.LILV_URI_INPUT_PORT) and port.is_a(lilv.LILV_URI_CONTROL_PORT):
@@ -469,7 +838,6 @@ def get_node_value(node):
 
 #------------------------------------------------------------------------------
 
-init_lilv()
 load_plugins()
 #generate_plugin_presets_cache("http://code.google.com/p/amsynth/amsynth")
 #print(get_plugin_presets("Dexed"))
@@ -477,7 +845,7 @@ load_plugins()
 #get_plugin_ports("http://code.google.com/p/amsynth/amsynth")
 
 if __name__ == '__main__':
-	generate_plugins_config_file(False)
+	generate_plugins_config_file()
 	generate_all_presets_cache(False)
 
 #------------------------------------------------------------------------------
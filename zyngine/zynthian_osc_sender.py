@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Zynthian OSC Sender (zynthian_osc_sender)
+#
+# Buffered OSC sender, coalescing the messages issued in the same tick
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import liblo
+import logging
+import threading
+from time import sleep
+
+#------------------------------------------------------------------------------
+# OSC Sender Class
+#------------------------------------------------------------------------------
+
+class zynthian_osc_sender:
+
+	# Max number of messages in a bundle
+	bundle_size = 64
+
+	def __init__(self, target, tick=0.002, use_bundles=True):
+		self.target = target
+		self.tick = tick
+		self.use_bundles = use_bundles
+
+		self.queue = []
+		# path => queue position of the last parameter write
+		self.queue_sets = {}
+		self.lock = threading.Lock()
+		self.flush_lock = threading.Lock()
+		self.event = threading.Event()
+
+		self.n_messages = 0
+		self.n_coalesced = 0
+		self.n_packets = 0
+
+		self.thread = None
+		self.start()
+
+
+	# Start the sender thread, if it's not running
+	def start(self, target=None):
+		if target is not None:
+			self.target = target
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.task_sender, args=())
+			self.thread.daemon = True
+			self.thread.start()
+			self.event.set()
+
+
+	# Queue a message. It's sent as is, in order. Parameter writes queued
+	# before it can't be coalesced with later ones, so they keep their order.
+	def send(self, path, *args):
+		with self.lock:
+			self.queue.append((path, args))
+			self.queue_sets = {}
+			self.n_messages += 1
+		self.event.set()
+
+
+	# Queue a parameter write. If a write to the same path is still queued,
+	# with no message queued after it, its value is replaced in place.
+	def set(self, path, *args):
+		with self.lock:
+			i = self.queue_sets.get(path)
+			if i is not None:
+				self.queue[i] = (path, args)
+				self.n_coalesced += 1
+			else:
+				self.queue_sets[path] = len(self.queue)
+				self.queue.append((path, args))
+			self.n_messages += 1
+		self.event.set()
+
+
+	# Send all the queued messages now
+	def flush(self):
+		with self.flush_lock:
+			with self.lock:
+				queue = self.queue
+				self.queue = []
+				self.queue_sets = {}
+
+			if queue:
+				self.send_messages(queue)
+
+
+	def send_messages(self, msgs):
+		try:
+			if self.use_bundles and len(msgs)>1:
+				for i in range(0, len(msgs), self.bundle_size):
+					bundle = liblo.Bundle()
+					for path, args in msgs[i:i+self.bundle_size]:
+						bundle.add(liblo.Message(path, *args))
+					liblo.send(self.target, bundle)
+					self.n_packets += 1
+			else:
+				for path, args in msgs:
+					liblo.send(self.target, path, *args)
+					self.n_packets += 1
+		except Exception as e:
+			logging.error("Can't send OSC messages => {}".format(e))
+
+
+	# Send the pending messages, end the sender thread and release the target.
+	# Messages queued while stopped are sent on the next start().
+	def stop(self):
+		thread = self.thread
+		self.thread = None
+		self.event.set()
+		if thread and thread!=threading.current_thread():
+			thread.join()
+		self.target = None
+
+
+	def task_sender(self):
+		thread = threading.current_thread()
+		while self.thread==thread:
+			self.event.wait()
+			self.event.clear()
+			# Give the caller a tick to queue more messages
+			sleep(self.tick)
+			self.flush()
+
+
+	def get_stats(self):
+		return {
+			'messages': self.n_messages,
+			'coalesced': self.n_coalesced,
+			'packets': self.n_packets
+		}
+
+#------------------------------------------------------------------------------
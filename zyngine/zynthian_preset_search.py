@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+#******************************************************************************
+# ZYNTHIAN PROJECT: Zynthian Preset Search (zynthian_preset_search)
+#
+# Global search index over the presets of all engines
+#
+# Copyright (C) 2015-2020 Fernando Moyano <jofemodo@zynthian.org>
+#
+#******************************************************************************
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of
+# the License, or any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# For a full copy of the GNU General Public License see the LICENSE.txt file.
+#
+#******************************************************************************
+
+import os
+import re
+import json
+import logging
+import threading
+from bisect import bisect_left
+from itertools import chain
+from collections import namedtuple
+
+#------------------------------------------------------------------------------
+# Preset Search Class
+#------------------------------------------------------------------------------
+
+# Search result. Preset names are stored without the favourite mark.
+zynthian_preset_search_entry = namedtuple('zynthian_preset_search_entry', ['engine', 'bank', 'preset', 'preset_id'])
+
+
+class zynthian_preset_search:
+
+	version = 1
+
+	# Engines whose banks can't be scanned from a background thread. Their
+	# presets are still indexed when browsed. FluidSynth has to load every
+	# soundfont to list its presets.
+	skip_engines = ('MX', 'MD', 'PD', 'CS', 'BF', 'FS')
+
+	# Delay (in seconds) for saving the index after changes
+	save_delay = 5
+
+	# Result sets bigger than this are ranked by scanning the sorted entries
+	sort_threshold = 2000
+
+	def __init__(self, fpath=None):
+		if fpath is None:
+			fpath = os.environ.get('ZYNTHIAN_CONFIG_DIR', "/zynthian/config") + "/preset_search.json"
+		self.fpath = fpath
+		self.lock = threading.RLock()
+		self.save_timer = None
+		self.indexed_engines = set()
+		self.reset()
+		self.load()
+
+
+	def reset(self):
+		with self.lock:
+			# (engine, bank) => [[preset_id, preset_name], ...], as persisted
+			self.groups = {}
+			# Source files already imported => mtime
+			self.sources = {}
+			self.entries = []
+			self.sort_keys = []
+			self.group_ids = {}
+			self.tokens = {}
+			self.trigrams = {}
+			self.invalidate_sorted()
+
+
+	# Call with lock acquired
+	def invalidate_sorted(self):
+		self.sorted_tokens = None
+		self.sorted_ids = None
+		self.sorted_names = None
+		self.prefix_cache = {}
+
+	#----------------------------------------------------------------------------
+	# Indexing
+	#----------------------------------------------------------------------------
+
+	@staticmethod
+	def tokenize(text):
+		return re.findall(r'\w+', text.lower())
+
+
+	@staticmethod
+	def get_trigrams(text):
+		text = text.lower()
+		return set(text[i:i+3] for i in range(len(text)-2))
+
+
+	@staticmethod
+	def get_preset_name(name):
+		if name and name[0]=='*':
+			return name[1:]
+		return name
+
+
+	# Replace the presets of a bank, if they changed.
+	# Returns True if the index was modified.
+	def add_presets(self, engine, bank, presets):
+		if not engine or bank is None:
+			return False
+		presets = [[p[0], self.get_preset_name(p[2])] for p in presets if p[0] is not None and p[2]]
+		# Preset IDs must survive the JSON round trip to be compared
+		try:
+			presets = json.loads(json.dumps(presets))
+		except:
+			return False
+
+		key = (engine, bank)
+		with self.lock:
+			if self.groups.get(key)==presets:
+				return False
+			self.remove_group(key)
+			self.groups[key] = presets
+			self.index_group(key)
+		self.schedule_save()
+		return True
+
+
+	# Call with lock acquired
+	def index_group(self, key):
+		engine, bank = key
+		bank_tokens = self.tokenize(bank)
+		ids = []
+		for preset_id, preset_name in self.groups[key]:
+			i = len(self.entries)
+			self.entries.append(zynthian_preset_search_entry(engine, bank, preset_name, preset_id))
+			self.sort_keys.append((preset_name.lower(), engine, bank))
+			ids.append(i)
+			for t in set(self.tokenize(preset_name) + bank_tokens):
+				self.tokens.setdefault(t, set()).add(i)
+			for t in self.get_trigrams(preset_name):
+				self.trigrams.setdefault(t, set()).add(i)
+		self.group_ids[key] = ids
+		self.invalidate_sorted()
+
+
+	# Call with lock acquired
+	def remove_group(self, key):
+		self.groups.pop(key, None)
+		if key in self.group_ids:
+			self.rebuild()
+
+
+	# Re-index all the groups, so entry IDs stay compact.
+	# Call with lock acquired.
+	def rebuild(self):
+		self.entries = []
+		self.sort_keys = []
+		self.group_ids = {}
+		self.tokens = {}
+		self.trigrams = {}
+		for key in self.groups:
+			self.index_group(key)
+		self.invalidate_sorted()
+
+
+	# Read all the banks/presets of a running engine. The engine's command lock
+	# is held while listing, so it can't interleave with the UI's engine IPC.
+	def index_engine(self, engine, layer=None):
+		if engine.nickname in self.skip_engines:
+			return
+		try:
+			with engine.proc_lock:
+				bank_list = engine.get_bank_list(layer) or []
+			if not bank_list:
+				bank_list = [[None, 0, '', None]]
+			for bank in bank_list:
+				if bank[2] is None:
+					continue
+				try:
+					with engine.proc_lock:
+						preset_list = engine.get_preset_list(bank) or []
+				except Exception as e:
+					logging.debug("Can't index presets of {} [{}]: {}".format(engine.nickname, bank[2], e))
+					continue
+				self.add_presets(engine.nickname, bank[2], preset_list)
+		except Exception as e:
+			logging.warning("Can't index presets of {}: {}".format(engine.nickname, e))
+		logging.info("Preset search index updated for {} => {} presets".format(engine.nickname, len(self)))
+
+
+	# Index an engine once per session, in a background thread
+	def index_engine_bg(self, engine, layer=None):
+		with self.lock:
+			if engine.nickname in self.indexed_engines or engine.nickname in self.skip_engines:
+				return
+			self.indexed_engines.add(engine.nickname)
+		thread = threading.Thread(target=self.index_engine, args=(engine, layer))
+		thread.daemon = True
+		thread.start()
+
+
+	# Import the LV2 presets cached in the plugins index
+	def import_lv2_presets(self):
+		from . import zynthian_lv2
+		fpath = zynthian_lv2.JALV_LV2_INDEX_FILE
+		if not self.is_source_changed(fpath):
+			return
+		try:
+			for info in list(zynthian_lv2.get_plugins_index()['plugins'].values()):
+				if not info['presets']:
+					continue
+				for bank_name, bank_info in info['presets'].items():
+					presets = [[p['url'], None, p['label']] for p in bank_info['presets']]
+					self.add_presets("JV/" + info['name'], bank_name, presets)
+			self.set_source_mtime(fpath)
+		except Exception as e:
+			logging.warning("Can't import LV2 presets into search index: {}".format(e))
+
+
+	# Import the presets cached by the Pianoteq engine
+	def import_pianoteq_presets(self):
+		fpath = os.environ.get('ZYNTHIAN_CONFIG_DIR', "/zynthian/config") + "/pianoteq6/presets_cache.json"
+		if not self.is_source_changed(fpath):
+			return
+		try:
+			with open(fpath) as f:
+				presets = json.load(f)
+			for bank_name, preset_list in presets.items():
+				self.add_presets("PT", bank_name, preset_list)
+			self.set_source_mtime(fpath)
+		except Exception as e:
+			logging.warning("Can't import Pianoteq presets into search index: {}".format(e))
+
+
+	def import_caches(self):
+		self.import_lv2_presets()
+		self.import_pianoteq_presets()
+
+
+	def import_caches_bg(self):
+		thread = threading.Thread(target=self.import_caches, args=())
+		thread.daemon = True
+		thread.start()
+
+
+	def is_source_changed(self, fpath):
+		try:
+			return self.sources.get(fpath)!=os.stat(fpath).st_mtime
+		except:
+			return False
+
+
+	def set_source_mtime(self, fpath):
+		with self.lock:
+			try:
+				self.sources[fpath] = os.stat(fpath).st_mtime
+			except:
+				pass
+		self.schedule_save()
+
+	#----------------------------------------------------------------------------
+	# Search
+	#----------------------------------------------------------------------------
+
+	def search(self, query, engine=None, limit=20):
+		qtokens = self.tokenize(query)
+		if not qtokens:
+			return []
+
+		with self.lock:
+			if self.sorted_tokens is None:
+				self.sorted_tokens = sorted(self.tokens.keys())
+
+			ids = None
+			for qt in sorted(qtokens, key=len, reverse=True):
+				tids = self.get_prefix_ids(qt)
+				# Fallback to substring match for tokens of 3+ chars
+				if not tids and len(qt)>=3:
+					tids = self.get_substring_ids(qt)
+				ids = tids if ids is None else ids & tids
+				if not ids:
+					return []
+
+			if engine:
+				ids = set(i for i in ids if self.entries[i].engine==engine)
+
+			# Matches at the start of the preset name go first
+			q = query.strip().lower()
+			if len(ids)<=self.sort_threshold:
+				res = sorted(ids, key=lambda i: (not self.sort_keys[i][0].startswith(q), self.sort_keys[i]))
+				if limit:
+					res = res[:limit]
+			else:
+				res = self.get_sorted_ids(ids, q, limit)
+
+			return [self.entries[i] for i in res]
+
+
+	# Walk the entries in name order, picking the ones in ids.
+	# Call with lock acquired.
+	def get_sorted_ids(self, ids, q, limit):
+		if self.sorted_ids is None:
+			self.sorted_ids = sorted(range(len(self.sort_keys)), key=lambda i: self.sort_keys[i])
+			self.sorted_names = [self.sort_keys[i][0] for i in self.sorted_ids]
+
+		n = len(self.sorted_ids)
+		res = []
+		start = bisect_left(self.sorted_names, q)
+		end = start
+		while end<n and self.sorted_names[end].startswith(q):
+			i = self.sorted_ids[end]
+			if i in ids:
+				res.append(i)
+				if limit and len(res)>=limit:
+					return res
+			end += 1
+		for j in chain(range(start), range(end, n)):
+			i = self.sorted_ids[j]
+			if i in ids:
+				res.append(i)
+				if limit and len(res)>=limit:
+					break
+		return res
+
+
+	# Call with lock acquired
+	def get_prefix_ids(self, prefix):
+		# Short prefixes match lots of tokens => cache them
+		if prefix in self.prefix_cache:
+			return self.prefix_cache[prefix]
+		res = set()
+		i = bisect_left(self.sorted_tokens, prefix)
+		n = len(self.sorted_tokens)
+		while i<n and self.sorted_tokens[i].startswith(prefix):
+			res |= self.tokens[self.sorted_tokens[i]]
+			i += 1
+		if len(prefix)<=2:
+			self.prefix_cache[prefix] = res
+		return res
+
+
+	# Call with lock acquired
+	def get_substring_ids(self, text):
+		ids = None
+		for t in self.get_trigrams(text):
+			tids = self.trigrams.get(t)
+			if not tids:
+				return set()
+			ids = set(tids) if ids is None else ids & tids
+		return set(i for i in ids if text in self.entries[i].preset.lower())
+
+
+	def __len__(self):
+		with self.lock:
+			return sum(len(ids) for ids in self.group_ids.values())
+
+	#----------------------------------------------------------------------------
+	# Persistence
+	#----------------------------------------------------------------------------
+
+	def load(self):
+		try:
+			with open(self.fpath) as f:
+				data = json.load(f)
+			if data['version']!=self.version:
+				raise Exception("version mismatch")
+		except FileNotFoundError:
+			return
+		except Exception as e:
+			logging.warning("Can't load preset search index '{}': {}".format(self.fpath, e))
+			return
+
+		with self.lock:
+			self.reset()
+			self.sources = data['sources']
+			for engine, banks in data['engines'].items():
+				for bank, presets in banks.items():
+					key = (engine, bank)
+					self.groups[key] = presets
+					self.index_group(key)
+		logging.info("Loaded preset search index => {} presets".format(len(self)))
+
+
+	def save(self):
+		with self.lock:
+			self.save_timer = None
+			engines = {}
+			for (engine, bank), presets in self.groups.items():
+				engines.setdefault(engine, {})[bank] = presets
+			data = {
+				'version': self.version,
+				'sources': dict(self.sources),
+				'engines': engines
+			}
+		try:
+			os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+			with open(self.fpath + ".tmp", "w") as f:
+				json.dump(data, f)
+			os.replace(self.fpath + ".tmp", self.fpath)
+		except Exception as e:
+			logging.error("Can't save preset search index '{}': {}".format(self.fpath, e))
+
+
+	def schedule_save(self):
+		with self.lock:
+			if self.save_timer is None:
+				self.save_timer = threading.Timer(self.save_delay, self.save)
+				self.save_timer.daemon = True
+				self.save_timer.start()
+
+#------------------------------------------------------------------------------
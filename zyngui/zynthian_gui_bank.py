@@ -36,6 +36,8 @@ from . import zynthian_gui_selector
 
 class zynthian_gui_bank(zynthian_gui_selector):
 
+	listbox_windowed = True
+
 
 	def __init__(self):
 		super().__init__('Bank', True)
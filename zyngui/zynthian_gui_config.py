@@ -323,6 +323,11 @@ force_enable_cursor=int(os.environ.get('ZYNTHIAN_UI_ENABLE_CURSOR',False))
 restore_last_state=int(os.environ.get('ZYNTHIAN_UI_RESTORE_LAST_STATE',False))
 snapshot_mixer_settings=int(os.environ.get('ZYNTHIAN_UI_SNAPSHOT_MIXER_SETTINGS',False))
 show_cpu_status=int(os.environ.get('ZYNTHIAN_UI_SHOW_CPU_STATUS',False))
+zynread_wake_on_data=int(os.environ.get('ZYNTHIAN_UI_WAKE_ON_DATA',True))
+ctrl_redraw_fps=int(os.environ.get('ZYNTHIAN_UI_CTRL_REDRAW_FPS',30))
+ctrl_sprites=int(os.environ.get('ZYNTHIAN_UI_CTRL_SPRITES',False))
+listbox_window=int(os.environ.get('ZYNTHIAN_UI_LISTBOX_WINDOW',64))
+engine_warm_pool=[e.strip() for e in os.environ.get('ZYNTHIAN_UI_ENGINE_WARM_POOL',"").split(',') if e.strip()]
 
 #------------------------------------------------------------------------------
 # Jackd configuration
@@ -28,10 +28,13 @@ import logging
 import liblo
 import tkinter
 import ctypes
-from time import sleep
+import threading
+from time import sleep, monotonic
 from string import Template
 from datetime import datetime
+from collections import OrderedDict
 from tkinter import font as tkFont
+from PIL import Image, ImageDraw, ImageTk
 
 # Zynthian specific modules
 from zyncoder import *
@@ -44,6 +47,24 @@ from . import zynthian_gui_config
 
 class zynthian_gui_controller:
 
+	# Redraw scheduler => dirty controllers are plotted together, at most once per frame
+	redraw_period = 1.0/max(1,zynthian_gui_config.ctrl_redraw_fps)
+	redraw_dirty = {}
+	redraw_lock = threading.Lock()
+	redraw_scheduled = False
+	redraw_ts = 0
+
+	# Sprite cache => (style, width, height, value bucket, highlight) => PhotoImage
+	sprite_cache = OrderedDict()
+	sprite_cache_size = 512
+	sprite_buckets = 100
+	sprite_style = "arc"
+
+	# Font metrics cache => (text, family, size) => width in pixels
+	font_measure_cache = {}
+	font_measure_cache_size = 4096
+	fonts = {}
+
 	def __init__(self, indx, frm, zctrl):
 		self.width=zynthian_gui_config.ctrl_width
 		self.height=zynthian_gui_config.ctrl_height
@@ -72,14 +93,22 @@ class zynthian_gui_controller:
 		self.value_text=None
 		self.label_title=None
 		self.midi_bind=None
+		self.sprite=None
+		# Image shown by the sprite item, held so LRU eviction can't free it while on screen
+		self.sprite_image=None
+		self.hl=False
 
 		self.index=indx
 		self.main_frame=frm
 		self.row=zynthian_gui_config.ctrl_pos[indx][0]
 		self.col=zynthian_gui_config.ctrl_pos[indx][1]
 		self.sticky=zynthian_gui_config.ctrl_pos[indx][2]
-		self.plot_value=self.plot_value_arc
-		self.erase_value=self.erase_value_arc
+		if zynthian_gui_config.ctrl_sprites:
+			self.plot_value=self.plot_value_sprite
+			self.erase_value=self.erase_value_sprite
+		else:
+			self.plot_value=self.plot_value_arc
+			self.erase_value=self.erase_value_arc
 		# Create Canvas
 		self.canvas=tkinter.Canvas(self.main_frame,
 			width=self.width,
@@ -116,6 +145,10 @@ class zynthian_gui_controller:
 
 
 	def set_hl(self):
+		self.hl=True
+		if self.sprite:
+			self.schedule_plot_value()
+			return
 		try:
 			self.canvas.itemconfig(self.arc, outline=zynthian_gui_config.color_hl)
 		except:
@@ -123,6 +156,10 @@ class zynthian_gui_controller:
 
 
 	def unset_hl(self):
+		self.hl=False
+		if self.sprite:
+			self.schedule_plot_value()
+			return
 		try:
 			self.canvas.itemconfig(self.arc, outline=zynthian_gui_config.color_ctrl_bg_on)
 		except:
@@ -214,7 +251,7 @@ class zynthian_gui_controller:
 			self.rectangle_bg=self.canvas.create_rectangle((x1, y1, x1+lx, y2), fill=zynthian_gui_config.color_ctrl_bg_off, width=0)
 			self.rectangle=self.canvas.create_rectangle((x1, y1, x2, y2), fill=zynthian_gui_config.color_ctrl_bg_on, width=0)
 		if self.value_text:
-			self.canvas.itemconfig(self.value_text, text=value_print)
+			self.canvas.itemconfig(self.value_text, text=self.value_print)
 		else:
 			self.value_text=self.canvas.create_text(x1+self.trw/2-1, y1-self.trh, width=self.trw,
 				justify=CENTER,
@@ -310,6 +347,136 @@ class zynthian_gui_controller:
 		y2=self.height
 
 
+	def plot_value_sprite(self):
+		self.calculate_plot_values()
+		if self.zctrl.midi_cc!=0:
+			if self.max_value>0:
+				bucket=int(round(self.sprite_buckets*self.value_plot/self.max_value))
+			else:
+				bucket=0
+			image=self.get_sprite(self.sprite_style, self.width, self.height, bucket, self.hl)
+			if self.sprite:
+				self.canvas.itemconfig(self.sprite, image=image)
+			else:
+				self.sprite=self.canvas.create_image(0, 0, anchor=tkinter.NW, image=image)
+				self.canvas.tag_lower(self.sprite)
+			self.sprite_image=image
+		elif self.sprite:
+			self.canvas.delete(self.sprite)
+			self.sprite=None
+			self.sprite_image=None
+
+		if self.value_text:
+			self.canvas.itemconfig(self.value_text, text=self.value_print)
+		else:
+			x, y, w = self.get_sprite_text_pos(self.sprite_style, self.width, self.height)
+			self.value_text=self.canvas.create_text(x, y, width=w,
+				justify=tkinter.CENTER,
+				fill=zynthian_gui_config.color_ctrl_tx,
+				font=(zynthian_gui_config.font_family,self.value_font_size),
+				text=self.value_print)
+
+
+	def erase_value_sprite(self):
+		if self.sprite:
+			self.canvas.delete(self.sprite)
+			self.sprite=None
+			self.sprite_image=None
+		if self.value_text:
+			self.canvas.delete(self.value_text)
+			self.value_text=None
+
+
+	@staticmethod
+	def get_sprite_text_pos(style, width, height):
+		trw=width-6
+		trh=int(0.1*height)
+		if style=="arc":
+			x1=0.2*trw
+			y1=height-int(0.7*trw)-6
+			x2=x1+0.7*trw
+			y2=height-6
+			return (x1+(x2-x1)/2-1, y1-(y1-y2)/2, x2-x1)
+		elif style=="triangle":
+			return (2+trw/2-1, int(0.8*height)-8, trw)
+		else:
+			return (6+trw/2-1, height-5-trh, trw)
+
+
+	# Pre-render value indicator using PIL, same geometry as plot_value_arc/triangle/rectangle
+	@classmethod
+	def get_sprite(cls, style, width, height, bucket, hl):
+		key=(style, width, height, bucket, hl)
+		try:
+			image=cls.sprite_cache[key]
+			cls.sprite_cache.move_to_end(key)
+			return image
+		except KeyError:
+			pass
+
+		frac=bucket/cls.sprite_buckets
+		trw=width-6
+		trh=int(0.1*height)
+		if hl:
+			color_on=zynthian_gui_config.color_hl
+		else:
+			color_on=zynthian_gui_config.color_ctrl_bg_on
+		color_off=zynthian_gui_config.color_ctrl_bg_off
+
+		img=Image.new("RGBA", (width, height), (0, 0, 0, 0))
+		draw=ImageDraw.Draw(img)
+		if style=="arc":
+			thickness=int(1.1*zynthian_gui_config.font_size)
+			x1=0.2*trw
+			y1=height-int(0.7*trw)-6
+			x2=x1+0.7*trw
+			y2=height-6
+			# Tk centers the outline on the bounding box, PIL draws it inside
+			h=thickness/2
+			if bucket>0:
+				draw.arc((x1-h, y1-h, x2+h, y2+h), start=120, end=120+300*frac, fill=color_on, width=thickness)
+		elif style=="triangle":
+			x1=2
+			y1=int(0.8*height)+trh
+			draw.polygon((x1, y1, x1+trw, y1, x1+trw, y1-trh), fill=color_off)
+			if bucket>0:
+				x2=x1+trw*frac
+				draw.polygon((x1, y1, x2, y1, x2, y1-trh*frac), fill=color_on)
+		else:
+			x1=6
+			y1=height-5
+			lx=trw-4
+			y2=y1-2*trh
+			draw.rectangle((x1, y2, x1+lx, y1), fill=color_off)
+			if bucket>0:
+				draw.rectangle((x1, y2, x1+lx*frac, y1), fill=color_on)
+
+		image=ImageTk.PhotoImage(img)
+		cls.sprite_cache[key]=image
+		while len(cls.sprite_cache)>cls.sprite_cache_size:
+			cls.sprite_cache.popitem(last=False)
+		return image
+
+
+	@classmethod
+	def measure_text(cls, text, family, size):
+		key=(text, family, size)
+		try:
+			return cls.font_measure_cache[key]
+		except KeyError:
+			pass
+
+		try:
+			rfont=cls.fonts[(family, size)]
+		except KeyError:
+			rfont=cls.fonts[(family, size)]=tkFont.Font(family=family, size=size)
+
+		if len(cls.font_measure_cache)>=cls.font_measure_cache_size:
+			cls.font_measure_cache.clear()
+		res=cls.font_measure_cache[key]=rfont.measure(text)
+		return res
+
+
 	def plot_midi_bind(self, midi_cc, color=zynthian_gui_config.color_ctrl_tx):
 		if not self.midi_bind:
 			self.midi_bind = self.canvas.create_text(
@@ -356,16 +523,17 @@ class zynthian_gui_controller:
 		words=self.title.split()
 		n_words=len(words)
 		maxnumchar=max([len(w) for w in words])
-		rfont=tkFont.Font(family=zynthian_gui_config.font_family,size=max_fs)
+		family=zynthian_gui_config.font_family
+		mfs=max_fs
 		if n_words==1:
-			maxlen=rfont.measure(self.title)
+			maxlen=self.measure_text(self.title, family, mfs)
 		elif n_words==2:
-			maxlen=max([rfont.measure(w) for w in words])
+			maxlen=max([self.measure_text(w, family, mfs) for w in words])
 		elif n_words==3:
-			maxlen=max([rfont.measure(w) for w in [words[0]+' '+words[1], words[1]+' '+words[2]]])
+			maxlen=max([self.measure_text(w, family, mfs) for w in [words[0]+' '+words[1], words[1]+' '+words[2]]])
 			max_fs=max_fs-1
 		elif n_words>=4:
-			maxlen=max([rfont.measure(w) for w in [words[0]+' '+words[1], words[2]+' '+words[3]]])
+			maxlen=max([self.measure_text(w, family, mfs) for w in [words[0]+' '+words[1], words[2]+' '+words[3]]])
 			max_fs=max_fs-1
 		fs=int((zynthian_gui_config.ctrl_width-6)*max_fs/maxlen)
 		fs=min(max_fs,max(int(0.7*zynthian_gui_config.font_size),fs))
@@ -388,8 +556,7 @@ class zynthian_gui_controller:
 		if self.zctrl.labels:
 			maxlen=len(max(self.zctrl.labels, key=len))
 			if maxlen>3:
-				rfont=tkFont.Font(family=zynthian_gui_config.font_family,size=zynthian_gui_config.font_size)
-				maxlen=max([rfont.measure(w) for w in self.zctrl.labels])
+				maxlen=max([self.measure_text(w, zynthian_gui_config.font_family, zynthian_gui_config.font_size) for w in self.zctrl.labels])
 			#print("LONGEST VALUE: %d" % maxlen)
 			if maxlen>100:
 				font_scale=0.7
@@ -595,10 +762,37 @@ class zynthian_gui_controller:
 					if self.mult>1: v = self.mult*v
 					zyncoder.lib_zyncoder.set_value_zyncoder(self.index,ctypes.c_uint(int(v)),int(send_zyncoder))
 					#logging.debug("set_value_zyncoder {} ({}, {}) => {}".format(self.index, self.zctrl.symbol,self.zctrl.midi_cc,v))
-				self.plot_value()
+				self.schedule_plot_value()
 			return True
 
 
+	def schedule_plot_value(self):
+		cls = zynthian_gui_controller
+		with cls.redraw_lock:
+			cls.redraw_dirty[self] = True
+			if cls.redraw_scheduled:
+				return
+			cls.redraw_scheduled = True
+			delay = cls.redraw_period - (monotonic() - cls.redraw_ts)
+		zynthian_gui_config.top.after(max(0, int(1000*delay)), cls.flush_plot_values)
+
+
+	@classmethod
+	def flush_plot_values(cls):
+		with cls.redraw_lock:
+			dirty = cls.redraw_dirty
+			cls.redraw_dirty = {}
+			cls.redraw_scheduled = False
+			cls.redraw_ts = monotonic()
+
+		for gctrl in dirty:
+			if gctrl.shown:
+				try:
+					gctrl.plot_value()
+				except Exception as e:
+					logging.error("Can't plot controller value => {}".format(e))
+
+
 	def set_init_value(self, v):
 		if self.init_value is None:
 			self.init_value=v
@@ -616,7 +810,9 @@ class zynthian_gui_controller:
 		if self.mult>1:
 			val = int((val+1)/self.mult)
 
-		return self.set_value(val)
+		if self.set_value(val):
+			self.zyngui.zyncoder_moving = True
+			return True
 
 
 	def cb_canvas_push(self,event):
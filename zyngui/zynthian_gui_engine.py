@@ -27,9 +27,11 @@ import os
 import sys
 import logging
 import re
+import threading
 import subprocess
 from time import sleep
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Zynthian specific modules
 import zynautoconnect
@@ -53,6 +55,11 @@ class zynthian_gui_engine(zynthian_gui_selector):
 	single_layer_engines = ["BF", "MD", "PT", "PD", "AE", "CS"]
 	check_channels_engines = ["AE"]
 
+	# Seconds to wait before refilling the warm pool after claiming an engine
+	warm_pool_refill_delay = 5
+	# Max seconds to wait for a warm engine that is still starting
+	warm_pool_claim_timeout = 0.5
+
 	@classmethod
 	def init_engine_info(cls):
 
@@ -84,6 +91,14 @@ class zynthian_gui_engine(zynthian_gui_selector):
 	def __init__(self):
 		self.zyngine_counter = 0
 		self.zyngines = OrderedDict()
+
+		# Warm pool => pre-started engines, waiting to be claimed
+		self.warm_pool = OrderedDict()
+		self.warm_pool_cond = threading.Condition()
+		self.warm_pool_starting = None
+		self.warm_pool_timer = None
+		self.warm_pool_stopped = False
+
 		self.set_engine_type("MIDI Synth")
 		super().__init__('Engine', True)
 
@@ -125,18 +140,68 @@ class zynthian_gui_engine(zynthian_gui_selector):
 
 	def start_engine(self, eng):
 		if eng not in self.zyngines:
-			info=self.engine_info[eng]
-			zynthian_engine_class=info[3]
+			instance=self.claim_warm_engine(eng)
+			if not instance:
+				instance=self.create_engine(eng)
 			if eng[0:3]=="JV/":
 				eng="JV/{}".format(self.zyngine_counter)
-				self.zyngines[eng]=zynthian_engine_class(info[0], info[2], self.zyngui)
-			else:
-				self.zyngines[eng]=zynthian_engine_class(self.zyngui)
+			self.zyngines[eng]=instance
 
 		self.zyngine_counter+=1
 		return self.zyngines[eng]
 
 
+	def create_engine(self, eng, jackname=None):
+		info=self.engine_info[eng]
+		zynthian_engine_class=info[3]
+		if eng[0:3]=="JV/":
+			try:
+				return zynthian_engine_class(info[0], info[2], self.zyngui, jackname=jackname)
+			except:
+				if jackname:
+					zynthian_engine_class.release_jackname(jackname)
+				raise
+		else:
+			return zynthian_engine_class(self.zyngui)
+
+
+	# Start a list of engines concurrently. Return the list of engine instances,
+	# in the same order, reusing running instances like start_engine does.
+	def start_engines(self, engs, max_workers=8):
+		keys=[]
+		jobs=OrderedDict()
+		for eng in engs:
+			if eng in self.zyngines or eng in jobs:
+				key=eng
+			else:
+				if eng[0:3]=="JV/":
+					key="JV/{}".format(self.zyngine_counter)
+				else:
+					key=eng
+				instance=self.claim_warm_engine(eng)
+				if instance:
+					self.zyngines[key]=instance
+				elif eng[0:3]=="JV/":
+					# Jack names are assigned here, in order, so they don't depend
+					# on which instance starts first.
+					jobs[key]=(eng, self.engine_info[eng][3].reserve_jackname(self.engine_info[eng][0]))
+				else:
+					jobs[key]=(eng, None)
+			self.zyngine_counter+=1
+			keys.append(key)
+
+		if jobs:
+			with ThreadPoolExecutor(max_workers=max_workers) as executor:
+				futures=OrderedDict()
+				for key, (eng, jackname) in jobs.items():
+					logging.debug("Starting Engine '{}' ...".format(key))
+					futures[key]=executor.submit(self.create_engine, eng, jackname)
+				for key, future in futures.items():
+					self.zyngines[key]=future.result()
+
+		return [self.zyngines[key] for key in keys]
+
+
 	def stop_engine(self, eng, wait=0):
 		if eng in self.zyngines:
 			self.zyngines[eng].stop()
@@ -160,6 +225,86 @@ class zynthian_gui_engine(zynthian_gui_selector):
 				del self.zyngines[eng]
 
 
+	#----------------------------------------------------------------------------
+	# Warm engine pool
+	#----------------------------------------------------------------------------
+
+	def start_warm_pool(self, delay=0):
+		if not zynthian_gui_config.engine_warm_pool:
+			return
+		with self.warm_pool_cond:
+			if self.warm_pool_stopped:
+				return
+			if self.warm_pool_timer:
+				self.warm_pool_timer.cancel()
+			self.warm_pool_timer=threading.Timer(delay, self.fill_warm_pool)
+			self.warm_pool_timer.daemon=True
+			self.warm_pool_timer.start()
+
+
+	def fill_warm_pool(self):
+		for eng in zynthian_gui_config.engine_warm_pool:
+			with self.warm_pool_cond:
+				if self.warm_pool_stopped:
+					return
+				if eng in self.warm_pool or eng in self.zyngines:
+					continue
+				if eng not in self.engine_info:
+					logging.warning("Can't add unknown engine '{}' to warm pool".format(eng))
+					continue
+				self.warm_pool_starting=eng
+
+			instance=None
+			try:
+				# Pooled instances have no layer yet, so the jack name is reserved
+				# now and kept when the instance is claimed by a layer.
+				if eng[0:3]=="JV/":
+					jackname=self.engine_info[eng][3].reserve_jackname(self.engine_info[eng][0])
+					logging.info("Starting warm engine '{}' as '{}' ...".format(eng, jackname))
+				else:
+					jackname=None
+					logging.info("Starting warm engine '{}' ...".format(eng))
+				instance=self.create_engine(eng, jackname)
+			except Exception as e:
+				logging.error("Can't start warm engine '{}' => {}".format(eng, e))
+
+			with self.warm_pool_cond:
+				self.warm_pool_starting=None
+				if instance:
+					# Stopped, or not claimed in time and started the normal way
+					if self.warm_pool_stopped or (eng[0:3]!="JV/" and eng in self.zyngines):
+						instance.stop()
+					else:
+						self.warm_pool[eng]=instance
+				self.warm_pool_cond.notify_all()
+
+
+	# Return a warm instance of the engine, or None. If it's still being
+	# started, wait for it a short time only, so the UI doesn't freeze.
+	def claim_warm_engine(self, eng):
+		with self.warm_pool_cond:
+			if not self.warm_pool_cond.wait_for(lambda: self.warm_pool_starting!=eng, self.warm_pool_claim_timeout):
+				logging.info("Warm engine '{}' is not ready yet => starting a new one".format(eng))
+			instance=self.warm_pool.pop(eng, None)
+
+		if instance:
+			logging.info("Claimed warm engine '{}' ({})".format(eng, instance.jackname))
+			self.start_warm_pool(self.warm_pool_refill_delay)
+		return instance
+
+
+	def stop_warm_pool(self):
+		with self.warm_pool_cond:
+			self.warm_pool_stopped=True
+			if self.warm_pool_timer:
+				self.warm_pool_timer.cancel()
+			instances=list(self.warm_pool.values())
+			self.warm_pool.clear()
+
+		for instance in instances:
+			instance.stop()
+
+
 	def get_engine_info(self, eng):
 		return self.engine_info[eng]
 
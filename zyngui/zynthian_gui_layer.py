@@ -28,14 +28,16 @@ import os
 import sys
 import copy
 import logging
+from time import monotonic
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONEncoder, JSONDecoder
 
 # Zynthian specific modules
 from zyncoder import *
 from . import zynthian_gui_config
 from . import zynthian_gui_selector
-from zyngine import zynthian_layer
+from zyngine import zynthian_layer, zynthian_controller
 
 #------------------------------------------------------------------------------
 # Zynthian Layer Selection GUI Class
@@ -53,6 +55,9 @@ class zynthian_gui_layer(zynthian_gui_selector):
 		self.add_layer_eng = None
 		self.replace_layer_index = None
 		self.last_snapshot_fpath = None
+		self.ctrl_cc_serial = 0
+		self.invalidate_zs3_plans()
+		self.invalidate_ctrl_cc_map()
 		super().__init__('Layer', True)
 
 
@@ -80,6 +85,8 @@ class zynthian_gui_layer(zynthian_gui_selector):
 			self.root_layers=self.layers
 		else:
 			self.root_layers=self.get_fxchain_roots()
+		self.invalidate_zs3_plans()
+		self.invalidate_ctrl_cc_map()
 
 		for i,layer in enumerate(self.root_layers):
 			self.list_data.append((str(i+1),i,layer.get_presetpath()))
@@ -136,11 +143,13 @@ class zynthian_gui_layer(zynthian_gui_selector):
 	def create_amixer_layer(self):
 		mixer_eng = self.zyngui.screens['engine'].start_engine('MX')
 		self.amixer_layer=zynthian_layer(mixer_eng, None, self.zyngui)
+		self.invalidate_ctrl_cc_map()
 
 
 	def remove_amixer_layer(self):
 		self.amixer_layer.reset()
 		self.amixer_layer = None
+		self.invalidate_ctrl_cc_map()
 
 
 	def layer_control_amixer(self):
@@ -292,6 +301,8 @@ class zynthian_gui_layer(zynthian_gui_selector):
 			else:
 				self.layers.append(layer)
 
+			self.invalidate_zs3_plans()
+			self.invalidate_ctrl_cc_map()
 			self.zyngui.zynautoconnect()
 
 			if select:
@@ -448,14 +459,13 @@ class zynthian_gui_layer(zynthian_gui_selector):
 
 	def set_midi_chan_zs3(self, midich, zs3_index):
 		selected = False
-		for layer in self.layers:
-			if zynthian_gui_config.midi_single_active_channel or midich==layer.get_midi_chan():
-				if layer.restore_zs3(zs3_index) and not selected:
-					try:
-						self.select_action(self.root_layers.index(layer))
-						selected = True
-					except Exception as e:
-						logging.error("Can't select layer => {}".format(e))
+		for layer, root_i in self.get_zs3_plans(midich)[0][zs3_index]:
+			if layer.restore_zs3(zs3_index) and not selected and root_i is not None:
+				try:
+					self.select_action(root_i)
+					selected = True
+				except Exception as e:
+					logging.error("Can't select layer => {}".format(e))
 
 
 	def save_midi_chan_zs3(self, midich, zs3_index):
@@ -465,35 +475,106 @@ class zynthian_gui_layer(zynthian_gui_selector):
 				layer.save_zs3(zs3_index)
 			elif zynthian_gui_config.midi_single_active_channel:
 				layer.delete_zs3(zs3_index)
+		self.invalidate_zs3_plans()
 
 
 	def delete_midi_chan_zs3(self, midich, zs3_index):
 		for layer in self.layers:
 			if zynthian_gui_config.midi_single_active_channel or midich==layer.get_midi_chan():
 				layer.delete_zs3(zs3_index)
+		self.invalidate_zs3_plans()
 
 
 	def get_midi_chan_zs3_status(self, midich, zs3_index):
-		for layer in self.layers:
-			if zynthian_gui_config.midi_single_active_channel or midich==layer.get_midi_chan():
-				if layer.get_zs3(zs3_index):
-					return True
-		return False
+		return len(self.get_zs3_plans(midich)[0][zs3_index])>0
 
 
 	def get_midi_chan_zs3_used_indexes(self, midich):
-		res=[]
+		return list(self.get_zs3_plans(midich)[1])
+
+
+	# ZS3 recall plans, compiled per MIDI channel on first use:
+	# (plans, used) => plans[program] is the list of (layer, root layer index)
+	# to recall, in layer order, and used is the list of programs with a ZS3.
+	def get_zs3_plans(self, midich):
+		if self.zs3_plans_single!=zynthian_gui_config.midi_single_active_channel:
+			self.invalidate_zs3_plans()
+		try:
+			return self.zs3_plans[midich]
+		except KeyError:
+			pass
+
+		root_index = {id(layer): i for i, layer in enumerate(self.root_layers)}
+		layers = [layer for layer in self.layers if zynthian_gui_config.midi_single_active_channel or midich==layer.get_midi_chan()]
+		plans = [[] for i in range(128)]
+		used = []
 		for i in range(128):
-			if self.get_midi_chan_zs3_status(midich,i):
-				res.append(i)
-		return res
+			for layer in layers:
+				if layer.get_zs3(i):
+					plans[i].append((layer, root_index.get(id(layer))))
+			if plans[i]:
+				used.append(i)
+
+		self.zs3_plans[midich] = (plans, used)
+		return self.zs3_plans[midich]
+
+
+	# Must be called when layers, their MIDI channels or their ZS3s change
+	def invalidate_zs3_plans(self):
+		self.zs3_plans = {}
+		self.zs3_plans_single = zynthian_gui_config.midi_single_active_channel
 
 
 	def midi_control_change(self, chan, ccnum, ccval):
-		for layer in self.layers + [self.amixer_layer]:
+		for layer in self.get_ctrl_cc_layers(chan, ccnum):
 			layer.midi_control_change(chan, ccnum, ccval)
 
 
+	# Layers handling a MIDI-CC, from a (chan, cc) => [layer] map compiled
+	# on first use. Layers listening MIDI-CC are indexed by their controllers'
+	# (chan, cc), and the rest (Jalv, mixer, ...) by the CCs learned by the engine.
+	def get_ctrl_cc_layers(self, chan, ccnum):
+		if self.ctrl_cc_single!=zynthian_gui_config.midi_single_active_channel:
+			self.invalidate_ctrl_cc_map()
+		ctrl_cc_layers = self.ctrl_cc_layers
+		if ctrl_cc_layers is None:
+			ctrl_cc_layers = self.compile_ctrl_cc_map()
+		return ctrl_cc_layers.get((chan, ccnum), ())
+
+
+	def compile_ctrl_cc_map(self):
+		serial = self.ctrl_cc_serial
+		ctrl_cc_layers = {}
+		layers = list(self.layers)
+		if self.amixer_layer:
+			layers.append(self.amixer_layer)
+		for layer in layers:
+			if not layer.engine:
+				continue
+			if layer.listen_midi_cc:
+				keys = list(layer.ctrl_cc_map.keys())
+			else:
+				keys = layer.engine.get_midi_control_keys()
+			for key in keys:
+				try:
+					if layer not in ctrl_cc_layers[key]:
+						ctrl_cc_layers[key].append(layer)
+				except KeyError:
+					ctrl_cc_layers[key] = [layer]
+
+		# Don't keep it if invalidated while compiling
+		if serial==self.ctrl_cc_serial:
+			self.ctrl_cc_layers = ctrl_cc_layers
+		return ctrl_cc_layers
+
+
+	# Must be called when layers, their MIDI channels or their CC mappings change
+	def invalidate_ctrl_cc_map(self):
+		self.ctrl_cc_serial += 1
+		self.ctrl_cc_layers = None
+		self.ctrl_cc_single = zynthian_gui_config.midi_single_active_channel
+
+
 	#----------------------------------------------------------------------------
 	# Audio Routing
 	#----------------------------------------------------------------------------
@@ -645,6 +726,7 @@ class zynthian_gui_layer(zynthian_gui_selector):
 
 			# Replace layer in list
 			self.layers[self.replace_layer_index] = layer
+			self.invalidate_ctrl_cc_map()
 
 			# Remove old layer and stop unused engines
 			self.zyngui.zynautoconnect_acquire_lock()
@@ -796,6 +878,9 @@ class zynthian_gui_layer(zynthian_gui_selector):
 		try:
 			snapshot=JSONDecoder().decode(json)
 
+			#Send the restored values to MIDI controllers, even if unchanged
+			zynthian_controller.reset_ctrlfb()
+
 			#Clean all layers, but don't stop unused engines
 			self.remove_all_layers(False)
 
@@ -803,24 +888,31 @@ class zynthian_gui_layer(zynthian_gui_selector):
 			# so we stop Jalv engines!
 			self.zyngui.screens['engine'].stop_unused_jalv_engines()
 
-			#Create new layers, starting engines when needed
-			i = 0
+			ts = monotonic()
+
+			#Extract ALSA mixer layer
+			layers_snapshot = []
 			for lss in snapshot['layers']:
 				if lss['engine_nick']=="MX":
 					if zynthian_gui_config.snapshot_mixer_settings:
 						snapshot['amixer_layer'] = lss
-					del(snapshot['layers'][i])
 				else:
-					engine=self.zyngui.screens['engine'].start_engine(lss['engine_nick'])
-					self.layers.append(zynthian_layer(engine,lss['midi_chan'], self.zyngui))
-				i += 1
+					layers_snapshot.append(lss)
+			snapshot['layers'] = layers_snapshot
+
+			#Start needed engines concurrently and create new layers
+			engines = self.zyngui.screens['engine'].start_engines([lss['engine_nick'] for lss in snapshot['layers']])
+			for engine, lss in zip(engines, snapshot['layers']):
+				self.layers.append(zynthian_layer(engine,lss['midi_chan'], self.zyngui))
 
 			# Finally, stop all unused engines
 			self.zyngui.screens['engine'].stop_unused_engines()
+			ts = self.log_snapshot_stage("engines", ts)
 
 			#Autoconnect
 			self.zyngui.zynautoconnect_midi(True)
 			self.zyngui.zynautoconnect_audio()
+			ts = self.log_snapshot_stage("autoconnect", ts)
 
 			#Restore MIDI profile state
 			if 'midi_profile_state' in snapshot:
@@ -831,21 +923,18 @@ class zynthian_gui_layer(zynthian_gui_selector):
 				self.set_extended_config(snapshot['extended_config'])
 
 			# Restore layer state, step 1 => Restore Bank & Preset Status
-			i = 0
-			for lss in snapshot['layers']:
-				self.layers[i].restore_snapshot_1(lss)
-				i += 1
+			self.run_by_engine(zynthian_layer.restore_snapshot_1, zip(self.layers, snapshot['layers']))
+			ts = self.log_snapshot_stage("bank & preset", ts)
 
 			# Restore layer state, step 2 => Restore Controllers Status
-			i = 0
-			for lss in snapshot['layers']:
-				self.layers[i].restore_snapshot_2(lss)
-				i += 1
+			self.run_by_engine(zynthian_layer.restore_snapshot_2, zip(self.layers, snapshot['layers']))
+			ts = self.log_snapshot_stage("controllers", ts)
 
 			# Restore ALSA Mixer settings
 			if self.amixer_layer and 'amixer_layer' in snapshot:
 				self.amixer_layer.restore_snapshot_1(snapshot['amixer_layer'])
 				self.amixer_layer.restore_snapshot_2(snapshot['amixer_layer'])
+				ts = self.log_snapshot_stage("mixer", ts)
 
 			#Fill layer list
 			self.fill_list()
@@ -893,6 +982,36 @@ class zynthian_gui_layer(zynthian_gui_selector):
 		return True
 
 
+	# Call func(layer, layer_snapshot) for every item, using a worker pool.
+	# Items sharing an engine are run in order by the same worker.
+	def run_by_engine(self, func, items, max_workers=8):
+		groups = OrderedDict()
+		for layer, lss in items:
+			try:
+				groups[id(layer.engine)].append((layer, lss))
+			except:
+				groups[id(layer.engine)] = [(layer, lss)]
+
+		def run_group(group):
+			for layer, lss in group:
+				func(layer, lss)
+
+		if len(groups)>1:
+			with ThreadPoolExecutor(max_workers=max_workers) as executor:
+				futures = [executor.submit(run_group, group) for group in groups.values()]
+				for future in futures:
+					future.result()
+		else:
+			for group in groups.values():
+				run_group(group)
+
+
+	def log_snapshot_stage(self, stage, ts):
+		now = monotonic()
+		logging.info("Snapshot restore '{}' => {:.0f} ms".format(stage, 1000*(now-ts)))
+		return now
+
+
 	def get_midi_profile_state(self):
 		# Get MIDI profile state from environment
 		midi_profile_state = OrderedDict()
@@ -36,6 +36,8 @@ from . import zynthian_gui_selector
 
 class zynthian_gui_preset(zynthian_gui_selector):
 
+	listbox_windowed = True
+
 	def __init__(self):
 		self.only_favs = False
 		super().__init__('Preset', True)
@@ -63,6 +65,35 @@ class zynthian_gui_preset(zynthian_gui_selector):
 			self.update_list()
 
 
+	# Jump to the first preset of the current engine matching query
+	def search(self, query):
+		layer = self.zyngui.curlayer
+		if not layer:
+			return False
+		res = self.zyngui.preset_search(query, layer.engine.nickname, 1)
+		if not res:
+			logging.debug("No presets matching '{}'".format(query))
+			return False
+
+		if res[0].bank!=layer.bank_name:
+			if not layer.set_bank_by_name(res[0].bank):
+				return False
+			self.zyngui.screens['bank'].index = layer.get_bank_index()
+		self.only_favs = False
+
+		if self.zyngui.get_current_screen()!=self:
+			self.zyngui.show_screen('preset')
+		else:
+			self.set_select_path()
+			self.fill_list()
+
+		for i, preset in enumerate(self.list_data):
+			if preset[0]==res[0].preset_id:
+				self.select(i)
+				return True
+		return False
+
+
 	def preselect_action(self):
 		return self.zyngui.curlayer.preload_preset(self.index)
 
@@ -26,6 +26,7 @@
 import sys
 import logging
 import tkinter
+from time import monotonic
 from datetime import datetime
 from tkinter import font as tkFont
 from PIL import Image, ImageTk
@@ -42,9 +43,26 @@ from zyngui.zynthian_gui_keybinding import zynthian_gui_keybinding
 
 class zynthian_gui_selector:
 
+	# Status Area Tk calls counter, shared by all screens
+	status_tk_calls = 0
+	status_tk_skipped = 0
+	status_tk_rate = (0, 0)
+	status_tk_ts = 0
+
+	# Screens with potentially huge lists (banks, presets) only materialize
+	# a window of rows around the selection.
+	listbox_windowed = False
+
+	# Type-ahead query is reset after this time (in seconds) without keys
+	typeahead_timeout = 1.5
+
 	def __init__(self, selcap='Select', wide=False):
 		self.index = 0
 		self.list_data = []
+		self.listbox_offset = 0
+		self.listbox_size = 0
+		self.typeahead_query = ""
+		self.typeahead_ts = 0
 		self.shown = False
 		self.zselector = None
 		self.zyngui = zynthian_gui_config.zyngui
@@ -63,6 +81,9 @@ class zynthian_gui_selector:
 		self.status_recplay = None
 		self.status_midi = None
 
+		#Last rendered state of status area objects => Only changes are sent to Tk
+		self.status_rendered = {}
+
 		#Status Area Parameters
 		self.status_h = zynthian_gui_config.topbar_height
 		self.status_l = int(1.8*zynthian_gui_config.topbar_height)
@@ -239,6 +260,7 @@ class zynthian_gui_selector:
 
 	def refresh_status(self, status={}):
 		if self.shown:
+			self.count_status_tk_calls()
 			if zynthian_gui_config.show_cpu_status:
 				# Display CPU-load bar
 				l = int(status['cpu_load']*self.status_l/100)
@@ -247,8 +269,8 @@ class zynthian_gui_selector:
 				color = "#%02x%02x%02x" % (cr,cg,0)
 				try:
 					if self.status_cpubar:
-						self.status_canvas.coords(self.status_cpubar,(0, 0, l, self.status_rh))
-						self.status_canvas.itemconfig(self.status_cpubar, fill=color)
+						self.status_coords(self.status_cpubar,(0, 0, l, self.status_rh))
+						self.status_itemconfig(self.status_cpubar, fill=color)
 					else:
 						self.status_cpubar=self.status_canvas.create_rectangle((0, 0, l, self.status_rh), fill=color, width=0)
 				except Exception as e:
@@ -270,77 +292,77 @@ class zynthian_gui_selector:
 				try:
 					# Channel A (left)
 					if self.status_peak_lA:
-						self.status_canvas.coords(self.status_peak_lA,(0, 0, llA, self.status_rh/2))
-						self.status_canvas.itemconfig(self.status_peak_lA, state='normal')
+						self.status_coords(self.status_peak_lA,(0, 0, llA, self.status_rh/2))
+						self.status_itemconfig(self.status_peak_lA, state='normal')
 					else:
 						self.status_peak_lA=self.status_canvas.create_rectangle((0, 0, 0, 0), fill="#00C000", width=0, state='hidden')
 
 					if self.status_peak_mA:
 						if lmA >= self.dpm_scale_lm:
-							self.status_canvas.coords(self.status_peak_mA,(self.dpm_scale_lm, 0, lmA, self.status_rh/2))
-							self.status_canvas.itemconfig(self.status_peak_mA, state="normal")
+							self.status_coords(self.status_peak_mA,(self.dpm_scale_lm, 0, lmA, self.status_rh/2))
+							self.status_itemconfig(self.status_peak_mA, state="normal")
 						else:
-							self.status_canvas.itemconfig(self.status_peak_mA, state="hidden")
+							self.status_itemconfig(self.status_peak_mA, state="hidden")
 					else:
 						self.status_peak_mA=self.status_canvas.create_rectangle((0, 0, 0, 0), fill="#C0C000", width=0, state='hidden')
 
 					if self.status_peak_hA:
 						if lhA >= self.dpm_scale_lh:
-							self.status_canvas.coords(self.status_peak_hA,(self.dpm_scale_lh, 0, lhA, self.status_rh/2))
-							self.status_canvas.itemconfig(self.status_peak_hA, state="normal")
+							self.status_coords(self.status_peak_hA,(self.dpm_scale_lh, 0, lhA, self.status_rh/2))
+							self.status_itemconfig(self.status_peak_hA, state="normal")
 						else:
-							self.status_canvas.itemconfig(self.status_peak_hA, state="hidden")
+							self.status_itemconfig(self.status_peak_hA, state="hidden")
 					else:
 						self.status_peak_hA=self.status_canvas.create_rectangle((0, 0, 0, 0), fill="#C00000", width=0, state='hidden')
 
 					if self.status_hold_A:
-						self.status_canvas.coords(self.status_hold_A,(lholdA, 0, lholdA, self.status_rh/2))
+						self.status_coords(self.status_hold_A,(lholdA, 0, lholdA, self.status_rh/2))
 						if lholdA >= self.dpm_scale_lh:
-							self.status_canvas.itemconfig(self.status_hold_A, state="normal", fill="#FF0000")
+							self.status_itemconfig(self.status_hold_A, state="normal", fill="#FF0000")
 						elif lholdA >= self.dpm_scale_lm:
-							self.status_canvas.itemconfig(self.status_hold_A, state="normal", fill="#FFFF00")
+							self.status_itemconfig(self.status_hold_A, state="normal", fill="#FFFF00")
 						elif lholdA > 0:
-							self.status_canvas.itemconfig(self.status_hold_A, state="normal", fill="#00FF00")
+							self.status_itemconfig(self.status_hold_A, state="normal", fill="#00FF00")
 						else:
-							self.status_canvas.itemconfig(self.status_hold_A, state="hidden")
+							self.status_itemconfig(self.status_hold_A, state="hidden")
 					else:
 						self.status_hold_A=self.status_canvas.create_rectangle((0, 0, 0, 0), width=0, state='hidden')
 
 					# Channel B (right)
 					if self.status_peak_lB:
-						self.status_canvas.coords(self.status_peak_lB,(0, self.status_rh/2 + 1, llB, self.status_rh + 1))
-						self.status_canvas.itemconfig(self.status_peak_lB, state='normal')
+						self.status_coords(self.status_peak_lB,(0, self.status_rh/2 + 1, llB, self.status_rh + 1))
+						self.status_itemconfig(self.status_peak_lB, state='normal')
 					else:
 						self.status_peak_lB=self.status_canvas.create_rectangle((0, 0, 0, 0), fill="#00C000", width=0, state='hidden')
 
 					if self.status_peak_mB:
 						if lmB >= self.dpm_scale_lm:
-							self.status_canvas.coords(self.status_peak_mB,(self.dpm_scale_lm, self.status_rh/2 + 1, lmB, self.status_rh + 1))
-							self.status_canvas.itemconfig(self.status_peak_mB, state="normal")
+							self.status_coords(self.status_peak_mB,(self.dpm_scale_lm, self.status_rh/2 + 1, lmB, self.status_rh + 1))
+							self.status_itemconfig(self.status_peak_mB, state="normal")
 						else:
-							self.status_canvas.itemconfig(self.status_peak_mB, state="hidden")
+							self.status_itemconfig(self.status_peak_mB, state="hidden")
 					else:
 						self.status_peak_mB=self.status_canvas.create_rectangle((0, 0, 0, 0), fill="#C0C000", width=0, state='hidden')
 
 					if self.status_peak_hB:
 						if lhB >= self.dpm_scale_lh:
-							self.status_canvas.coords(self.status_peak_hB,(self.dpm_scale_lh, self.status_rh/2 + 1, lhB, self.status_rh + 1))
-							self.status_canvas.itemconfig(self.status_peak_hB, state="normal")
+							self.status_coords(self.status_peak_hB,(self.dpm_scale_lh, self.status_rh/2 + 1, lhB, self.status_rh + 1))
+							self.status_itemconfig(self.status_peak_hB, state="normal")
 						else:
-							self.status_canvas.itemconfig(self.status_peak_hB, state="hidden")
+							self.status_itemconfig(self.status_peak_hB, state="hidden")
 					else:
 						self.status_peak_hB=self.status_canvas.create_rectangle((0, 0, 0, 0), fill="#C00000", width=0, state='hidden')
 
 					if self.status_hold_B:
-						self.status_canvas.coords(self.status_hold_B,(lholdB, self.status_rh/2 + 1, lholdB, self.status_rh + 1))
+						self.status_coords(self.status_hold_B,(lholdB, self.status_rh/2 + 1, lholdB, self.status_rh + 1))
 						if lholdB >= self.dpm_scale_lh:
-							self.status_canvas.itemconfig(self.status_hold_B, state="normal", fill="#FF0000")
+							self.status_itemconfig(self.status_hold_B, state="normal", fill="#FF0000")
 						elif lholdB >= self.dpm_scale_lm:
-							self.status_canvas.itemconfig(self.status_hold_B, state="normal", fill="#FFFF00")
+							self.status_itemconfig(self.status_hold_B, state="normal", fill="#FFFF00")
 						elif lholdB > 0:
-							self.status_canvas.itemconfig(self.status_hold_B, state="normal", fill="#00FF00")
+							self.status_itemconfig(self.status_hold_B, state="normal", fill="#00FF00")
 						else:
-							self.status_canvas.itemconfig(self.status_hold_B, state="hidden")
+							self.status_itemconfig(self.status_hold_B, state="hidden")
 					else:
 						self.status_hold_B=self.status_canvas.create_rectangle((0, 0, 0, 0), width=0, state='hidden')
 
@@ -372,7 +394,7 @@ class zynthian_gui_selector:
 					font=("FontAwesome",self.status_fs),
 					text=flags)
 			else:
-				self.status_canvas.itemconfig(self.status_error, text=flags, fill=color)
+				self.status_itemconfig(self.status_error, text=flags, fill=color)
 
 			# Display Rec/Play flags
 			flags = ""
@@ -408,7 +430,7 @@ class zynthian_gui_selector:
 					font=("FontAwesome",self.status_fs),
 					text=flags)
 			else:
-				self.status_canvas.itemconfig(self.status_recplay, text=flags, fill=color)
+				self.status_itemconfig(self.status_recplay, text=flags, fill=color)
 
 			# Display MIDI flag
 			flags=""
@@ -430,7 +452,50 @@ class zynthian_gui_selector:
 					#font=("FontAwesome",self.status_fs),
 					text=flags)
 			else:
-				self.status_canvas.itemconfig(self.status_midi, text=flags)
+				self.status_itemconfig(self.status_midi, text=flags)
+
+
+	def status_coords(self, item, coords):
+		key = (item, 'coords')
+		if self.status_rendered.get(key)!=coords:
+			self.status_canvas.coords(item, coords)
+			self.status_rendered[key] = coords
+			zynthian_gui_selector.status_tk_calls += 1
+		else:
+			zynthian_gui_selector.status_tk_skipped += 1
+
+
+	def status_itemconfig(self, item, **kwargs):
+		rendered = self.status_rendered.setdefault((item, 'config'), {})
+		changed = {}
+		for k, v in kwargs.items():
+			if rendered.get(k)!=v:
+				changed[k] = v
+		if changed:
+			self.status_canvas.itemconfig(item, **changed)
+			rendered.update(changed)
+			zynthian_gui_selector.status_tk_calls += 1
+		else:
+			zynthian_gui_selector.status_tk_skipped += 1
+
+
+	@classmethod
+	def count_status_tk_calls(cls):
+		ts = monotonic()
+		dt = ts - cls.status_tk_ts
+		if dt>=1:
+			if cls.status_tk_ts>0:
+				cls.status_tk_rate = (cls.status_tk_calls/dt, cls.status_tk_skipped/dt)
+				logging.debug("Status Tk calls/s: {:.1f} (skipped {:.1f})".format(*cls.status_tk_rate))
+			cls.status_tk_calls = 0
+			cls.status_tk_skipped = 0
+			cls.status_tk_ts = ts
+
+
+	# Return Tk calls/second sent & skipped by status area refreshing
+	@classmethod
+	def get_status_tk_rate(cls):
+		return cls.status_tk_rate
 
 
 	def refresh_loading(self):
@@ -456,8 +521,53 @@ class zynthian_gui_selector:
 		self.listbox.delete(0, tkinter.END)
 		if not self.list_data:
 			self.list_data=[]
-		for i, item in enumerate(self.list_data):
+		if self.is_listbox_windowed():
+			self.fill_listbox_window(self.index)
+		else:
+			self.listbox_offset = 0
+			self.listbox_size = len(self.list_data)
+			for i, item in enumerate(self.list_data):
+				self.listbox.insert(tkinter.END, item[2])
+
+
+	def is_listbox_windowed(self):
+		return self.listbox_windowed and zynthian_gui_config.listbox_window>0 and len(self.list_data)>zynthian_gui_config.listbox_window
+
+
+	# Only insert the rows around index. List data is read by slices,
+	# so list_data may be any sequence paging its items in lazily.
+	def fill_listbox_window(self, index):
+		n = len(self.list_data)
+		size = zynthian_gui_config.listbox_window
+		offset = min(max(0, index - size // 2), n - size)
+		self.listbox.delete(0, tkinter.END)
+		for item in self.list_data[offset:offset+size]:
 			self.listbox.insert(tkinter.END, item[2])
+		self.listbox_offset = offset
+		self.listbox_size = size
+		#logging.debug("LISTBOX WINDOW => {}-{} of {}".format(offset, offset+size, n))
+
+
+	# Re-window when index gets closer than a margin to the window's edges
+	def check_listbox_window(self, index):
+		if not self.is_listbox_windowed():
+			return
+		margin = zynthian_gui_config.listbox_window // 4
+		i = index - self.listbox_offset
+		if (i<margin and self.listbox_offset>0) or \
+			(i>=self.listbox_size-margin and self.listbox_offset+self.listbox_size<len(self.list_data)) or \
+			self.listbox_size!=self.listbox.size():
+			self.fill_listbox_window(index)
+
+
+	# Convert list index to listbox row
+	def get_listbox_row(self, index):
+		return index - self.listbox_offset
+
+
+	# Convert listbox row to list index
+	def get_listbox_index(self, row):
+		return row + self.listbox_offset
 
 
 	def set_selector(self):
@@ -479,15 +589,17 @@ class zynthian_gui_selector:
 
 	def update_list(self):
 		yv = self.listbox.yview()
+		offset = self.listbox_offset
 		self.fill_list()
 		self.set_selector()
-		self.listbox.yview_moveto(yv[0])
+		if self.listbox_offset==offset:
+			self.listbox.yview_moveto(yv[0])
 
 
 	def get_cursel(self):
 		cursel=self.listbox.curselection()
 		if (len(cursel)>0):
-			index=int(cursel[0])
+			index=self.get_listbox_index(int(cursel[0]))
 		else:
 			index=0
 		return index
@@ -510,13 +622,15 @@ class zynthian_gui_selector:
 				elif self.index>index:
 					self.select_listbox(index-1)
 			else:
+				self.check_listbox_window(index)
+				row = self.get_listbox_row(index)
 				# Set selection
 				self.listbox.selection_clear(0,tkinter.END)
-				self.listbox.selection_set(index)
+				self.listbox.selection_set(row)
 				# Set window
-				if index>self.index: self.listbox.see(index+1)
-				elif index<self.index: self.listbox.see(index-1)
-				else: self.listbox.see(index)
+				if index>self.index: self.listbox.see(row+1)
+				elif index<self.index: self.listbox.see(row-1)
+				else: self.listbox.see(row)
 				# Set index value
 				self.index=index
 
@@ -553,6 +667,16 @@ class zynthian_gui_selector:
 		pass
 
 
+	# Select the first item starting with query
+	def search(self, query):
+		query = query.lower()
+		for i, item in enumerate(self.list_data):
+			if item[0] is not None and str(item[2]).lower().lstrip('*').startswith(query):
+				self.select(i)
+				return True
+		return False
+
+
 	def set_select_path(self):
 		pass
 
@@ -669,6 +793,25 @@ class zynthian_gui_selector:
 		action = zynthian_gui_keybinding.getInstance().get_key_action(keysym, event.state)
 		if action != None:
 			self.zyngui.callable_ui_action(action)
+		else:
+			self.typeahead(event)
+
+
+	# Unbound keys are used for incremental search in the list
+	def typeahead(self, event):
+		ts = monotonic()
+		if ts-self.typeahead_ts>self.typeahead_timeout:
+			self.typeahead_query = ""
+		if event.keysym=="BackSpace":
+			self.typeahead_query = self.typeahead_query[:-1]
+		elif event.char and event.char.isprintable() and (event.state & 0x0C)==0:
+			self.typeahead_query += event.char
+		else:
+			return
+		self.typeahead_ts = ts
+		if self.typeahead_query.strip():
+			logging.debug("TYPE-AHEAD SEARCH => '{}'".format(self.typeahead_query))
+			self.search(self.typeahead_query)
 
 
 #------------------------------------------------------------------------------
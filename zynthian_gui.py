@@ -31,10 +31,12 @@ import signal
 #import psutil
 #import alsaseq
 import logging
+import select
 import threading
-from time import sleep
+from time import sleep, monotonic
 from os.path import isfile
 from datetime import datetime
+from collections import OrderedDict, deque
 from threading  import Thread, Lock
 from subprocess import check_output
 from ctypes import c_float
@@ -49,6 +51,8 @@ from zyncoder.zyncoder import lib_zyncoder, lib_zyncoder_init
 from zyngine import zynthian_zcmidi
 from zyngine import zynthian_midi_filter
 from zyngine import zynthian_engine_transport
+from zyngine.zynthian_controller import zynthian_controller
+from zyngine.zynthian_engine import zynthian_engine
 from zyngui import zynthian_gui_config
 from zyngui.zynthian_gui_controller import zynthian_gui_controller
 from zyngui.zynthian_gui_selector import zynthian_gui_selector
@@ -129,6 +133,16 @@ class zynthian_gui:
 		"73": "SWITCH_SNAPSHOT_LONG"
 	}
 
+	# Zyncoder/MIDI read loop timing (seconds)
+	zynread_idle_wait = 0.04
+	zynread_active_wait = 0.005
+	zynread_active_time = 0.5
+	zynmidi_poll_wait = 0.002
+
+	# Read latency histogram bucket limits (milliseconds)
+	zynread_latency_buckets = (1, 2, 5, 10, 20, 40, 80, float('inf'))
+	zynread_latency_log_period = 60
+
 	def __init__(self):
 		self.zynmidi = None
 		self.screens = {}
@@ -140,9 +154,20 @@ class zynthian_gui:
 		self.polling = False
 
 		self.loading = 0
+		self.loading_lock = Lock()
 		self.loading_thread = None
 		self.zyncoder_thread = None
 		self.zynread_wait_flag = False
+		self.zynread_active_ts = 0
+		self.zyncoder_moving = False
+		self.zynread_latency_hist = {}
+		self.zynread_latency_ts = 0
+		self.zynmidi_thread = None
+		self.zynmidi_active_ts = 0
+		self.zynmidi_queue = deque()
+		self.zynread_wake_r, self.zynread_wake_w = os.pipe()
+		os.set_blocking(self.zynread_wake_r, False)
+		os.set_blocking(self.zynread_wake_w, False)
 		self.zynswitch_defered_event = None
 		self.exit_flag = False
 		self.exit_code = 0
@@ -157,6 +182,8 @@ class zynthian_gui:
 		self.zynautoconnect_audio_flag = False
 		self.zynautoconnect_midi_flag = False
 
+		self.osc_server = None
+
 		# Create Lock object to avoid concurrence problems
 		self.lock = Lock();
 
@@ -257,6 +284,27 @@ class zynthian_gui:
 			pass
 
 
+	# Block until OSC or MIDI data arrives, or timeout expires
+	def zynread_wait(self, timeout):
+		try:
+			fds = [self.zynread_wake_r]
+			if self.osc_server:
+				fds.append(self.osc_server.fileno())
+			rfds = select.select(fds, [], [], timeout)[0]
+			if self.zynread_wake_r in rfds:
+				os.read(self.zynread_wake_r, 4096)
+		except:
+			sleep(timeout)
+
+
+	def zynread_wake(self):
+		try:
+			os.write(self.zynread_wake_w, b'\0')
+		except:
+			# Pipe full => already awake
+			pass
+
+
 	#@liblo.make_method("RELOAD_MIDI_CONFIG", None)
 	#@liblo.make_method(None, None)
 	def osc_cb_all(self, path, args, types, src):
@@ -268,6 +316,8 @@ class zynthian_gui:
 			self.callable_ui_action(parts[2].upper(), args)
 			#Run autoconnect if needed
 			self.zynautoconnect_do()
+		elif parts[0]=="" and parts[1].upper()=="SEARCH":
+			self.osc_search(args, src)
 		else:
 			logging.warning("Not supported OSC call '{}'".format(path))
 
@@ -275,6 +325,31 @@ class zynthian_gui:
 		#	logging.debug("argument of type '%s': %s" % (t, a))
 
 
+	def preset_search(self, query, engine=None, limit=20):
+		return zynthian_engine.get_preset_search().search(query, engine, limit)
+
+
+	# Preset search => /search <query> [engine] [limit]
+	# Replies with a /search/result <engine> <bank> <preset> message for each
+	# result, followed by /search/end <count>.
+	def osc_search(self, args, src):
+		try:
+			query = str(args[0])
+			engine = str(args[1]) if len(args)>1 and args[1] else None
+			limit = int(args[2]) if len(args)>2 else 20
+		except:
+			logging.warning("Bad OSC search arguments: {}".format(args))
+			return
+
+		res = self.preset_search(query, engine, limit)
+		try:
+			for r in res:
+				liblo.send(src, "/search/result", r.engine, r.bank, r.preset)
+			liblo.send(src, "/search/end", len(res))
+		except Exception as e:
+			logging.error("Can't send OSC search results to '{}': {}".format(src.url, e))
+
+
 	# ---------------------------------------------------------------------------
 	# GUI Core Management
 	# ---------------------------------------------------------------------------
@@ -345,6 +420,12 @@ class zynthian_gui:
 		self.start_loading_thread()
 		self.start_zyncoder_thread()
 
+		# Pre-start engines in background
+		self.screens['engine'].start_warm_pool()
+
+		# Import cached LV2 & Pianoteq presets into the search index
+		zynthian_engine.get_preset_search().import_caches_bg()
+
 		#Run autoconnect if needed
 		self.zynautoconnect_do()
 
@@ -354,6 +435,7 @@ class zynthian_gui:
 		self.stop_polling()
 		self.osc_end()
 		zynautoconnect.stop()
+		self.screens['engine'].stop_warm_pool()
 		self.screens['layer'].reset()
 		self.zyntransport.stop()
 
@@ -484,6 +566,7 @@ class zynthian_gui:
 		if layer is not None:
 			self.start_loading()
 			self.curlayer=layer
+			zynthian_controller.reset_ctrlfb()
 			self.screens['bank'].fill_list()
 			self.screens['preset'].fill_list()
 			self.screens['control'].fill_list()
@@ -598,6 +681,12 @@ class zynthian_gui:
 		elif cuia == "TOGGLE_MIDI_PLAY":
 			self.screens['midi_recorder'].toggle_playing()
 
+		elif cuia == "PRESET_SEARCH":
+			try:
+				self.screens['preset'].search(params[0])
+			except Exception as e:
+				logging.warning("Preset search failed: {}".format(e))
+
 		elif cuia == "SELECT":
 			try:
 				self.get_current_screen().select(params[0])
@@ -978,6 +1067,10 @@ class zynthian_gui:
 
 	def start_zyncoder_thread(self):
 		if lib_zyncoder:
+			self.zynmidi_thread=Thread(target=self.zynmidi_thread_task, args=())
+			self.zynmidi_thread.daemon = True # thread dies with the program
+			self.zynmidi_thread.start()
+
 			self.zyncoder_thread=Thread(target=self.zyncoder_thread_task, args=())
 			self.zyncoder_thread.daemon = True # thread dies with the program
 			self.zyncoder_thread.start()
@@ -985,13 +1078,105 @@ class zynthian_gui:
 
 	def zyncoder_thread_task(self):
 		while not self.exit_flag:
+			self.zyncoder_moving = False
 			self.zyncoder_read()
+			if not zynthian_gui_config.zynread_wake_on_data:
+				self.zynmidi_fetch()
 			self.zynmidi_read()
 			self.osc_receive()
-			sleep(0.04)
+
+			ts = monotonic()
+			if self.zyncoder_moving:
+				self.zynread_active_ts = ts
+
 			if self.zynread_wait_flag:
 				sleep(0.3)
 				self.zynread_wait_flag=False
+			elif not zynthian_gui_config.zynread_wake_on_data:
+				sleep(self.zynread_idle_wait)
+			# Spin fast only while encoders are moving ...
+			elif ts-self.zynread_active_ts<self.zynread_active_time:
+				self.zynread_wait(self.zynread_active_wait)
+			# ... else block until MIDI or OSC data arrives. Encoders are read on timeout.
+			else:
+				self.zynread_wait(self.zynread_idle_wait)
+
+
+	# lib_zyncoder offers no file descriptor for its MIDI queue, so in
+	# wake-on-data mode this thread polls it and wakes the zyncoder thread that
+	# processes the events. It polls fast only while encoders are moving or MIDI
+	# is flowing. In polling mode the zyncoder thread fetches the events itself.
+	def zynmidi_thread_task(self):
+		while not self.exit_flag:
+			if not zynthian_gui_config.zynread_wake_on_data:
+				sleep(self.zynread_idle_wait)
+				continue
+
+			ts = monotonic()
+			if self.zynmidi_fetch():
+				self.zynmidi_active_ts = ts
+				self.zynread_wake()
+			if ts-self.zynread_active_ts<self.zynread_active_time or ts-self.zynmidi_active_ts<self.zynread_active_time:
+				sleep(self.zynmidi_poll_wait)
+			else:
+				sleep(self.zynread_idle_wait)
+
+
+	# Move the MIDI events from lib_zyncoder to zynmidi_queue, stamped with
+	# their arrival time. Returns the number of events.
+	def zynmidi_fetch(self):
+		n = 0
+		try:
+			while True:
+				ev = lib_zyncoder.read_zynmidi()
+				if ev==0: break
+				self.zynmidi_queue.append((monotonic(), ev))
+				n += 1
+		except Exception as err:
+			logging.exception(err)
+		return n
+
+
+	# Time elapsed since the MIDI event arrived until it's processed
+	def add_zynread_latency(self, dt):
+		mode = self.get_zynread_mode()
+		try:
+			hist = self.zynread_latency_hist[mode]
+		except KeyError:
+			hist = self.zynread_latency_hist[mode] = [0]*len(self.zynread_latency_buckets)
+
+		dtms = 1000*dt
+		for i, limit in enumerate(self.zynread_latency_buckets):
+			if dtms<=limit:
+				hist[i] += 1
+				break
+
+		ts = monotonic()
+		if ts-self.zynread_latency_ts>self.zynread_latency_log_period:
+			self.zynread_latency_ts = ts
+			for mode, hist in self.get_zynread_latency_hist().items():
+				logging.info("ZYNREAD LATENCY ({}) => {}".format(mode, hist))
+
+
+	def get_zynread_mode(self):
+		if zynthian_gui_config.zynread_wake_on_data:
+			return "wake-on-data"
+		else:
+			return "polling"
+
+
+	# Latency histograms for every mode used, so they can be compared
+	def get_zynread_latency_hist(self):
+		res = OrderedDict()
+		for mode, hist in self.zynread_latency_hist.items():
+			res[mode] = OrderedDict()
+			for limit, count in zip(self.zynread_latency_buckets, hist):
+				res[mode]["<={}ms".format(limit)] = count
+		return res
+
+
+	def reset_zynread_latency_hist(self):
+		self.zynread_latency_hist = {}
 
 
 	def zyncoder_read(self):
@@ -1018,10 +1203,12 @@ class zynthian_gui:
 
 
 	def zynmidi_read(self):
+		n = 0
 		try:
-			while lib_zyncoder:
-				ev=lib_zyncoder.read_zynmidi()
-				if ev==0: break
+			while self.zynmidi_queue:
+				ts, ev = self.zynmidi_queue.popleft()
+				self.add_zynread_latency(monotonic()-ts)
+				n += 1
 
 				self.status_info['midi'] = True
 				evtype = (ev & 0xF00000) >> 20
@@ -1151,6 +1338,8 @@ class zynthian_gui:
 				self.reset_loading()
 				logging.exception(err)
 
+		return n
+
 
 	def start_loading_thread(self):
 		self.loading_thread=Thread(target=self.loading_refresh, args=())
@@ -1158,20 +1347,24 @@ class zynthian_gui:
 		self.loading_thread.start()
 
 
+	# Engines can be started from worker threads, so the counter is locked
 	def start_loading(self):
-		self.loading=self.loading+1
-		if self.loading<1: self.loading=1
+		with self.loading_lock:
+			self.loading=self.loading+1
+			if self.loading<1: self.loading=1
 		#logging.debug("START LOADING %d" % self.loading)
 
 
 	def stop_loading(self):
-		self.loading=self.loading-1
-		if self.loading<0: self.loading=0
+		with self.loading_lock:
+			self.loading=self.loading-1
+			if self.loading<0: self.loading=0
 		#logging.debug("STOP LOADING %d" % self.loading)
 
 
 	def reset_loading(self):
-		self.loading=0
+		with self.loading_lock:
+			self.loading=0
 
 
 	def loading_refresh(self):